@@ -1,41 +1,29 @@
-import pickle
 import streamlit as st
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 from PIL import Image
-import tensorflow
-from keras.models import load_model
-import base64
 import datetime
 import io
+import json
 import os
+import tempfile
+import weakref
 
-import tensorflow as tf
-from tensorflow.keras.preprocessing import image
 from streamlit_option_menu import option_menu
 
-# Try to import PDF and DOCX libraries
-try:
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.lib import colors
-    from reportlab.pdfgen import canvas
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
-    st.warning("PDF generation requires reportlab. Install with: pip install reportlab")
-
-try:
-    from docx import Document
-    from docx.shared import Inches
-    DOCX_AVAILABLE = True
-except ImportError:
-    DOCX_AVAILABLE = False
-    st.warning("DOCX generation requires python-docx. Install with: pip install python-docx")
+# TensorFlow, matplotlib, reportlab and python-docx are imported lazily by the
+# modules and pages that need them so the login page renders without them
+import bulk_reports
+import cnn_calibration
+import cnn_inference
+import dataset_store
+import metrics
+import model_registry
+import prediction_cache
+import report_jobs
+import reports
+import risk_scoring
+import storage
 
 # --- Initial Setup ---
 st.set_page_config(
@@ -719,363 +707,86 @@ st.markdown('<h1 class="main-title">🫁 Lung Cancer Detection System</h1>', uns
 st.markdown('<p style="text-align: center; color: #a0aec0; font-size: 1.2rem; margin-bottom: 2rem;">AI-Powered Medical Analysis & Healthcare Management</p>', unsafe_allow_html=True)
 
 # ----------------------------------------------------
-# --- DOWNLOAD LINK FUNCTIONS (FIXED VERSION) ---
+# --- DOCUMENT DOWNLOADS ---
 # ----------------------------------------------------
+# Downloads use st.download_button: the bytes are served from Streamlit's media
+# endpoint when clicked instead of being embedded in the page as data URIs.
 
-def create_text_download_link(text, filename, file_type="text/plain", button_text="📥 Download"):
-    """Generate a download link for text content"""
-    b64 = base64.b64encode(text.encode()).decode()
-    href = f'<a href="data:{file_type};base64,{b64}" download="{filename}" style="background-color: #4CAF50; color: white; padding: 10px 15px; text-align: center; text-decoration: none; display: inline-block; border-radius: 5px; font-weight: bold; margin: 5px;">{button_text}</a>'
-    return href
+def render_document_job(document, fmt, args, filename, label, key):
+    """Render one document format in the background and offer its download once it is ready.
 
-def create_binary_download_link(buffer, filename, file_type, button_text):
-    """Generate a download link for binary content (PDF, DOCX)"""
-    b64 = base64.b64encode(buffer.getvalue()).decode()
-    href = f'<a href="data:{file_type};base64,{b64}" download="{filename}" style="background-color: #2196F3; color: white; padding: 10px 15px; text-align: center; text-decoration: none; display: inline-block; border-radius: 5px; font-weight: bold; margin: 5px;">{button_text}</a>'
-    return href
+    Jobs are addressed by content, so the same report is rendered once and
+    every rerun (or session) asking for it again finds the running job or
+    the cached bytes.
+    """
+    jobs = get_report_jobs()
+    job_id = report_jobs.job_key(document, fmt, args)
+    status = jobs.status(job_id)
+
+    if status['state'] == 'done':
+        data = jobs.result(job_id)
+        if data is not None:
+            st.download_button(label=label, data=data, file_name=filename, mime=report_jobs.MIME_TYPES[fmt], key=f"{key}_download")
+            return
+        status = jobs.status(job_id)
+
+    if status['state'] in ('queued', 'running'):
+        st.caption(f"⏳ {label}: {status['state']}...")
+        st.button("🔄 Check Status", key=f"{key}_poll")
+        return
+
+    if status['state'] == 'failed':
+        st.error(status['error'])
+    if st.button(f"⚙️ Prepare {label}" if status['state'] != 'failed' else "🔁 Retry", key=f"{key}_prepare"):
+        jobs.submit(document, fmt, *args)
+        st.rerun()
+
+class SessionTempFile:
+    """A file on disk owned by one session's state (bulk scoring and report outputs).
+
+    It is deleted when replaced or cleared, and otherwise when Streamlit drops
+    the session's state and the object is garbage-collected (or at exit).
+    """
 
-# ----------------------------------------------------
-# --- PDF AND DOCX GENERATION FUNCTIONS ---
-# ----------------------------------------------------
+    def __init__(self, prefix, suffix):
+        fd, self.path = tempfile.mkstemp(prefix=prefix, suffix=suffix)
+        os.close(fd)
+        self._finalizer = weakref.finalize(self, _remove_file, self.path)
 
-def generate_appointment_pdf(patient_data, doctor_data, appointment_data):
-    """Generate PDF appointment confirmation"""
-    buffer = io.BytesIO()
-    
-    if not PDF_AVAILABLE:
-        st.error("PDF generation not available. Please install reportlab.")
-        return buffer
-    
-    try:
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Title
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            spaceAfter=30,
-            alignment=1,  # Center alignment
-            textColor=colors.HexColor('#2E7D32')
-        )
-        title = Paragraph("MEDICAL APPOINTMENT CONFIRMATION", title_style)
-        story.append(title)
-        story.append(Spacer(1, 20))
-        
-        # Appointment Details
-        story.append(Paragraph("APPOINTMENT DETAILS", styles['Heading2']))
-        appointment_info = [
-            ["Appointment ID:", appointment_data['appointment_id']],
-            ["Date:", appointment_data['date']],
-            ["Time:", appointment_data['time']],
-            ["Status:", appointment_data['status']]
-        ]
-        appointment_table = Table(appointment_info, colWidths=[2*inch, 3*inch])
-        appointment_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#E8F5E8')),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#2E7D32')),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.black),
-            ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
-        ]))
-        story.append(appointment_table)
-        story.append(Spacer(1, 20))
-        
-        # Patient Information
-        story.append(Paragraph("PATIENT INFORMATION", styles['Heading2']))
-        patient_info = [
-            ["Name:", f"{patient_data['first_name']} {patient_data['last_name']}"],
-            ["Phone:", patient_data['phone']],
-            ["Email:", patient_data.get('email', 'Not provided')],
-            ["Address:", patient_data['address']]
-        ]
-        patient_table = Table(patient_info, colWidths=[1.5*inch, 4*inch])
-        patient_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#E3F2FD')),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#1565C0')),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ]))
-        story.append(patient_table)
-        story.append(Spacer(1, 20))
-        
-        # Doctor Information
-        story.append(Paragraph("DOCTOR INFORMATION", styles['Heading2']))
-        doctor_info = [
-            ["Name:", doctor_data['name']],
-            ["Specialization:", doctor_data['specialization']],
-            ["Qualification:", doctor_data['qualification']],
-            ["Experience:", doctor_data['experience']],
-            ["Phone:", doctor_data['phone']],
-            ["Email:", doctor_data['email']],
-            ["Address:", doctor_data['address']],
-            ["Consultation Fees:", doctor_data['fees']]
-        ]
-        doctor_table = Table(doctor_info, colWidths=[1.5*inch, 4*inch])
-        doctor_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#FFF3E0')),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#EF6C00')),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ]))
-        story.append(doctor_table)
-        story.append(Spacer(1, 20))
-        
-        # Medical Details
-        story.append(Paragraph("MEDICAL CONSULTATION DETAILS", styles['Heading2']))
-        medical_info = [
-            ["Reason for Visit:", appointment_data['reason']],
-            ["Symptoms:", appointment_data['symptoms']],
-            ["Previous Diagnosis:", appointment_data.get('previous_diagnosis', 'Not specified')]
-        ]
-        medical_table = Table(medical_info, colWidths=[1.5*inch, 4*inch])
-        story.append(medical_table)
-        story.append(Spacer(1, 20))
-        
-        # Instructions
-        story.append(Paragraph("IMPORTANT INSTRUCTIONS", styles['Heading2']))
-        instructions = [
-            "1. Please arrive 15 minutes before your scheduled appointment time",
-            "2. Bring your ID and insurance card (if applicable)",
-            "3. Bring any previous medical reports or test results",
-            "4. List of current medications",
-            "5. Emergency contact information"
-        ]
-        for instruction in instructions:
-            story.append(Paragraph(instruction, styles['Normal']))
-            story.append(Spacer(1, 5))
-        
-        story.append(Spacer(1, 15))
-        story.append(Paragraph(f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
-        story.append(Paragraph("Lung Cancer Detection System - Medical Services", styles['Normal']))
-        
-        doc.build(story)
-        buffer.seek(0)
-        
-    except Exception as e:
-        st.error(f"Error generating PDF: {e}")
-    
-    return buffer
+    def remove(self):
+        self._finalizer()
 
-def generate_appointment_docx(patient_data, doctor_data, appointment_data):
-    """Generate DOCX appointment confirmation"""
-    buffer = io.BytesIO()
-    
-    if not DOCX_AVAILABLE:
-        st.error("DOCX generation not available. Please install python-docx.")
-        return buffer
-    
+def _remove_file(path):
     try:
-        doc = Document()
-        
-        # Title
-        title = doc.add_heading('MEDICAL APPOINTMENT CONFIRMATION', 0)
-        title.alignment = 1  # Center alignment
-        
-        # Appointment Details
-        doc.add_heading('APPOINTMENT DETAILS', level=1)
-        appointment_info = [
-            ['Appointment ID:', appointment_data['appointment_id']],
-            ['Date:', appointment_data['date']],
-            ['Time:', appointment_data['time']],
-            ['Status:', appointment_data['status']]
-        ]
-        table = doc.add_table(rows=4, cols=2)
-        for i, (key, value) in enumerate(appointment_info):
-            table.cell(i, 0).text = key
-            table.cell(i, 1).text = value
-        
-        # Patient Information
-        doc.add_heading('PATIENT INFORMATION', level=1)
-        patient_info = [
-            ['Name:', f"{patient_data['first_name']} {patient_data['last_name']}"],
-            ['Phone:', patient_data['phone']],
-            ['Email:', patient_data.get('email', 'Not provided')],
-            ['Address:', patient_data['address']]
-        ]
-        table = doc.add_table(rows=4, cols=2)
-        for i, (key, value) in enumerate(patient_info):
-            table.cell(i, 0).text = key
-            table.cell(i, 1).text = value
-        
-        # Doctor Information
-        doc.add_heading('DOCTOR INFORMATION', level=1)
-        doctor_info = [
-            ['Name:', doctor_data['name']],
-            ['Specialization:', doctor_data['specialization']],
-            ['Qualification:', doctor_data['qualification']],
-            ['Experience:', doctor_data['experience']],
-            ['Phone:', doctor_data['phone']],
-            ['Email:', doctor_data['email']],
-            ['Address:', doctor_data['address']],
-            ['Consultation Fees:', doctor_data['fees']]
-        ]
-        table = doc.add_table(rows=8, cols=2)
-        for i, (key, value) in enumerate(doctor_info):
-            table.cell(i, 0).text = key
-            table.cell(i, 1).text = value
-        
-        # Medical Details
-        doc.add_heading('MEDICAL CONSULTATION DETAILS', level=1)
-        medical_info = [
-            ['Reason for Visit:', appointment_data['reason']],
-            ['Symptoms:', appointment_data['symptoms']],
-            ['Previous Diagnosis:', appointment_data.get('previous_diagnosis', 'Not specified')]
-        ]
-        table = doc.add_table(rows=3, cols=2)
-        for i, (key, value) in enumerate(medical_info):
-            table.cell(i, 0).text = key
-            table.cell(i, 1).text = value
-        
-        # Instructions
-        doc.add_heading('IMPORTANT INSTRUCTIONS', level=1)
-        instructions = [
-            "Please arrive 15 minutes before your scheduled appointment time",
-            "Bring your ID and insurance card (if applicable)",
-            "Bring any previous medical reports or test results",
-            "List of current medications",
-            "Emergency contact information"
-        ]
-        for instruction in instructions:
-            doc.add_paragraph(instruction, style='ListBullet')
-        
-        doc.add_paragraph(f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        doc.add_paragraph("Lung Cancer Detection System - Medical Services")
-        
-        doc.save(buffer)
-        buffer.seek(0)
-        
-    except Exception as e:
-        st.error(f"Error generating DOCX: {e}")
-    
-    return buffer
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
-def generate_report_pdf(report_text, report_type):
-    """Generate PDF report"""
-    buffer = io.BytesIO()
-    
-    if not PDF_AVAILABLE:
-        st.error("PDF generation not available. Please install reportlab.")
-        return buffer
-    
-    try:
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Title based on report type
-        if report_type == "ML":
-            title_text = "LUNG CANCER RISK ASSESSMENT REPORT"
-            subtitle = "HEALTH PARAMETERS ANALYSIS"
-            color = colors.HexColor('#2E7D32')
-        else:  # CNN
-            title_text = "LUNG CANCER DETECTION REPORT"
-            subtitle = "CT-SCAN ANALYSIS"
-            color = colors.HexColor('#1565C0')
-        
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            spaceAfter=10,
-            alignment=1,
-            textColor=color
-        )
-        title = Paragraph(title_text, title_style)
-        story.append(title)
-        
-        subtitle_style = ParagraphStyle(
-            'CustomSubtitle',
-            parent=styles['Heading2'],
-            fontSize=12,
-            spaceAfter=30,
-            alignment=1,
-            textColor=colors.gray
-        )
-        subtitle_para = Paragraph(subtitle, subtitle_style)
-        story.append(subtitle_para)
-        story.append(Spacer(1, 20))
-        
-        # Add report content
-        for line in report_text.split('\n'):
-            if line.strip() and '=' in line and not line.startswith(' '):
-                # Section headers
-                story.append(Paragraph(line.strip(), styles['Heading2']))
-                story.append(Spacer(1, 10))
-            elif line.strip() and any(line.strip().startswith(x) for x in ['*', '-']):
-                # List items
-                p = Paragraph(f"• {line.strip('*- ')}", styles['Normal'])
-                story.append(p)
-                story.append(Spacer(1, 5))
-            elif line.strip():
-                # Regular text
-                story.append(Paragraph(line.strip(), styles['Normal']))
-                story.append(Spacer(1, 8))
-        
-        story.append(Spacer(1, 20))
-        story.append(Paragraph(f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
-        story.append(Paragraph("Lung Cancer Detection System - AI Medical Analysis", styles['Normal']))
-        
-        doc.build(story)
-        buffer.seek(0)
-        
-    except Exception as e:
-        st.error(f"Error generating PDF report: {e}")
-    
-    return buffer
+def render_file_download(path, label, file_name, mime, key):
+    """Offer a large file on disk for download without reading it on every rerun.
 
-def generate_report_docx(report_text, report_type):
-    """Generate DOCX report"""
-    buffer = io.BytesIO()
-    
-    if not DOCX_AVAILABLE:
-        st.error("DOCX generation not available. Please install python-docx.")
-        return buffer
-    
-    try:
-        doc = Document()
-        
-        # Title based on report type
-        if report_type == "ML":
-            title_text = "LUNG CANCER RISK ASSESSMENT REPORT"
-            subtitle = "HEALTH PARAMETERS ANALYSIS"
-        else:  # CNN
-            title_text = "LUNG CANCER DETECTION REPORT"
-            subtitle = "CT-SCAN ANALYSIS"
-        
-        title = doc.add_heading(title_text, 0)
-        title.alignment = 1
-        doc.add_heading(subtitle, level=1).alignment = 1
-        
-        # Add report content
-        for line in report_text.split('\n'):
-            if line.strip() and '=' in line and not line.startswith(' '):
-                # Section headers
-                doc.add_heading(line.strip(), level=1)
-            elif line.strip() and any(line.strip().startswith(x) for x in ['*', '-']):
-                # List items
-                doc.add_paragraph(line.strip(), style='ListBullet')
-            elif line.strip():
-                # Regular text
-                doc.add_paragraph(line.strip())
-        
-        doc.add_paragraph(f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        doc.add_paragraph("Lung Cancer Detection System - AI Medical Analysis")
-        
-        doc.save(buffer)
-        buffer.seek(0)
-        
-    except Exception as e:
-        st.error(f"Error generating DOCX report: {e}")
-    
-    return buffer
+    The file is only read into the download button after the user asks for
+    it, and the button goes away again once it has been clicked.
+    """
+    ready_key = f"{key}_ready"
+    if not st.session_state.get(ready_key):
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        if st.button(f"⚙️ Prepare {label} ({size_mb:,.1f} MB)", key=f"{key}_prepare"):
+            st.session_state[ready_key] = True
+            st.rerun()
+        return
+    with open(path, 'rb') as f:
+        if st.download_button(label=label, data=f, file_name=file_name, mime=mime, key=key):
+            st.session_state.pop(ready_key, None)
+
+def clear_bulk_results():
+    """Delete this session's bulk scoring output and the patient reports built from it"""
+    for state_key in ('bulk_scoring', 'bulk_reports'):
+        previous = st.session_state.pop(state_key, None)
+        if previous:
+            previous['file'].remove()
+    for download_key in ('bulk_download_btn', 'bulk_reports_download_btn'):
+        st.session_state.pop(f"{download_key}_ready", None)
 
 # ----------------------------------------------------
 # --- DOCTOR DATABASE AND APPOINTMENT FUNCTIONS ---
@@ -1156,6 +867,12 @@ DOCTORS_DATABASE = {
     ]
 }
 
+# Consultation times offered on every working day
+APPOINTMENT_TIMES = ["09:00 AM", "10:00 AM", "11:00 AM", "02:00 PM", "03:00 PM", "04:00 PM"]
+
+# How far ahead patients can book
+BOOKING_HORIZON_DAYS = 60
+
 def generate_appointment_confirmation(patient_data, doctor_data, appointment_data):
     """Generate appointment confirmation text"""
     
@@ -1215,261 +932,149 @@ Generated on: {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
     return confirmation
 
 # ----------------------------------------------------
-# --- REPORT GENERATION FUNCTIONS (No FPDF required) ---
+# --- ADMIN FUNCTIONS ---
 # ----------------------------------------------------
 
-def generate_cnn_report_text(user_data, file_details, prediction_data, risk_level, recommendations):
-    """Generate a comprehensive text report for CNN predictions"""
-    
-    report = f"""
-LUNG CANCER DETECTION REPORT - CT-SCAN ANALYSIS
-================================================
+ADMIN_PAGE_SIZES = [25, 50, 100]
 
-Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-PATIENT INFORMATION
--------------------
-Name: {user_data.get('first_name', 'N/A')} {user_data.get('last_name', 'N/A')}
-Username: {st.session_state['username']}
-
-CT-SCAN INFORMATION
--------------------
-File Name: {file_details['FileName']}
-File Type: {file_details['FileType']}
-File Size: {file_details['FileSize']}
-
-AI PREDICTION RESULTS
----------------------
-Risk Level: {risk_level}
-Final Prediction: {prediction_data['final_prediction']}
-Cancer Confidence: {prediction_data['cancer_confidence']:.2%}
-Normal Confidence: {prediction_data['normal_confidence']:.2%}
-
-CONFIDENCE ANALYSIS
--------------------
-"""
-    
-    if prediction_data['cancer_confidence'] >= 0.75:
-        report += "High confidence in detection - Strong indicators present\n"
-    elif prediction_data['cancer_confidence'] >= 0.25:
-        report += "Moderate confidence - Requires follow-up evaluation\n"
-    else:
-        report += "Low confidence - Likely normal case\n"
-
-    report += f"""
-MEDICAL RECOMMENDATIONS
------------------------
-"""
-    for i, rec in enumerate(recommendations, 1):
-        report += f"{i}. {rec}\n"
-
-    report += f"""
-TECHNICAL DETAILS
------------------
-AI Model: Convolutional Neural Network (CNN)
-Model Input: CT-Scan Images (150x150 pixels)
-Classification: Binary (Cancer/Normal)
-Confidence Threshold: 50%
-
-IMPORTANT MEDICAL DISCLAIMER
------------------------------
-This report is generated by an AI system for assistive purposes only.
-It should NOT be used as a substitute for professional medical diagnosis.
-Always consult with qualified healthcare providers for medical decisions.
-False positives and false negatives are possible with AI systems.
-
-Report generated by Lung Cancer Detection System
-{datetime.datetime.now().strftime("%B %d, %Y")}
-"""
-    return report
-
-def generate_ml_report_text(user_data, input_data, prediction_result, risk_level):
-    """Generate a comprehensive text report for ML predictions"""
-    
-    report = f"""
-LUNG CANCER RISK ASSESSMENT REPORT - HEALTH PARAMETERS ANALYSIS
-===============================================================
-
-Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-PATIENT INFORMATION
--------------------
-Name: {user_data.get('first_name', 'N/A')} {user_data.get('last_name', 'N/A')}
-Username: {st.session_state['username']}
-
-HEALTH PARAMETERS ANALYZED
---------------------------
-"""
-    
-    parameters = [
-        f"Age: {input_data.get('Age', 'N/A')}",
-        f"Gender: {input_data.get('Gender', 'N/A')}",
-        f"Air Pollution Exposure: {input_data.get('AirPollution', 'N/A')}",
-        f"Alcohol Use: {input_data.get('Alcoholuse', 'N/A')}",
-        f"Balanced Diet: {input_data.get('BalancedDiet', 'N/A')}",
-        f"Obesity: {input_data.get('Obesity', 'N/A')}",
-        f"Smoking: {input_data.get('Smoking', 'N/A')}",
-        f"Passive Smoker: {input_data.get('PassiveSmoker', 'N/A')}",
-        f"Fatigue: {input_data.get('Fatigue', 'N/A')}",
-        f"Weight Loss: {input_data.get('WeightLoss', 'N/A')}",
-        f"Shortness of Breath: {input_data.get('ShortnessofBreath', 'N/A')}",
-        f"Wheezing: {input_data.get('Wheezing', 'N/A')}",
-        f"Swallowing Difficulty: {input_data.get('SwallowingDifficulty', 'N/A')}",
-        f"Clubbing of Finger Nails: {input_data.get('ClubbingofFingerNails', 'N/A')}",
-        f"Frequent Cold: {input_data.get('FrequentCold', 'N/A')}",
-        f"Dry Cough: {input_data.get('DryCough', 'N/A')}",
-        f"Snoring: {input_data.get('Snoring', 'N/A')}"
-    ]
-    
-    for param in parameters:
-        report += f"- {param}\n"
-
-    report += f"""
-RISK ASSESSMENT RESULTS
------------------------
-Risk Level: {risk_level}
-Prediction: {prediction_result}
-
-RISK INTERPRETATION
--------------------
-"""
-    
-    if risk_level == "High":
-        report += "HIGH RISK: Immediate medical consultation recommended\n"
-    elif risk_level == "Medium":
-        report += "MODERATE RISK: Follow-up with healthcare provider advised\n"
-    else:
-        report += "LOW RISK: Continue regular health monitoring\n"
-
-    report += f"""
-RECOMMENDED ACTIONS
--------------------
-"""
-    
-    if risk_level == "High":
-        recommendations = [
-            "Consult a pulmonologist or oncologist immediately",
-            "Schedule diagnostic tests (CT scan, biopsy)",
-            "Discuss family history and genetic factors",
-            "Implement lifestyle changes immediately"
-        ]
-    elif risk_level == "Medium":
-        recommendations = [
-            "Schedule appointment with primary care physician",
-            "Consider preventive screening in 3-6 months",
-            "Monitor symptoms and maintain health journal",
-            "Review and reduce risk factors"
-        ]
-    else:
-        recommendations = [
-            "Continue regular health check-ups",
-            "Maintain healthy lifestyle habits",
-            "Be aware of early warning signs",
-            "Annual health screening recommended"
-        ]
-    
-    for i, rec in enumerate(recommendations, 1):
-        report += f"{i}. {rec}\n"
-
-    report += f"""
-MODEL INFORMATION
------------------
-AI Model: Ensemble Machine Learning Model
-Algorithm: Multiple Classifiers (SVM, Decision Tree, KNN)
-Features: 17 health parameters
-Accuracy: >95% on validation data
-
-IMPORTANT DISCLAIMER
---------------------
-This assessment is based on machine learning analysis of provided parameters.
-It is intended for educational and screening purposes only.
-NOT a substitute for professional medical diagnosis.
-Always consult healthcare providers for medical decisions.
-
-Report generated by Lung Cancer Detection System
-{datetime.datetime.now().strftime("%B %d, %Y")}
-"""
-    return report
-
-# ----------------------------------------------------
-# --- ADMIN FUNCTIONS ---
-# ----------------------------------------------------
+def render_pager(key, total, page_size):
+    """Page selector for a server-side paginated table; returns the row offset"""
+    page_count = max(1, -(-total // page_size))
+    # Filters or page size may have shrunk the result since the last rerun
+    if st.session_state.get(key, 1) > page_count:
+        st.session_state[key] = page_count
+    page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, step=1, key=key)
+    offset = (page - 1) * page_size
+    if total:
+        st.caption(f"Showing {offset + 1}–{min(offset + page_size, total)} of {total}")
+    return offset
 
 def admin_dashboard():
     """Admin dashboard for managing users and appointments"""
     st.markdown('<div class="admin-section">', unsafe_allow_html=True)
     st.header("👨‍💼 Admin Dashboard")
     
+    # Every counter and chart on this page comes from the incrementally maintained metrics
+    metrics_snapshot = store.metrics_snapshot()
+    counters = metrics_snapshot['counters']
+    total_users = counters['users_total']
+    
     # Statistics
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        total_users = len(st.session_state['users'])
         st.markdown(f'<div class="stats-card"><h3>👥 Total Users</h3><h2>{total_users}</h2></div>', unsafe_allow_html=True)
     
     with col2:
-        total_appointments = len(st.session_state['appointments'])
+        total_appointments = counters['appointments_total']
         st.markdown(f'<div class="stats-card"><h3>📅 Total Appointments</h3><h2>{total_appointments}</h2></div>', unsafe_allow_html=True)
     
     with col3:
-        confirmed_appointments = len([a for a in st.session_state['appointments'] if a['status'] == 'Confirmed'])
+        confirmed_appointments = counters['appointments_by_status'].get('Confirmed', 0)
         st.markdown(f'<div class="stats-card"><h3>✅ Confirmed</h3><h2>{confirmed_appointments}</h2></div>', unsafe_allow_html=True)
     
     with col4:
-        cancelled_appointments = len([a for a in st.session_state['appointments'] if a['status'] == 'Cancelled'])
+        cancelled_appointments = counters['appointments_by_status'].get('Cancelled', 0)
         st.markdown(f'<div class="stats-card"><h3>❌ Cancelled</h3><h2>{cancelled_appointments}</h2></div>', unsafe_allow_html=True)
     
     # Tabs for different admin functions
-    tab1, tab2, tab3 = st.tabs(["👥 User Management", "📊 Appointments", "📈 Analytics"])
+    tab1, tab2, tab3, tab4 = st.tabs(["👥 User Management", "📊 Appointments", "📈 Analytics", "🧠 Models"])
     
     with tab1:
         st.subheader("User Management")
         
-        # Display all users
+        # Display one page of users at a time
         st.write("### Registered Users")
-        users_data = []
-        for username, user_info in st.session_state['users'].items():
-            profile = user_info.get('profile', {})
-            users_data.append({
-                'Username': username,
-                'First Name': profile.get('first_name', 'N/A'),
-                'Last Name': profile.get('last_name', 'N/A'),
-                'Email': profile.get('email', 'N/A'),
-                'Phone': profile.get('phone', 'N/A')
-            })
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            user_search = st.text_input("Search users", placeholder="Username, name or email", key="admin_user_search").strip()
+        with col2:
+            user_page_size = st.selectbox("Rows per page", ADMIN_PAGE_SIZES, key="admin_user_page_size")
+        
+        matching_users = store.count_users(user_search) if user_search else total_users
+        user_offset = render_pager("admin_user_page", matching_users, user_page_size)
+        users_data = [
+            {
+                'Username': user_info['username'],
+                'First Name': user_info['profile'].get('first_name', 'N/A'),
+                'Last Name': user_info['profile'].get('last_name', 'N/A'),
+                'Email': user_info['profile'].get('email', 'N/A'),
+                'Phone': user_info['profile'].get('phone', 'N/A')
+            }
+            for user_info in store.users_page(user_page_size, user_offset, user_search or None)
+        ]
         
         if users_data:
-            users_df = pd.DataFrame(users_data)
-            st.dataframe(users_df, width=700)
+            st.dataframe(pd.DataFrame(users_data), width=700)
             
-            # Export users data
+            # Export users data (the full list is only read when asked for)
             if st.button("📊 Export Users Data"):
-                csv = users_df.to_csv(index=False)
+                users_df = pd.DataFrame([
+                    {
+                        'Username': user_info['username'],
+                        'First Name': user_info['profile'].get('first_name', 'N/A'),
+                        'Last Name': user_info['profile'].get('last_name', 'N/A'),
+                        'Email': user_info['profile'].get('email', 'N/A'),
+                        'Phone': user_info['profile'].get('phone', 'N/A')
+                    }
+                    for user_info in store.list_users()
+                ])
                 st.download_button(
                     label="📥 Download CSV",
-                    data=csv,
+                    data=users_df.to_csv(index=False),
                     file_name=f"users_data_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                     mime="text/csv"
                 )
+        elif user_search:
+            st.info("No users match your search.")
         else:
             st.info("No users registered yet.")
     
     with tab2:
         st.subheader("Appointment Management")
         
-        if st.session_state['appointments']:
-            # Display all appointments
-            appointments_df = pd.DataFrame(st.session_state['appointments'])
-            st.dataframe(appointments_df, width=700)
+        if total_appointments:
+            # Filters and sorting are applied by the database, one page at a time
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                status_filter = st.selectbox("Status", ["All"] + list(storage.APPOINTMENT_STATUSES), key="admin_appt_status")
+            with col2:
+                specialization_filter = st.selectbox("Specialization", ["All"] + sorted(counters['appointments_by_specialization']), key="admin_appt_spec")
+            with col3:
+                appointment_search = st.text_input("Search", placeholder="Patient, ID, user or doctor", key="admin_appt_search").strip()
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                sort_by = st.selectbox("Sort by", list(storage.APPOINTMENT_SORTS), key="admin_appt_sort")
+            with col2:
+                sort_descending = st.checkbox("Descending", value=True, key="admin_appt_desc")
+            with col3:
+                appointment_page_size = st.selectbox("Rows per page", ADMIN_PAGE_SIZES, key="admin_appt_page_size")
+            
+            filters = {
+                'status': None if status_filter == "All" else status_filter,
+                'specialization': None if specialization_filter == "All" else specialization_filter,
+                'search': appointment_search or None
+            }
+            matching_appointments = store.count_appointments(**filters) if any(filters.values()) else total_appointments
+            appointment_offset = render_pager("admin_appt_page", matching_appointments, appointment_page_size)
+            page_appointments = store.search_appointments(**filters, sort=sort_by, descending=sort_descending,
+                                                          limit=appointment_page_size, offset=appointment_offset)
+            
+            if page_appointments:
+                st.dataframe(pd.DataFrame(page_appointments), width=700)
+            else:
+                st.info("No appointments match these filters.")
             
             # Appointment actions
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("📊 Export Appointments Data"):
-                    csv = appointments_df.to_csv(index=False)
+                    # Exports every appointment matching the current filters
+                    export_df = pd.DataFrame(store.search_appointments(**filters, sort=sort_by, descending=sort_descending))
                     st.download_button(
                         label="📥 Download CSV",
-                        data=csv,
+                        data=export_df.to_csv(index=False),
                         file_name=f"appointments_data_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                         mime="text/csv"
                     )
@@ -1478,25 +1083,27 @@ def admin_dashboard():
                 if st.button("🔄 Refresh Data"):
                     st.rerun()
             
-            # Appointment status management
+            # Appointment status management (for appointments on the current page)
             st.subheader("Manage Appointment Status")
-            appointment_ids = [f"{app['appointment_id']} - {app['patient_name']}" for app in st.session_state['appointments']]
+            appointment_ids = [f"{app['appointment_id']} - {app['patient_name']}" for app in page_appointments]
             selected_appointment = st.selectbox("Select Appointment", appointment_ids)
             
             if selected_appointment:
                 appointment_id = selected_appointment.split(" - ")[0]
-                current_appointment = next((app for app in st.session_state['appointments'] if app['appointment_id'] == appointment_id), None)
+                current_appointment = next((app for app in page_appointments if app['appointment_id'] == appointment_id), None)
                 
                 if current_appointment:
                     col1, col2, col3 = st.columns(3)
                     with col1:
                         if st.button("✅ Confirm", key="confirm_btn"):
-                            current_appointment['status'] = 'Confirmed'
-                            st.success(f"Appointment {appointment_id} confirmed!")
-                            st.rerun()
+                            if store.update_appointment_status(appointment_id, 'Confirmed'):
+                                st.success(f"Appointment {appointment_id} confirmed!")
+                                st.rerun()
+                            else:
+                                st.error(f"Cannot confirm {appointment_id}: the slot is already booked by another appointment.")
                     with col2:
                         if st.button("❌ Cancel", key="cancel_btn"):
-                            current_appointment['status'] = 'Cancelled'
+                            store.update_appointment_status(appointment_id, 'Cancelled')
                             st.success(f"Appointment {appointment_id} cancelled!")
                             st.rerun()
                     with col3:
@@ -1509,12 +1116,16 @@ def admin_dashboard():
         st.subheader("Analytics & Reports")
         
         # Appointment analytics
-        if st.session_state['appointments']:
-            # Status distribution
-            status_counts = pd.DataFrame(st.session_state['appointments'])['status'].value_counts()
+        if total_appointments:
+            # Distributions come from the running counters, not from the appointment rows
+            status_counts = pd.Series(counters['appointments_by_status']).sort_values(ascending=False)
+            specialization_counts = pd.Series(counters['appointments_by_specialization']).sort_values(ascending=False)
             
             col1, col2 = st.columns(2)
             
+            # matplotlib is only needed for these charts
+            import matplotlib.pyplot as plt
+            
             with col1:
                 st.write("### Appointment Status Distribution")
                 fig, ax = plt.subplots()
@@ -1524,13 +1135,39 @@ def admin_dashboard():
             
             with col2:
                 st.write("### Specialization Distribution")
-                specialization_counts = pd.DataFrame(st.session_state['appointments'])['specialization'].value_counts()
                 fig, ax = plt.subplots()
                 specialization_counts.plot(kind='bar', ax=ax, color='#2196F3')
                 ax.set_ylabel('Number of Appointments')
                 plt.xticks(rotation=45)
                 st.pyplot(fig)
             
+            # Rolling activity windows from the hourly event buckets
+            st.write("### Recent Activity")
+            activity = pd.DataFrame(metrics_snapshot['windows']).T
+            activity.index = [event.title() for event in activity.index]
+            st.dataframe(activity, use_container_width=True)
+            
+            hourly = pd.DataFrame(metrics_snapshot['hourly']).fillna(0).astype(int).sort_index()
+            if not hourly.empty:
+                st.caption("Events per hour, last 24 hours")
+                st.bar_chart(hourly[['bookings', 'cancellations', 'completions']])
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button(
+                    label="📥 Metrics (JSON)",
+                    data=json.dumps(metrics_snapshot, indent=2),
+                    file_name=f"metrics_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                    mime="application/json"
+                )
+            with col2:
+                st.download_button(
+                    label="📥 Metrics (Prometheus)",
+                    data=metrics.to_prometheus(metrics_snapshot),
+                    file_name="metrics.prom",
+                    mime="text/plain"
+                )
+            
             # Generate analytics report
             if st.button("📈 Generate Analytics Report"):
                 report_text = f"""
@@ -1541,8 +1178,8 @@ Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
 SYSTEM STATISTICS
 -----------------
-Total Users: {len(st.session_state['users'])}
-Total Appointments: {len(st.session_state['appointments'])}
+Total Users: {total_users}
+Total Appointments: {total_appointments}
 
 APPOINTMENT BREAKDOWN
 ---------------------
@@ -1561,9 +1198,9 @@ SPECIALIZATION BREAKDOWN
 USER REGISTRATION OVERVIEW
 --------------------------
 """
-                for username, user_info in st.session_state['users'].items():
+                for user_info in store.list_users():
                     profile = user_info.get('profile', {})
-                    report_text += f"Username: {username}, Name: {profile.get('first_name', 'N/A')} {profile.get('last_name', 'N/A')}, Email: {profile.get('email', 'N/A')}\n"
+                    report_text += f"Username: {user_info['username']}, Name: {profile.get('first_name', 'N/A')} {profile.get('last_name', 'N/A')}, Email: {profile.get('email', 'N/A')}\n"
                 
                 st.text_area("Analytics Report", report_text, height=300)
                 st.download_button(
@@ -1575,19 +1212,76 @@ USER REGISTRATION OVERVIEW
         else:
             st.info("No data available for analytics yet.")
     
+    with tab4:
+        st.subheader("Model Registry")
+        
+        health = models.health()
+        if health['status'] == 'ok':
+            st.success("All models are loaded and warmed up.")
+        else:
+            st.warning("Some models are still loading or failed to load.")
+        
+        models_df = pd.DataFrame([
+            {
+                'Model': name,
+                'Status': info['status'],
+                'Version': info.get('version', 'N/A'),
+                'Path': info['path'],
+                'Loaded At': info.get('loaded_at', 'N/A'),
+                'Load (s)': info.get('load_seconds'),
+                'Warm-up (s)': info.get('warmup_seconds'),
+                'Trained': (info.get('manifest') or {}).get('estimator', ''),
+                'Accuracy': (info.get('manifest') or {}).get('metrics', {}).get('accuracy'),
+                'Error': info.get('error') or ''
+            }
+            for name, info in health['models'].items()
+        ])
+        st.dataframe(models_df, width=700)
+        
+        reload_name = st.selectbox("Model", models.names(), key="reload_model_name")
+        if st.button("🔄 Reload Model", key="reload_model_btn"):
+            with st.spinner(f"Reloading {reload_name}..."):
+                if models.reload(reload_name):
+                    st.success(f"Model '{reload_name}' reloaded (version {models.version(reload_name)}).")
+                else:
+                    st.error(f"Reload failed: {models.metadata(reload_name).get('error')}")
+        
+        st.subheader("Prediction Caches")
+        cache_stats = {
+            "Risk model memo": get_risk_predictor().stats(),
+            "CT-scan cache": get_prediction_cache().stats()
+        }
+        for cache_name, stats in cache_stats.items():
+            lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+            hit_rate = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+            st.write(f"**{cache_name}**")
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Hits", f"{stats['hits'] + stats['disk_hits']:,}")
+            col2.metric("Misses", f"{stats['misses']:,}")
+            col3.metric("Hit Rate", f"{hit_rate:.1%}")
+            col4.metric("Entries", f"{stats['entries']:,}")
+    
     st.markdown('</div>', unsafe_allow_html=True)
 
 # ----------------------------------------------------
 # --- PERSISTENT CREDENTIALS and SESSION STATE ---
 # ----------------------------------------------------
 
-# Initialize the main user dictionary in session state if it doesn't exist
-if 'users' not in st.session_state:
-    st.session_state['users'] = {
-        "admin": {"password": "admin", "profile": {"first_name": "Admin", "last_name": "User", "phone": "", "address": "", "email": "admin@lungcancer.com"}},
-        "testuser": {"password": "secure", "profile": {"first_name": "Test", "last_name": "User", "phone": "", "address": "", "email": ""}}
-    }
-    
+# Users, appointments and predictions live in a SQLite database shared by all sessions
+@st.cache_resource
+def get_store():
+    """Open the persistent store once per server process and seed default data"""
+    db = storage.Store(storage.DB_PATH)
+    all_doctors = [doc for doctors in DOCTORS_DATABASE.values() for doc in doctors]
+    db.seed_doctors(all_doctors)
+    db.configure_availability(all_doctors, APPOINTMENT_TIMES, BOOKING_HORIZON_DAYS)
+    db.create_user("admin", "admin", {"first_name": "Admin", "last_name": "User", "phone": "", "address": "", "email": "admin@lungcancer.com"})
+    db.create_user("testuser", "secure", {"first_name": "Test", "last_name": "User", "phone": "", "address": "", "email": ""})
+    return db
+
+store = get_store()
+
+
 if 'logged_in' not in st.session_state:
     st.session_state['logged_in'] = False
 if 'username' not in st.session_state:
@@ -1595,21 +1289,44 @@ if 'username' not in st.session_state:
 if 'auth_view' not in st.session_state:
     st.session_state['auth_view'] = 'Login'
 
-# Initialize appointments in session state
-if 'appointments' not in st.session_state:
-    st.session_state['appointments'] = []
-
 # --- Configuration and Initial Loading ---
 
-# Define the correct path to your CNN model file
-fp = 'cnn model/lungcancer_model_cnn.h5'
+@st.cache_resource
+def get_model_registry():
+    """Load and warm every model once per server process, in the background"""
+    registry = model_registry.ModelRegistry()
+    registry.load_all(background=True)
+    # Pick up replaced model files without restarting the server
+    registry.watch()
+    return registry
+
+@st.cache_resource
+def get_report_jobs():
+    """Process pool that renders PDF/DOCX documents off the session threads"""
+    return report_jobs.ReportJobQueue()
+
+@st.cache_resource
+def get_prediction_cache():
+    """Process-wide cache of CNN outputs keyed by upload hash and model version"""
+    return prediction_cache.PredictionCache()
+
+@st.cache_resource
+def get_risk_predictor():
+    """Memoized risk model, pre-filled with the whole test set every time the model loads"""
+    registry = get_model_registry()
+    memo = prediction_cache.PredictionCache(risk_scoring.MEMO_MAX_ENTRIES, float('inf'), disk_dir=None)
+    predictor = risk_scoring.MemoizedRiskModel(registry, memo)
+
+    def precompute_test_set(name, metadata):
+        if name == 'risk':
+            predictor.precompute(dataset_store.load('testx'))
+
+    registry.subscribe(precompute_test_set)
+    if registry.version('risk') is not None:
+        # Already loaded before we subscribed
+        precompute_test_set('risk', registry.metadata('risk'))
+    return predictor
 
-#Loading models (ML model)
-try:
-    cancer_model = pickle.load(open('models/final_model.sav', 'rb'))
-except FileNotFoundError:
-    st.error("ML Model file 'models/final_model.sav' not found. Please check the path.")
-    cancer_model = None
 
 # ----------------------------------------------------
 # --- FIXED AUTHENTICATION FUNCTIONS (MODIFIED) ---
@@ -1684,9 +1401,9 @@ def login_page():
         st.markdown('<div style="margin-top: 15px;"></div>', unsafe_allow_html=True)
 
         if login_button:
-            current_users = st.session_state['users']
+            current_user = store.get_user(username)
             
-            if username in current_users and current_users[username]['password'] == password:
+            if current_user is not None and current_user['password'] == password:
                 st.session_state['logged_in'] = True
                 st.session_state['username'] = username
                 st.success(f"🎉 Welcome back, {username}! Redirecting...")
@@ -1757,8 +1474,6 @@ def register_page():
         register_button = st.form_submit_button("🚀 Create Account", use_container_width=True)
 
         if register_button:
-            current_users = st.session_state['users']
-            
             required_fields = {
                 "Username": new_username, "Password": new_password,  
                 "First Name": first_name, "Last Name": last_name,
@@ -1774,22 +1489,19 @@ def register_page():
                 st.error("❌ Passwords do not match. Please try again.")
 
             # 3. Check for existing username
-            elif new_username in current_users:
+            elif store.get_user(new_username) is not None:
                 st.error("❌ Username already exists. Please choose a different one.")
             
             # 4. Successful Registration -> Redirect to Login Page
             else:
-                # Store full profile data in the persistent session state dictionary
-                current_users[new_username] = {
-                    "password": new_password,
-                    "profile": {
-                        "first_name": first_name,
-                        "last_name": last_name,
-                        "phone": phone_number,
-                        "address": address,
-                        "email": email
-                    }
-                }
+                # Store full profile data in the persistent user store
+                store.create_user(new_username, new_password, {
+                    "first_name": first_name,
+                    "last_name": last_name,
+                    "phone": phone_number,
+                    "address": address,
+                    "email": email
+                })
                 
                 # Change the view to Login and Rerun.
                 st.session_state['auth_view'] = 'Login' 
@@ -1882,7 +1594,7 @@ else:
     # --- Sidebar (Only Logout Button & User Info) ---
     with st.sidebar:
         st.title("🫁 Lung Cancer Prediction")
-        user_data = st.session_state['users'].get(st.session_state['username'], {})
+        user_data = store.get_user(st.session_state['username']) or {}
         first_name = user_data.get('profile', {}).get('first_name', st.session_state['username'])
         
         st.write(f"Logged in as: **{first_name}**")
@@ -1897,6 +1609,15 @@ else:
             st.session_state['current_page'] = ''
             st.rerun()
 
+# Models are only needed once logged in, so the login page never waits on them
+models = get_model_registry()
+
+#Loading models (ML model)
+cancer_model = models.get('risk')
+risk_predictor = get_risk_predictor()
+if cancer_model is None:
+    st.error(f"ML Model could not be loaded: {models.metadata('risk').get('error')}")
+
 # --- CHECK IF USER IS ADMIN - SHOW ONLY ADMIN DASHBOARD ---
 if st.session_state['logged_in'] and st.session_state['username'] == 'admin':
     # Admin users only see the Admin Dashboard
@@ -1990,7 +1711,7 @@ elif st.session_state['logged_in']:
             
             st.header("Lung Cancer Dataset")
             try:
-                data=pd.read_csv("datasets/data.csv")
+                data=dataset_store.load('data')
                 st.write(data.head(10))
                 code = '''
     Index(['Age', 'Gender', 'Air Pollution', 'Alcohol use', 'Dust Allergy',
@@ -2029,7 +1750,7 @@ elif st.session_state['logged_in']:
             st.header("Lung Cancer Training Dataset")
             try:
                 st.subheader("X_Train Data")
-                data=pd.read_csv("datasets/train.csv", index_col=0)
+                data=dataset_store.load('train')
                 st.write(data)
                 code = ''' Index(['Age', 'Gender', 'Air Pollution', 'Alcohol use', 'Balanced Diet',
         'Obesity', 'Smoking', 'Passive Smoker', 'Fatigue', 'Weight Loss',
@@ -2037,7 +1758,7 @@ elif st.session_state['logged_in']:
         'Clubbing of Finger Nails', 'Frequent Cold', 'Dry Cough', 'Snoring'],
         dtype='object')'''
                 st.code(code, language='python')
-                data=pd.read_csv("datasets/trainy.csv", index_col=0)
+                data=dataset_store.load('trainy')
                 st.subheader("Y_Train Data")
                 st.dataframe(data, width=700)
             except FileNotFoundError:
@@ -2047,7 +1768,7 @@ elif st.session_state['logged_in']:
             st.header("Lung Cancer Testing Dataset") # Corrected header from Training to Testing
             try:
                 st.subheader("X_Test Data")
-                data=pd.read_csv("datasets/testx.csv", index_col=0)
+                data=dataset_store.load('testx')
                 st.write(data)
                 code = ''' Index(['Age', 'Gender', 'Air Pollution', 'Alcohol use', 'Balanced Diet',
         'Obesity', 'Smoking', 'Passive Smoker', 'Fatigue', 'Weight Loss',
@@ -2055,7 +1776,7 @@ elif st.session_state['logged_in']:
         'Clubbing of Finger Nails', 'Frequent Cold', 'Dry Cough', 'Snoring'],
         dtype='object')'''
                 st.code(code, language='python')
-                data=pd.read_csv("datasets/testy.csv", index_col=0)
+                data=dataset_store.load('testy')
                 st.subheader("Y_Test Data")
                 st.dataframe(data, width=700)
             except FileNotFoundError:
@@ -2181,10 +1902,9 @@ elif st.session_state['logged_in']:
         else:
             # Load test data for demonstration
             try:
-                testx=pd.read_csv("datasets/testx.csv",index_col=0)
-                testy=pd.read_csv("datasets/testy.csv",index_col=0)
-                testx.reset_index(drop=True, inplace=True)
-                testy.reset_index(drop=True, inplace=True)
+                # Cached frames are shared across sessions, so reset_index returns copies
+                testx=dataset_store.load('testx').reset_index(drop=True)
+                testy=dataset_store.load('testy').reset_index(drop=True)
                 
                 concate_data = pd.concat([testx,testy],axis=1)
 
@@ -2263,12 +1983,13 @@ elif st.session_state['logged_in']:
                     
                     # Prepare input data as a 2D numpy array of floats (essential for model prediction)
                     try:
-                        input_data = np.array([[float(Age), float(Gender), float(AirPollution), float(Alcoholuse), float(BalancedDiet), float(Obesity), float(Smoking), float(PassiveSmoker), float(Fatigue), float(WeightLoss), float(ShortnessofBreath), float(Wheezing), float(SwallowingDifficulty), float(ClubbingofFingerNails), float(FrequentCold), float(DryCough), float(Snoring)]])
+                        input_values = [Age, Gender, AirPollution, Alcoholuse, BalancedDiet, Obesity, Smoking, PassiveSmoker, Fatigue, WeightLoss, ShortnessofBreath, Wheezing, SwallowingDifficulty, ClubbingofFingerNails, FrequentCold, DryCough, Snoring]
                         
-                        lung_prediction = cancer_model.predict(input_data)
+                        # Memoized by feature vector and model version; test set rows are precomputed
+                        lung_prediction = risk_predictor.predict_row(input_values)
                         
                         # Assuming the model returns a categorical label or string ('High', 'Medium', 'Low')
-                        prediction_result = lung_prediction[0]
+                        prediction_result = lung_prediction['prediction']
 
                         if prediction_result == 'High':
                             lung_diagnosis = 'The person has a High risk of Lung Cancer'
@@ -2286,6 +2007,7 @@ elif st.session_state['logged_in']:
                             st.success(lung_diagnosis)
                         
                         # Store prediction data for report generation
+                        st.session_state.pop('ml_report', None)
                         st.session_state.ml_prediction_data = {
                             'input_data': {
                                 'Age': Age, 'Gender': Gender, 'AirPollution': AirPollution,
@@ -2302,8 +2024,17 @@ elif st.session_state['logged_in']:
                             'diagnosis': lung_diagnosis
                         }
                         
+                        # Persist the prediction (written to ml_predictions in batches)
+                        confidence_score = lung_prediction['confidence']
+                        current_user = store.get_user(st.session_state['username'])
+                        if current_user is not None:
+                            store.record_ml_prediction(current_user['id'], st.session_state.ml_prediction_data['input_data'],
+                                                       prediction_result, risk_level, confidence_score)
+                        
                     except ValueError:
                         st.error("Please ensure all input fields contain valid numbers.")
+                    except risk_scoring.ModelUnavailable as e:
+                        st.error(str(e))
                     except Exception as e:
                         st.error(f"An error occurred during prediction: {e}")
                 
@@ -2313,35 +2044,40 @@ elif st.session_state['logged_in']:
                     st.markdown('<div class="report-section">', unsafe_allow_html=True)
                     st.header("📊 Generate Medical Report")
                     
-                    user_data = st.session_state['users'].get(st.session_state['username'], {}).get('profile', {})
+                    user_data = (store.get_user(st.session_state['username']) or {}).get('profile', {})
                     
                     if st.button("📄 Generate Comprehensive Report"):
-                        # Generate text report
-                        report_text = generate_ml_report_text(
-                            user_data=user_data,
-                            input_data=st.session_state.ml_prediction_data['input_data'],
-                            prediction_result=st.session_state.ml_prediction_data['prediction_result'],
-                            risk_level=st.session_state.ml_prediction_data['risk_level']
-                        )
+                        # Build the structured report once; each format is rendered from it on request
+                        st.session_state.ml_report = {
+                            'report': reports.build_ml_report(
+                                user_data=user_data,
+                                username=st.session_state['username'],
+                                input_data=st.session_state.ml_prediction_data['input_data'],
+                                prediction_result=st.session_state.ml_prediction_data['prediction_result'],
+                                risk_level=st.session_state.ml_prediction_data['risk_level']
+                            ),
+                            'filename_base': f"Lung_Cancer_ML_Report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                        }
+                    
+                    if 'ml_report' in st.session_state:
+                        report = st.session_state.ml_report['report']
+                        report_text = reports.generate_report_txt(report)
+                        filename_base = st.session_state.ml_report['filename_base']
                         
                         # Create multiple download options
-                        filename_base = f"Lung_Cancer_ML_Report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                        
                         col1, col2, col3, col4 = st.columns(4)
                         
                         with col1:
                             # TXT version
-                            st.markdown(create_text_download_link(report_text, f"{filename_base}.txt", "text/plain", "📄 TXT Report"), unsafe_allow_html=True)
+                            st.download_button(label="📄 TXT Report", data=report_text, file_name=f"{filename_base}.txt", mime="text/plain", key="ml_report_txt")
                         
                         with col2:
-                            # PDF version
-                            pdf_buffer = generate_report_pdf(report_text, "ML")
-                            st.markdown(create_binary_download_link(pdf_buffer, f"{filename_base}.pdf", "application/pdf", "📊 PDF Report"), unsafe_allow_html=True)
+                            # PDF version, rendered in the background only when asked for
+                            render_document_job('report', 'pdf', (report,), f"{filename_base}.pdf", "📊 PDF Report", key="ml_report_pdf")
                         
                         with col3:
                             # DOCX version
-                            docx_buffer = generate_report_docx(report_text, "ML")
-                            st.markdown(create_binary_download_link(docx_buffer, f"{filename_base}.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "📝 DOCX Report"), unsafe_allow_html=True)
+                            render_document_job('report', 'docx', (report,), f"{filename_base}.docx", "📝 DOCX Report", key="ml_report_docx")
                         
                         with col4:
                             # Print button
@@ -2357,6 +2093,109 @@ elif st.session_state['logged_in']:
                     st.markdown('</div>', unsafe_allow_html=True)
                 
                 
+                # Bulk scoring of screening-camp questionnaires
+                st.markdown("---")
+                st.header("📂 Bulk Risk Scoring")
+                st.write(f"Upload a CSV or Parquet file with the test set column layout ({', '.join(risk_scoring.FEATURE_COLUMNS)}). "
+                         "Rows are validated and scored in chunks and the results are written to disk, so only the upload itself "
+                         "is held in memory (up to Streamlit's upload size limit).")
+                
+                bulk_file = st.file_uploader("Questionnaire file", type=['csv', 'parquet'], key="bulk_risk_file")
+                bulk_chunk_rows = st.select_slider("Rows per chunk", options=[1000, 5000, 10000, 50000],
+                                                   value=risk_scoring.CHUNK_ROWS, key="bulk_chunk_rows")
+                
+                if bulk_file is not None and st.button("⚡ Score File", key="bulk_score_btn"):
+                    # A new scored file invalidates the old one and any reports built from it
+                    clear_bulk_results()
+                    
+                    progress = st.empty()
+                    output_file = SessionTempFile("risk_scores_", ".csv")
+                    try:
+                        with open(output_file.path, 'w', newline='') as out:
+                            summary = risk_scoring.score_stream(
+                                cancer_model, bulk_file, risk_scoring.file_format(bulk_file.name), out, bulk_chunk_rows,
+                                on_progress=lambda s: progress.info(f"Scored {s['rows']:,} rows...")
+                            )
+                        progress.empty()
+                        st.session_state.bulk_scoring = {
+                            'file': output_file,
+                            'path': output_file.path,
+                            'summary': summary,
+                            'file_name': f"{os.path.splitext(bulk_file.name)[0]}_risk_scores.csv"
+                        }
+                    except Exception as e:
+                        # Never leave a partial file behind, whatever stopped the scoring
+                        output_file.remove()
+                        progress.empty()
+                        st.error(str(e) if isinstance(e, risk_scoring.ScoringError) else f"Could not score the file: {e}")
+                
+                bulk_result = st.session_state.get('bulk_scoring')
+                if bulk_result and os.path.exists(bulk_result['path']):
+                    summary = bulk_result['summary']
+                    col1, col2, col3, col4 = st.columns(4)
+                    col1.metric("Rows", f"{summary['rows']:,}")
+                    col2.metric("Scored", f"{summary['scored']:,}")
+                    col3.metric("Invalid", f"{summary['invalid']:,}")
+                    col4.metric("Rows / second", f"{summary['rows_per_second']:,.0f}")
+                    
+                    if summary['levels']:
+                        st.write("**Predicted risk levels:** " + ", ".join(
+                            f"{level}: {count:,}" for level, count in sorted(summary['levels'].items())))
+                    if summary['invalid']:
+                        st.warning(f"{summary['invalid']:,} rows had missing or non-numeric values; see the '{risk_scoring.ERROR_COLUMN}' column.")
+                    
+                    st.dataframe(pd.read_csv(bulk_result['path'], nrows=20), width=700)
+                    render_file_download(bulk_result['path'], "📥 Download Scored File", bulk_result['file_name'],
+                                         "text/csv", "bulk_download_btn")
+                    if st.button("🗑️ Clear Results", key="bulk_clear_btn"):
+                        clear_bulk_results()
+                        st.rerun()
+                    
+                    # Per-patient reports for the scored rows, rendered in parallel
+                    st.subheader("📦 Patient Reports")
+                    report_outputs = {
+                        "Zip of PDF reports": ('zip', 'pdf'),
+                        "Zip of DOCX reports": ('zip', 'docx'),
+                        "Zip of TXT reports": ('zip', 'txt'),
+                        "One merged PDF": ('pdf', 'pdf'),
+                    }
+                    report_output = st.selectbox("Output", list(report_outputs), key="bulk_reports_output")
+                    if summary['scored'] and st.button("📄 Generate Patient Reports", key="bulk_reports_btn"):
+                        previous = st.session_state.pop('bulk_reports', None)
+                        if previous:
+                            previous['file'].remove()
+                        st.session_state.pop('bulk_reports_download_btn_ready', None)
+                        
+                        output_format, doc_format = report_outputs[report_output]
+                        progress = st.progress(0.0)
+                        reports_file = SessionTempFile("risk_reports_", f".{output_format}")
+                        try:
+                            with open(reports_file.path, 'wb') as out:
+                                reports_summary = bulk_reports.generate(
+                                    bulk_result['path'], 'csv', out, output_format, doc_format,
+                                    on_progress=lambda n: progress.progress(min(n / summary['scored'], 1.0))
+                                )
+                            progress.empty()
+                            st.session_state.bulk_reports = {
+                                'file': reports_file,
+                                'path': reports_file.path,
+                                'summary': reports_summary,
+                                'file_name': f"{os.path.splitext(bulk_result['file_name'])[0]}_reports.{output_format}",
+                                'mime': 'application/zip' if output_format == 'zip' else 'application/pdf'
+                            }
+                        except Exception as e:
+                            reports_file.remove()
+                            progress.empty()
+                            st.error(str(e) if isinstance(e, (reports.ReportError, risk_scoring.ScoringError))
+                                     else f"Could not generate the reports: {e}")
+                    
+                    reports_result = st.session_state.get('bulk_reports')
+                    if reports_result and os.path.exists(reports_result['path']):
+                        st.caption(f"{reports_result['summary']['reports']:,} reports in {reports_result['summary']['seconds']:.1f}s "
+                                   f"({reports_result['summary']['reports_per_second']:,.1f} reports/s)")
+                        render_file_download(reports_result['path'], "📥 Download Patient Reports", reports_result['file_name'],
+                                             reports_result['mime'], "bulk_reports_download_btn")
+                
                 expander = st.expander("Here are some more random values from Test Set")
                 
                 expander.write(concate_data.head(5))
@@ -2375,28 +2214,25 @@ elif st.session_state['logged_in']:
             0: "Lung Cancer Case 🦠", 
             1: "Normal Case 👍"      
         }
-        PREDICTION_THRESHOLD = 0.5
         
-        @st.cache_resource 
-        def loading_model():
-            # fp is defined at the top of the script
-            try:
-                model_loader = load_model(fp)
-                return model_loader
-            except Exception as e:
-                st.error(f"Error loading CNN model from '{fp}': {e}. Please check the file path and Keras/TensorFlow versions.")
-                return None
-
-        cnn = loading_model()
+        # Model and version read together, so a hot-swap mid-run can't pair one with the other's cache key or thresholds
+        cnn, cnn_version = models.get_with_version('cnn')
+        cnn_cache = get_prediction_cache()
         
         st.title('Lung Cancer Detection using CNN and CT-Scan Images')
 
         if cnn is None:
+            cnn_metadata = models.metadata('cnn')
+            st.error(f"Error loading CNN model from '{cnn_metadata['path']}': {cnn_metadata.get('error')}. Please check the file path and Keras/TensorFlow versions.")
             st.warning("Cannot proceed. CNN model failed to load.")
             st.stop() # Stop if model failed to load
 
+        # Calibration and risk bands fitted for this model version (cnn_calibration.py), or the defaults
+        cnn_config = cnn_calibration.config_for(models.metadata('cnn')['path'], cnn_version)
+        cnn_thresholds = cnn_config['thresholds']
+
         # Create tabs for different functionalities
-        tab1, tab2, tab3 = st.tabs(["📤 Upload CT-Scan", "📊 Model Information", "ℹ️ About This Tool"])
+        tab1, tab_batch, tab2, tab3 = st.tabs(["📤 Upload CT-Scan", "🗂️ Batch Study", "📊 Model Information", "ℹ️ About This Tool"])
         
         with tab1:
             st.header("Upload Your CT-Scan for Analysis")
@@ -2419,32 +2255,41 @@ elif st.session_state['logged_in']:
                     st.json(file_details)
 
                 try:
-                    # 1. Load and display the image
-                    uploaded_image = Image.open(temp)
-                    uploaded_image = uploaded_image.convert("RGB") # Ensure 3-channel
+                    # 1. Display the upload (st.image decodes the bytes itself)
+                    upload_bytes = temp.getvalue()
                     
                     with col2:
                         st.subheader("🖼️ Uploaded CT-Scan")
-                        st.image(uploaded_image, caption='Uploaded CT-Scan Image', width=400)
+                        st.image(upload_bytes, caption='Uploaded CT-Scan Image', width=400)
                     
-                    # Progress bar for processing
-                    with st.spinner("🔄 Processing image and running AI analysis..."):
-                        # 2. Resize the image for the model
-                        target_size = (150, 150)
-                        resized_image = uploaded_image.resize(target_size)
-
-                        # 3. Preprocessing: Convert PIL image to a NumPy array
-                        pp_ved_img = image.img_to_array(resized_image)
-                        pp_ved_img = pp_ved_img / 255.0  # Normalize pixel values
-                        pp_ved_img = np.expand_dims(pp_ved_img, axis=0) # Add batch dimension
-
-                        # Predict
-                        hardik_preds = cnn.predict(pp_ved_img)
-                        prediction_score = hardik_preds[0][0] # Probability of the 'Normal' class (Class 1)
-
-                    # Dynamic calculation of probabilities
-                    prob_normal = prediction_score
-                    prob_cancer = 1.0 - prediction_score
+                    # Reruns and re-uploads of the same scan are served from the cache
+                    prediction_key = prediction_cache.cache_key(upload_bytes, cnn_version)
+                    cached_prediction = cnn_cache.get(prediction_key)
+                    
+                    if cached_prediction is None:
+                        # Progress bar for processing
+                        with st.spinner("🔄 Processing image and running AI analysis..."):
+                            # 2. Decode and resize the image for the model
+                            uploaded_image = Image.open(io.BytesIO(upload_bytes)).convert("RGB") # Ensure 3-channel
+                            target_size = (150, 150)
+                            resized_image = uploaded_image.resize(target_size)
+
+                            # 3. Preprocessing: Convert PIL image to a NumPy array (same as keras img_to_array)
+                            pp_ved_img = np.asarray(resized_image, dtype=np.float32)
+                            pp_ved_img = pp_ved_img / 255.0  # Normalize pixel values
+                            pp_ved_img = np.expand_dims(pp_ved_img, axis=0) # Add batch dimension
+
+                            # Predict
+                            hardik_preds = cnn.predict(pp_ved_img)
+                            prediction_score = float(hardik_preds[0][0]) # Probability of the 'Normal' class (Class 1)
+                        cnn_cache.put(prediction_key, {'prob_normal': prediction_score})
+                    else:
+                        prediction_score = cached_prediction['prob_normal']
+                        st.caption("⚡ Result served from the prediction cache (same scan and model version).")
+
+                    # Dynamic calculation of probabilities (the cache keeps the raw model output)
+                    prob_normal = float(cnn_calibration.calibrate(prediction_score, cnn_config['calibration']))
+                    prob_cancer = 1.0 - prob_normal
                     
                     # 4. Dynamic Decision and Output with enhanced visualization
                     st.markdown("---")
@@ -2477,12 +2322,11 @@ elif st.session_state['logged_in']:
                         st.metric("👍 Normal Confidence", f"{prob_normal:.2%}")
                     
                     # Dynamic risk assessment and recommendations
-                    risk_level = ""
+                    risk_level = cnn_inference.risk_level_for(prob_cancer, cnn_thresholds)
                     final_prediction = ""
                     recommendations = []
                     
-                    if prob_cancer >= 0.75:
-                        risk_level = "High"
+                    if risk_level == "High":
                         final_prediction = CLASS_LABELS[0]
                         st.markdown(
                             f'<div class="prediction-high-risk">'
@@ -2508,8 +2352,7 @@ elif st.session_state['logged_in']:
                         - Do not ignore these findings - early intervention is crucial
                         """)
                         
-                    elif prob_cancer >= 0.25:
-                        risk_level = "Medium"
+                    elif risk_level == "Medium":
                         final_prediction = "Requires Further Evaluation"
                         st.markdown(
                             f'<div class="prediction-medium-risk">'
@@ -2536,7 +2379,6 @@ elif st.session_state['logged_in']:
                         """)
                         
                     else:
-                        risk_level = "Low"
                         final_prediction = CLASS_LABELS[1]
                         st.markdown(
                             f'<div class="prediction-low-risk">'
@@ -2574,41 +2416,57 @@ elif st.session_state['logged_in']:
                         'recommendations': recommendations
                     }
                     
+                    # Persist each uploaded scan once, not on every rerun of the page
+                    upload_key = (temp.name, temp.size)
+                    if st.session_state.get('cnn_recorded_upload') != upload_key:
+                        current_user = store.get_user(st.session_state['username'])
+                        if current_user is not None:
+                            store.record_cnn_prediction(current_user['id'], file_details,
+                                                        st.session_state.cnn_prediction_data['prediction_data'])
+                        st.session_state['cnn_recorded_upload'] = upload_key
+                        st.session_state.pop('cnn_report', None)
+                    
                     # Report Generation Section
                     st.markdown("---")
                     st.markdown('<div class="report-section">', unsafe_allow_html=True)
                     st.header("📊 Generate Medical Report")
                     
-                    user_data = st.session_state['users'].get(st.session_state['username'], {}).get('profile', {})
+                    user_data = (store.get_user(st.session_state['username']) or {}).get('profile', {})
                     
                     if st.button("📄 Generate Comprehensive Report"):
-                        # Generate text report
-                        report_text = generate_cnn_report_text(
-                            user_data=user_data,
-                            file_details=file_details,
-                            prediction_data=st.session_state.cnn_prediction_data['prediction_data'],
-                            risk_level=risk_level,
-                            recommendations=recommendations
-                        )
+                        # Build the structured report once; each format is rendered from it on request
+                        st.session_state.cnn_report = {
+                            'report': reports.build_cnn_report(
+                                user_data=user_data,
+                                username=st.session_state['username'],
+                                file_details=file_details,
+                                prediction_data=st.session_state.cnn_prediction_data['prediction_data'],
+                                risk_level=risk_level,
+                                recommendations=recommendations,
+                                risk_bands=(cnn_thresholds['high'], cnn_thresholds['medium'])
+                            ),
+                            'filename_base': f"Lung_Cancer_CTScan_Report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                        }
+                    
+                    if 'cnn_report' in st.session_state:
+                        report = st.session_state.cnn_report['report']
+                        report_text = reports.generate_report_txt(report)
+                        filename_base = st.session_state.cnn_report['filename_base']
                         
                         # Create multiple download options
-                        filename_base = f"Lung_Cancer_CTScan_Report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                        
                         col1, col2, col3, col4 = st.columns(4)
                         
                         with col1:
                             # TXT version
-                            st.markdown(create_text_download_link(report_text, f"{filename_base}.txt", "text/plain", "📄 TXT Report"), unsafe_allow_html=True)
+                            st.download_button(label="📄 TXT Report", data=report_text, file_name=f"{filename_base}.txt", mime="text/plain", key="cnn_report_txt")
                         
                         with col2:
-                            # PDF version
-                            pdf_buffer = generate_report_pdf(report_text, "CNN")
-                            st.markdown(create_binary_download_link(pdf_buffer, f"{filename_base}.pdf", "application/pdf", "📊 PDF Report"), unsafe_allow_html=True)
+                            # PDF version, rendered in the background only when asked for
+                            render_document_job('report', 'pdf', (report,), f"{filename_base}.pdf", "📊 PDF Report", key="cnn_report_pdf")
                         
                         with col3:
                             # DOCX version
-                            docx_buffer = generate_report_docx(report_text, "CNN")
-                            st.markdown(create_binary_download_link(docx_buffer, f"{filename_base}.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "📝 DOCX Report"), unsafe_allow_html=True)
+                            render_document_job('report', 'docx', (report,), f"{filename_base}.docx", "📝 DOCX Report", key="cnn_report_docx")
                         
                         with col4:
                             # Print button
@@ -2659,6 +2517,109 @@ elif st.session_state['logged_in']:
                     st.caption("Abnormal Lung CT-Scan")
                     st.info("May show nodules, masses, or opacities")
 
+        with tab_batch:
+            st.header("Batch Study Analysis")
+            st.markdown("Upload all slices of a study at once (multiple images or a single zip archive). "
+                        "Slices are preprocessed into one tensor and scored with batched model calls.")
+
+            batch_files = st.file_uploader("Choose CT-Scan slices or a zip archive", type=['png', 'jpeg', 'jpg', 'zip'],
+                                           accept_multiple_files=True, key='cnn_batch_files',
+                                           help="Select several CT-Scan slices, or a zip file containing them")
+            batch_size = st.select_slider("Inference Batch Size", options=[8, 16, 32, 64, 128],
+                                          value=cnn_inference.DEFAULT_BATCH_SIZE, key='cnn_batch_size')
+            # Results are only shown for the uploads they were computed from
+            batch_uploads = tuple((f.name, f.size) for f in batch_files or [])
+
+            if batch_files and st.button("🔬 Analyze Study", key='cnn_batch_analyze'):
+                try:
+                    with st.spinner("🔄 Decoding slices and running batched AI analysis..."):
+                        slices, decode_errors = cnn_inference.decode_uploads(batch_files)
+                        slice_names = [name for name, _ in slices]
+                        batch_tensor = cnn_inference.build_batch_tensor([img for _, img in slices])
+                        prob_normal = cnn_inference.predict_batch(cnn, batch_tensor, batch_size=batch_size)
+                        prob_normal = cnn_calibration.calibrate(prob_normal, cnn_config['calibration'])
+                        slice_rows, study_summary = cnn_inference.summarize_study(slice_names, prob_normal, cnn_thresholds)
+
+                    st.session_state.cnn_batch_results = {
+                        'rows': slice_rows,
+                        'summary': study_summary,
+                        'errors': decode_errors,
+                        'uploads': batch_uploads
+                    }
+                    
+                    # Persist every slice result (queued and written to cnn_predictions in batches)
+                    current_user = store.get_user(st.session_state['username'])
+                    if current_user is not None:
+                        for slice_row in slice_rows:
+                            store.record_cnn_prediction(
+                                current_user['id'],
+                                {'FileName': slice_row['Slice'], 'FileType': 'study-slice', 'FileSize': ''},
+                                {
+                                    'cancer_confidence': slice_row['Cancer Confidence'],
+                                    'normal_confidence': slice_row['Normal Confidence'],
+                                    'final_prediction': cnn_inference.final_prediction_for(slice_row['Risk Level']),
+                                    'risk_level': slice_row['Risk Level']
+                                }
+                            )
+                except Exception as e:
+                    st.error(f"❌ An error occurred during batch processing: {str(e)}")
+
+            batch_results = st.session_state.get('cnn_batch_results')
+            if batch_files and batch_results and batch_results['uploads'] == batch_uploads:
+
+                for bad_name, bad_error in batch_results['errors']:
+                    st.warning(f"Skipped '{bad_name}': {bad_error}")
+
+                if not batch_results['rows']:
+                    st.warning("No readable CT-Scan slices were found in the upload.")
+                else:
+                    study_summary = batch_results['summary']
+
+                    st.markdown("---")
+                    st.header("🎯 Study Results")
+                    col_s1, col_s2, col_s3, col_s4 = st.columns(4)
+                    with col_s1:
+                        st.metric("🗂️ Slices Analyzed", study_summary['slices'])
+                    with col_s2:
+                        st.metric("📈 Mean Cancer Confidence", f"{study_summary['mean_cancer_confidence']:.2%}")
+                    with col_s3:
+                        st.metric("🦠 Max Cancer Confidence", f"{study_summary['max_cancer_confidence']:.2%}")
+                    with col_s4:
+                        st.metric("🩺 Study Risk Level", study_summary['study_risk_level'])
+
+                    risk_counts = study_summary['risk_counts']
+                    st.write(f"**Slices by risk level:** High: {risk_counts['High']} | "
+                             f"Medium: {risk_counts['Medium']} | Low: {risk_counts['Low']}")
+                    st.write(f"**Most suspicious slice:** {study_summary['most_suspicious_slice']}")
+
+                    if study_summary['study_risk_level'] == "High":
+                        st.error("At least one slice shows strong indicators. Consult a pulmonologist or oncologist promptly.")
+                    elif study_summary['study_risk_level'] == "Medium":
+                        st.warning("Some slices require further evaluation. Schedule a follow-up with your physician.")
+                    else:
+                        st.success("No slice exceeded the moderate risk threshold.")
+
+                    st.subheader("📋 Per-Slice Results")
+                    slices_df = pd.DataFrame(batch_results['rows'])
+                    display_df = slices_df.copy()
+                    for conf_col in ('Cancer Confidence', 'Normal Confidence'):
+                        display_df[conf_col] = display_df[conf_col].map('{:.2%}'.format)
+                    st.dataframe(display_df, use_container_width=True)
+                    st.download_button(
+                        label="📥 Download Slice Results (CSV)",
+                        data=slices_df.to_csv(index=False),
+                        file_name=f"ctscan_study_results_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                        mime="text/csv",
+                        key='cnn_batch_download'
+                    )
+            elif not batch_files:
+                st.info("""
+                **📤 Batch Mode:**
+                1. Select multiple CT-Scan slices, or a zip archive of a study
+                2. Choose the inference batch size (larger batches are faster on bigger studies)
+                3. Click 'Analyze Study' to score every slice in one pass
+                """)
+
         with tab2:
             st.header("🤖 CNN Model Information")
             
@@ -2695,6 +2656,21 @@ elif st.session_state['logged_in']:
                 - Image Size: 150x150 pixels
                 """)
             
+            st.subheader("🎚️ Risk Thresholds")
+            st.markdown(f"""
+            - **High Risk:** cancer confidence ≥ {cnn_thresholds['high']:.0%}
+            - **Medium Risk:** cancer confidence ≥ {cnn_thresholds['medium']:.0%}
+            - **Calibration:** {cnn_config['calibration']['method']}
+            """)
+            if cnn_config['source'] == 'default':
+                st.caption("Default thresholds. Run `python cnn_calibration.py` to fit them for the deployed model.")
+            else:
+                st.caption(f"Fitted on {cnn_config['slices']} slices from `{cnn_config['data']}` on {cnn_config['created_at']} "
+                           f"for model version {cnn_config['model_version']}.")
+                if cnn_config.get('overlaps_training'):
+                    st.warning("These slices may have been part of the model's training data, "
+                               "so the fitted bands are likely optimistic.")
+            
             st.subheader("🔄 Model Workflow")
             
             # Instead of trying to load a missing image, create a text-based workflow diagram
@@ -2746,7 +2722,7 @@ elif st.session_state['logged_in']:
             
             **🔒 Privacy & Security:**
             - Uploaded images are processed temporarily
-            - No personal health information is stored
+            - Prediction results are saved to your account history only
             - All analysis happens in real-time
             
             **💡 Remember:** Early detection saves lives. Regular screenings and consultations 
@@ -2767,7 +2743,7 @@ elif st.session_state['logged_in']:
         
         # Define the current user and their profile data for clean access
         current_username = st.session_state.get('username')
-        user_data = st.session_state.get('users', {}).get(current_username, {})
+        user_data = store.get_user(current_username) or {}
         user_profile = user_data.get('profile', {})
 
         # The new key to store the last successful booking summary (Scoped to the user)
@@ -2787,6 +2763,56 @@ elif st.session_state['logged_in']:
                     for doc in DOCTORS_DATABASE.get(specialization, [])
                 ]
 
+            # Slot selection lives outside the form so the date and time options
+            # refresh immediately when the doctor changes
+            st.subheader("Choose Doctor & Time Slot")
+            
+            col_slot1, col_slot2 = st.columns(2)
+            with col_slot1:
+                # Doctor specialization selection
+                doctor_specialization = st.selectbox(
+                    "Specialization *",
+                    ["Pulmonologist", "Oncologist", "Radiologist"],
+                    key='appt_spec'
+                )
+
+                # Doctor name selection - DYNAMICALLY POPULATED
+                doctor_options = get_doctor_options(doctor_specialization)
+                selected_doctor_name_fee = st.selectbox(
+                    "Select Doctor *",
+                    options=doctor_options,
+                    key='appt_doctor'
+                )
+
+            # Find the actual doctor object using the selected name
+            doctor_name_only = selected_doctor_name_fee.split(' (')[0] if selected_doctor_name_fee else ''
+            selected_doctor = next((doc for doc in DOCTORS_DATABASE.get(doctor_specialization, []) if doc['name'] == doctor_name_only), None)
+            
+            # Only dates and times with a free slot are offered (precomputed availability bitmaps)
+            available_dates = store.availability.available_dates(selected_doctor['id']) if selected_doctor else []
+            
+            with col_slot2:
+                # Date selection
+                appointment_date = st.selectbox(
+                    "Preferred Date *",
+                    available_dates,
+                    format_func=lambda d: d.strftime("%A, %d %b %Y"),
+                    key='appt_date'
+                )
+
+                # Time selection
+                free_times = store.availability.free_times(selected_doctor['id'], appointment_date) if appointment_date else []
+                appointment_time = st.selectbox(
+                    "Preferred Time *",
+                    free_times,
+                    key='appt_time'
+                )
+            
+            if selected_doctor:
+                st.caption(f"{selected_doctor['name']} consults on {', '.join(selected_doctor['availability'])}.")
+                if not available_dates:
+                    st.warning(f"{selected_doctor['name']} has no free slots in the next {BOOKING_HORIZON_DAYS} days. Please choose another doctor.")
+
             with st.form("appointment_booking_form"):
                 st.subheader("Patient Information")
                 
@@ -2802,41 +2828,16 @@ elif st.session_state['logged_in']:
                 
                 st.subheader("Appointment Details")
                 
-                col3, col4 = st.columns(2)
-                with col3:
-                    # Doctor specialization selection
-                    doctor_specialization = st.selectbox(
-                        "Specialization *",
-                        ["Pulmonologist", "Oncologist", "Radiologist"],
-                        key='appt_spec'
-                    )
-
-                    # Doctor name selection - DYNAMICALLY POPULATED
-                    doctor_options = get_doctor_options(doctor_specialization)
-                    selected_doctor_name_fee = st.selectbox(
-                        "Select Doctor *",
-                        options=doctor_options,
-                        key='appt_doctor'
-                    )
-
-                    # Date selection
-                    appointment_date = st.date_input("Preferred Date *", min_value=datetime.date.today(), key='appt_date')
-                    
-                with col4:
-                    # Time selection
-                    appointment_time = st.selectbox(
-                        "Preferred Time *",
-                        ["09:00 AM", "10:00 AM", "11:00 AM", "02:00 PM", "03:00 PM", "04:00 PM"],
-                        key='appt_time'
-                    )
-                    
-                    # Reason for visit
-                    reason = st.selectbox(
-                        "Reason for Visit *",
-                        ["Lung Cancer Screening", "Follow-up Consultation", "Second Opinion", 
-                         "CT-Scan Review", "Symptoms Evaluation", "Routine Check-up"],
-                        key='appt_reason'
-                    )
+                if selected_doctor and appointment_date and appointment_time:
+                    st.write(f"**Slot:** {selected_doctor['name']} on {appointment_date.strftime('%A, %d %b %Y')} at {appointment_time}")
+                
+                # Reason for visit
+                reason = st.selectbox(
+                    "Reason for Visit *",
+                    ["Lung Cancer Screening", "Follow-up Consultation", "Second Opinion", 
+                     "CT-Scan Review", "Symptoms Evaluation", "Routine Check-up"],
+                    key='appt_reason'
+                )
                 
                 # Symptoms description
                 symptoms = st.text_area("Describe Your Symptoms *", 
@@ -2851,56 +2852,52 @@ elif st.session_state['logged_in']:
                 if submitted:
                     # --- PRE-SUBMISSION VALIDATION ---
                     
-                    # Find the actual doctor object using the selected name
-                    doctor_name_only = selected_doctor_name_fee.split(' (')[0]
-                    selected_doctor = next((doc for doc in DOCTORS_DATABASE.get(doctor_specialization, []) if doc['name'] == doctor_name_only), None)
-
                     if selected_doctor is None:
                         st.error("Error: Could not find the selected doctor in the database.")
                         st.stop()
+                    
+                    if not appointment_date or not appointment_time:
+                        st.error("Please choose an available date and time for your appointment.")
+                        st.stop()
+                    
+                    # Generate appointment ID (millisecond suffix keeps IDs unique across sessions)
+                    booked_at = datetime.datetime.now()
+                    appointment_id = f"APT{booked_at.strftime('%Y%m%d%H%M%S')}{booked_at.microsecond // 1000:03d}"
+                    
+                    # Create appointment data
+                    appointment_data = {
+                        'appointment_id': appointment_id,
+                        'username': current_username,
+                        'patient_name': f"{first_name} {last_name}",
+                        'phone': phone,
+                        'email': email,
+                        'address': address,
+                        'specialization': doctor_specialization,
+                        'doctor_id': selected_doctor['id'],
+                        'doctor_name': selected_doctor['name'], # Store the doctor's name for easy look-up
+                        'date': appointment_date.strftime("%Y-%m-%d"),
+                        'time': appointment_time,
+                        'reason': reason,
+                        'symptoms': symptoms,
+                        'previous_diagnosis': previous_diagnosis,
+                        'status': 'Confirmed',
+                        'booked_on': booked_at.strftime("%Y-%m-%d %H:%M:%S")
+                    }
                         
                     # 1. Validate required fields
                     if not all([first_name, last_name, phone, email, address, symptoms]):
                         st.error("Please fill in all required fields (*)")
                     
-                    # 2. Check for appointment conflict (The core change)
-                    elif any(
-                        app['specialization'] == doctor_specialization and
-                        app['doctor_name'] == selected_doctor['name'] and # Now check against doctor's name
-                        app['date'] == appointment_date.strftime("%Y-%m-%d") and
-                        app['time'] == appointment_time and
-                        app['status'] == 'Confirmed'
-                        for app in st.session_state['appointments']
-                    ):
+                    # 2. Check for appointment conflict and book atomically (indexed slot lookup)
+                    elif not store.book_appointment(user_data['id'], appointment_data):
                         st.error(f"❌ **Conflict:** Dr. {selected_doctor['name'].split()[-1]} is already booked at {appointment_time} on {appointment_date.strftime('%Y-%m-%d')}. Please select a different time or doctor.")
+                        free_times = store.availability.free_times(selected_doctor['id'], appointment_data['date'])
+                        if free_times:
+                            st.info(f"Available times with {selected_doctor['name']} on that day: {', '.join(free_times)}")
                     
                     else:
                         # --- SUCCESSFUL BOOKING ---
                         
-                        # Generate appointment ID
-                        appointment_id = f"APT{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
-                        
-                        # Create appointment data
-                        appointment_data = {
-                            'appointment_id': appointment_id,
-                            'patient_name': f"{first_name} {last_name}",
-                            'phone': phone,
-                            'email': email,
-                            'address': address,
-                            'specialization': doctor_specialization,
-                            'doctor_name': selected_doctor['name'], # Store the doctor's name for easy look-up
-                            'date': appointment_date.strftime("%Y-%m-%d"),
-                            'time': appointment_time,
-                            'reason': reason,
-                            'symptoms': symptoms,
-                            'previous_diagnosis': previous_diagnosis,
-                            'status': 'Confirmed',
-                            'booked_on': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                        
-                        # Store appointment in session state
-                        st.session_state['appointments'].append(appointment_data)
-                        
                         # Generate confirmation (use the confirmed selected_doctor object)
                         patient_data = {
                             'first_name': first_name,
@@ -2917,8 +2914,8 @@ elif st.session_state['logged_in']:
                         st.success("🎉 Appointment Booked Successfully!")
                         st.balloons()
                         
-                        # Store the confirmation data for download in the *current user's* session data
-                        st.session_state['users'][current_username][LAST_BOOKING_KEY] = {
+                        # Store the confirmation data for download, scoped to the current user
+                        st.session_state.setdefault(LAST_BOOKING_KEY, {})[current_username] = {
                             'patient_data': patient_data,
                             'doctor_data': selected_doctor,
                             'appointment_data': appointment_data,
@@ -2933,11 +2930,12 @@ elif st.session_state['logged_in']:
             
             # Download section - OUTSIDE the form
             # --- **CRITICAL CHANGE HERE: Use the user-scoped key** ---
-            if current_username and LAST_BOOKING_KEY in st.session_state['users'][current_username]:
-                appointment_data = st.session_state['users'][current_username][LAST_BOOKING_KEY]['appointment_data']
-                patient_data = st.session_state['users'][current_username][LAST_BOOKING_KEY]['patient_data']
-                doctor_data = st.session_state['users'][current_username][LAST_BOOKING_KEY]['doctor_data']
-                confirmation_text = st.session_state['users'][current_username][LAST_BOOKING_KEY]['confirmation_text']
+            last_booking = st.session_state.get(LAST_BOOKING_KEY, {}).get(current_username)
+            if current_username and last_booking:
+                appointment_data = last_booking['appointment_data']
+                patient_data = last_booking['patient_data']
+                doctor_data = last_booking['doctor_data']
+                confirmation_text = last_booking['confirmation_text']
                 
                 # Display appointment summary
                 st.subheader("Appointment Summary")
@@ -2962,17 +2960,15 @@ elif st.session_state['logged_in']:
                 
                 with col_dl1:
                     # TXT version
-                    st.markdown(create_text_download_link(confirmation_text, f"{filename_base}.txt", "text/plain", "📄 TXT"), unsafe_allow_html=True)
+                    st.download_button(label="📄 TXT", data=confirmation_text, file_name=f"{filename_base}.txt", mime="text/plain", key="appt_txt")
                 
                 with col_dl2:
-                    # PDF version
-                    pdf_buffer = generate_appointment_pdf(patient_data, doctor_data, appointment_data)
-                    st.markdown(create_binary_download_link(pdf_buffer, f"{filename_base}.pdf", "application/pdf", "📊 PDF"), unsafe_allow_html=True)
+                    # PDF version, rendered in the background only when asked for
+                    render_document_job('appointment', 'pdf', (patient_data, doctor_data, appointment_data), f"{filename_base}.pdf", "📊 PDF", key="appt_pdf")
                 
                 with col_dl3:
                     # DOCX version
-                    docx_buffer = generate_appointment_docx(patient_data, doctor_data, appointment_data)
-                    st.markdown(create_binary_download_link(docx_buffer, f"{filename_base}.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "📝 DOCX"), unsafe_allow_html=True)
+                    render_document_job('appointment', 'docx', (patient_data, doctor_data, appointment_data), f"{filename_base}.docx", "📝 DOCX", key="appt_docx")
                 
                 with col_dl4:
                     # Print button - now outside the form
@@ -2989,7 +2985,7 @@ elif st.session_state['logged_in']:
                 
                 # Clear the summary data after displaying it once (optional, but good practice)
                 # This ensures the summary disappears on the next page interaction/reload
-                # del st.session_state['users'][current_username][LAST_BOOKING_KEY] 
+                # del st.session_state[LAST_BOOKING_KEY][current_username]
 
             st.markdown('</div>', unsafe_allow_html=True)
 
@@ -3043,18 +3039,26 @@ elif st.session_state['logged_in']:
         with tab3:
             st.header("📋 My Appointments")
             
-            # Filter appointments for current user
-            user_appointments = [
-                app for app in st.session_state['appointments'] 
-                if app['patient_name'] == f"{user_profile.get('first_name', '')} {user_profile.get('last_name', '')}"
-            ]
+            # Appointments owned by the current user, one page at a time (indexed by user_id)
+            MY_APPOINTMENTS_PAGE_SIZE = 10
+            total_user_appointments = store.count_user_appointments(user_data['id'])
+            
+            # Stack of page cursors (last appointment row id of each previous page), scoped to the user
+            cursors_key = f"my_appointments_cursors_{current_username}"
+            page_cursors = st.session_state.setdefault(cursors_key, [None])
+            user_appointments = store.user_appointments(user_data['id'], limit=MY_APPOINTMENTS_PAGE_SIZE,
+                                                        before_id=page_cursors[-1])
+            if not user_appointments and len(page_cursors) > 1:
+                # Cursor went stale; start again from the newest page
+                page_cursors[:] = [None]
+                user_appointments = store.user_appointments(user_data['id'], limit=MY_APPOINTMENTS_PAGE_SIZE)
             
             if user_appointments:
-                # Create a DataFrame for better display
-                appointments_df = pd.DataFrame(user_appointments)
+                total_pages = -(-total_user_appointments // MY_APPOINTMENTS_PAGE_SIZE)
+                st.write(f"Showing page {len(page_cursors)} of {total_pages} ({total_user_appointments} appointments, newest first)")
                 
                 # Display appointments
-                for i, appointment in enumerate(user_appointments):
+                for appointment in user_appointments:
                     st.markdown('<div class="appointment-card">', unsafe_allow_html=True)
                     
                     col1, col2, col3 = st.columns([2, 1, 1])
@@ -3075,8 +3079,8 @@ elif st.session_state['logged_in']:
                     
                     with col3:
                         if appointment['status'] == 'Confirmed':
-                            if st.button("❌ Cancel", key=f"cancel_{i}"):
-                                appointment['status'] = 'Cancelled'
+                            if st.button("❌ Cancel", key=f"cancel_{appointment['appointment_id']}"):
+                                store.update_appointment_status(appointment['appointment_id'], 'Cancelled')
                                 st.success("Appointment cancelled!")
                                 st.rerun()
                     
@@ -3089,8 +3093,20 @@ elif st.session_state['logged_in']:
                     
                     st.markdown('</div>', unsafe_allow_html=True)
                 
+                # Paging controls
+                col_newer, col_older = st.columns(2)
+                with col_newer:
+                    if len(page_cursors) > 1 and st.button("⬅️ Newer", key='my_appts_newer'):
+                        page_cursors.pop()
+                        st.rerun()
+                with col_older:
+                    if len(page_cursors) < total_pages and st.button("Older ➡️", key='my_appts_older'):
+                        page_cursors.append(user_appointments[-1]['id'])
+                        st.rerun()
+                
                 # Export functionality
                 if st.button("📊 Export My Appointments"):
+                    appointments_df = pd.DataFrame(store.user_appointments(user_data['id']))
                     csv = appointments_df.to_csv(index=False)
                     st.download_button(
                         label="📥 Download CSV",
@@ -3108,7 +3124,7 @@ elif st.session_state['logged_in']:
                 """)
 
 # Installation instructions at the bottom
-if not PDF_AVAILABLE or not DOCX_AVAILABLE:
+if not reports.PDF_AVAILABLE or not reports.DOCX_AVAILABLE:
     st.markdown("---")
     st.warning("""
     **📦 Installation Required for Full Features:**
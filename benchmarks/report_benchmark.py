@@ -0,0 +1,106 @@
+"""Reports per second for each output format, optionally against an older revision.
+
+Sample ML and CT-scan reports are built with reports.build_*_report and
+rendered repeatedly to TXT, PDF and DOCX in this process. With
+--baseline-rev, the reports.py of that revision renders the same reports
+from their text form (the old per-line parsing generators) for comparison.
+
+    python benchmarks/report_benchmark.py
+    python benchmarks/report_benchmark.py --baseline-rev HEAD~1 --reports 200
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import types
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import reports
+
+FORMATS = ('txt', 'pdf', 'docx')
+AVAILABLE = {'txt': True, 'pdf': reports.PDF_AVAILABLE, 'docx': reports.DOCX_AVAILABLE}
+
+def sample_reports():
+    """One ML and one CT-scan report with realistic content"""
+    user = {'first_name': 'Test', 'last_name': 'User'}
+    ml_inputs = {key: 5 for _, key in reports.ML_PARAMETERS}
+    ml_inputs.update({'Age': 52, 'Gender': 1})
+    ml = reports.build_ml_report(user, 'testuser', ml_inputs, 'The person has a High risk of Lung Cancer', 'High')
+    cnn = reports.build_cnn_report(
+        user, 'testuser', {'FileName': 'scan_0001.png', 'FileType': 'image/png', 'FileSize': '84.2 KB'},
+        {'final_prediction': 'Cancer', 'cancer_confidence': 0.91, 'normal_confidence': 0.09}, 'High',
+        ["Consult an oncologist immediately", "Schedule a biopsy", "Bring previous scans"]
+    )
+    return [ml, cnn]
+
+def load_baseline(rev):
+    """reports.py as it was at rev, imported as a separate module"""
+    source = subprocess.run(['git', 'show', f'{rev}:reports.py'], cwd=REPO_ROOT,
+                            check=True, capture_output=True, text=True).stdout
+    module = types.ModuleType('reports_baseline')
+    exec(compile(source, f'{rev}:reports.py', 'exec'), module.__dict__)
+    return module
+
+def current_renderers():
+    return {
+        'txt': reports.generate_report_txt,
+        'pdf': reports.generate_report_pdf,
+        'docx': reports.generate_report_docx,
+    }
+
+def baseline_renderers(module):
+    # The old generators took the report text and its kind (there was no TXT renderer)
+    return {
+        'pdf': lambda report: module.generate_report_pdf(reports.generate_report_txt(report), report.kind),
+        'docx': lambda report: module.generate_report_docx(reports.generate_report_txt(report), report.kind),
+    }
+
+def measure(label, renderers, samples, count, formats):
+    results = {'label': label}
+    for fmt in formats:
+        if fmt not in renderers:
+            continue
+        if not AVAILABLE[fmt]:
+            print(f"{label:>10} {fmt:>5}: skipped (library not installed)")
+            continue
+        render = renderers[fmt]
+        render(samples[0])  # Warm up lazy imports and cached styles
+        started = time.perf_counter()
+        for i in range(count):
+            render(samples[i % len(samples)])
+        elapsed = time.perf_counter() - started
+        results[fmt] = {'reports': count, 'seconds': elapsed, 'reports_per_second': count / elapsed}
+        print(f"{label:>10} {fmt:>5}: {count / elapsed:9.1f} reports/s ({elapsed * 1000 / count:.2f} ms each)")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure report rendering throughput per format")
+    parser.add_argument('--reports', type=int, default=100, help="Reports rendered per format")
+    parser.add_argument('--formats', nargs='+', default=list(FORMATS), choices=FORMATS)
+    parser.add_argument('--baseline-rev', help="Git revision to compare against (e.g. HEAD~1)")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    samples = sample_reports()
+    results = []
+    if args.baseline_rev:
+        baseline = baseline_renderers(load_baseline(args.baseline_rev))
+        results.append(measure(args.baseline_rev, baseline, samples, args.reports, args.formats))
+    results.append(measure('current', current_renderers(), samples, args.reports, args.formats))
+
+    if len(results) == 2:
+        for fmt in args.formats:
+            if fmt in results[0] and fmt in results[1]:
+                speedup = results[1][fmt]['reports_per_second'] / results[0][fmt]['reports_per_second']
+                print(f"   {fmt:>5} speedup: {speedup:.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Time-to-first-paint of the login page, optionally against an older revision.
+
+Each sample starts a fresh interpreter that renders app.py through
+streamlit's AppTest harness with an empty session (i.e. the login page), so
+the measurement includes every module imported at the top of the script.
+
+    python benchmarks/startup_benchmark.py
+    python benchmarks/startup_benchmark.py --baseline-rev HEAD~1 --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in a fresh interpreter for every sample
+CHILD_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=float(sys.argv[2]))
+at.run()
+first_paint = time.perf_counter() - started
+reruns = []
+for _ in range(int(sys.argv[3])):
+    t = time.perf_counter()
+    at.run()
+    reruns.append(time.perf_counter() - t)
+heavy = [m for m in ('tensorflow', 'matplotlib', 'seaborn', 'reportlab', 'docx') if m in sys.modules]
+print(json.dumps({
+    'first_paint': first_paint,
+    'reruns': reruns,
+    'heavy_modules': heavy,
+    'exceptions': [str(e.value) for e in at.exception],
+}))
+'''
+
+def checkout_revision(rev, dest):
+    """Extract the tree at rev into dest (models and datasets included)"""
+    archive = subprocess.run(['git', 'archive', '--format=tar', rev], cwd=REPO_ROOT,
+                             check=True, capture_output=True).stdout
+    with tempfile.TemporaryFile() as f:
+        f.write(archive)
+        f.seek(0)
+        with tarfile.open(fileobj=f) as tar:
+            tar.extractall(dest)
+    return dest
+
+def sample(app_dir, timeout, reruns):
+    """Render the login page once in a new process and return its timings"""
+    env = dict(os.environ)
+    # Keep benchmark accounts out of the real database
+    env['LUNG_CANCER_DB'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT, os.path.join(app_dir, 'app.py'), str(timeout), str(reruns)],
+        cwd=app_dir, env=env, capture_output=True, text=True, check=True
+    )
+    wall = time.perf_counter() - started
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['process_wall'] = wall
+    return timings
+
+def measure(label, app_dir, runs, timeout, reruns):
+    samples = [sample(app_dir, timeout, reruns) for _ in range(runs)]
+    first_paint = [s['first_paint'] for s in samples]
+    wall = [s['process_wall'] for s in samples]
+    rerun_times = [t for s in samples for t in s['reruns']]
+    report = {
+        'label': label,
+        'runs': runs,
+        'first_paint_median_s': statistics.median(first_paint),
+        'first_paint_min_s': min(first_paint),
+        'process_wall_median_s': statistics.median(wall),
+        'rerun_median_s': statistics.median(rerun_times) if rerun_times else None,
+        'heavy_modules_loaded': samples[-1]['heavy_modules'],
+        'exceptions': samples[-1]['exceptions'],
+    }
+    print(f"{label:>10}: first paint {report['first_paint_median_s']:.2f}s "
+          f"(min {report['first_paint_min_s']:.2f}s, process {report['process_wall_median_s']:.2f}s"
+          + (f", rerun {report['rerun_median_s'] * 1000:.0f}ms" if rerun_times else "") + ")"
+          f" heavy modules: {', '.join(report['heavy_modules_loaded']) or 'none'}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure login-page time-to-first-paint")
+    parser.add_argument('--runs', type=int, default=3, help="Fresh processes per variant")
+    parser.add_argument('--reruns', type=int, default=3, help="Warm reruns measured per process")
+    parser.add_argument('--timeout', type=float, default=120.0, help="AppTest script timeout in seconds")
+    parser.add_argument('--baseline-rev', help="Git revision to compare against (e.g. HEAD~1)")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    if args.baseline_rev:
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline_dir = checkout_revision(args.baseline_rev, tmp)
+            results.append(measure(args.baseline_rev, baseline_dir, args.runs, args.timeout, args.reruns))
+    results.append(measure('current', REPO_ROOT, args.runs, args.timeout, args.reruns))
+
+    if len(results) == 2:
+        before, after = results[0]['first_paint_median_s'], results[1]['first_paint_median_s']
+        print(f"   speedup: {before / after:.2f}x ({before - after:.2f}s saved)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
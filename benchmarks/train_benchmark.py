@@ -0,0 +1,107 @@
+"""Rows per second and peak memory of risk model training, in-memory vs out-of-core.
+
+A synthetic history of --rows rows is generated by resampling
+datasets/data.csv, then each variant trains on it in a fresh interpreter so
+its peak RSS is measured on its own. Models are published to a temporary
+directory, never over models/final_model.sav.
+
+    python benchmarks/train_benchmark.py --rows 1000000
+    python benchmarks/train_benchmark.py --rows 5000000 --memory-mb 64 256 --no-in-memory
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import numpy as np
+import pandas as pd
+
+import train_risk_model
+
+# Executed in a fresh interpreter for every variant
+CHILD_SCRIPT = '''
+import json, sys
+sys.path.insert(0, sys.argv[1])
+import train_risk_model
+kwargs = json.loads(sys.argv[2])
+if kwargs.pop('out_of_core'):
+    manifest = train_risk_model.train_streaming(**kwargs)
+else:
+    manifest = train_risk_model.train(**kwargs)
+print(json.dumps({'training': manifest['training'], 'accuracy': manifest['metrics']['accuracy']}))
+'''
+
+def make_dataset(path, rows, seed=0, chunk_rows=100000):
+    """Write rows resampled from datasets/data.csv to path without holding them all in memory"""
+    columns = train_risk_model.risk_scoring.FEATURE_COLUMNS + [train_risk_model.TARGET_COLUMN]
+    source = pd.read_csv(os.path.join(REPO_ROOT, train_risk_model.DATA_PATH), usecols=columns)[columns]
+    rng = np.random.default_rng(seed)
+    written = 0
+    while written < rows:
+        count = min(chunk_rows, rows - written)
+        source.iloc[rng.integers(0, len(source), count)].to_csv(path, mode='a', header=written == 0, index=False)
+        written += count
+    return path
+
+def sample(label, kwargs):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT, REPO_ROOT, json.dumps(kwargs)],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    wall = time.perf_counter() - started
+    child = json.loads(result.stdout.strip().splitlines()[-1])
+    training = child['training']
+    report = {
+        'label': label,
+        'rows': training['rows'],
+        'seconds': training['total_seconds'],
+        'rows_per_second': training['rows'] / training['total_seconds'],
+        'peak_rss_mb': training['peak_rss_mb'],
+        'holdout_accuracy': child['accuracy'],
+        'process_wall': wall,
+    }
+    print(f"{label:>18}: {report['rows_per_second']:12.0f} rows/s  peak RSS {report['peak_rss_mb']} MB  "
+          f"({report['seconds']:.1f}s, holdout accuracy {report['holdout_accuracy']:.4f})")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure risk model training throughput and peak memory")
+    parser.add_argument('--rows', type=int, default=1000000, help="Rows in the synthetic history")
+    parser.add_argument('--memory-mb', type=int, nargs='+', default=[train_risk_model.TRAIN_MEMORY_MB],
+                        help="Out-of-core memory budgets to measure")
+    parser.add_argument('--epochs', type=int, default=train_risk_model.STREAMING_EPOCHS)
+    parser.add_argument('--no-in-memory', action='store_true',
+                        help="Skip the in-memory baseline (it needs the whole history in RAM)")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = make_dataset(os.path.join(tmp, 'history.csv'), args.rows)
+        print(f"{args.rows} rows, {os.path.getsize(data_path) / 1e6:.0f} MB of CSV")
+        output = os.path.join(tmp, 'model.sav')
+        if not args.no_in_memory:
+            # A single cheap candidate, so the time measured is mostly reading and fitting
+            results.append(sample('in-memory', {
+                'out_of_core': False, 'data_path': data_path, 'output': output,
+                'candidates': ['logistic_regression'], 'folds': 2, 'jobs': 1,
+            }))
+        for memory_mb in args.memory_mb:
+            results.append(sample(f'out-of-core {memory_mb}MB', {
+                'out_of_core': True, 'data_path': data_path, 'output': output,
+                'epochs': args.epochs, 'memory_mb': memory_mb,
+            }))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Risk reports for a whole screening batch.
+
+Reads a scored file (the output of the bulk risk scoring, i.e. the feature
+columns plus 'Predicted Level'), builds one report per scored row and
+renders them in parallel across a process pool. Results are written as they
+arrive, so at most a small window of rendered documents is held in memory:
+
+    python bulk_reports.py scores.csv -o reports.zip                 # one PDF per patient
+    python bulk_reports.py scores.csv -o reports.zip --doc-format docx
+    python bulk_reports.py scores.csv -o reports.pdf --output-format pdf
+
+The zip output streams with constant memory. A merged PDF is rendered in
+parts of PDF_PART_REPORTS patients and joined with pypdf, whose writer keeps
+the merged pages in memory, so very large batches are better served as zip.
+"""
+import argparse
+import importlib.util
+import io
+import logging
+import multiprocessing
+import os
+import re
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import reports
+import risk_scoring
+
+logger = logging.getLogger("bulk_reports")
+
+# ----------------------------------------------------
+# --- BULK REPORT CONFIGURATION ---
+# ----------------------------------------------------
+
+BULK_REPORT_WORKERS = int(os.environ.get('BULK_REPORT_WORKERS', os.cpu_count() or 2))
+# Rendered documents waiting to be written, per worker
+IN_FLIGHT_PER_WORKER = 2
+# Patients per part of a merged PDF
+PDF_PART_REPORTS = 25
+
+DOC_FORMATS = ('pdf', 'docx', 'txt')
+OUTPUT_FORMATS = ('zip', 'pdf')
+MERGE_AVAILABLE = importlib.util.find_spec('pypdf') is not None
+
+# Columns used, when present, to name each patient's report
+ID_COLUMNS = ('Patient Id', 'Patient ID', 'patient_id', 'Name')
+# Anything else in a patient id is replaced in zip member names
+UNSAFE_NAME_CHARS = re.compile(r'[^A-Za-z0-9._-]+')
+MAX_NAME_ID_CHARS = 64
+
+# ----------------------------------------------------
+# --- REPORTS FROM SCORED ROWS ---
+# ----------------------------------------------------
+
+def _patient_id(row, number):
+    for column in ID_COLUMNS:
+        value = str(row.get(column, '')).strip()
+        if value:
+            return value
+    return f"row{number:06d}"
+
+def report_file_name(number, patient_id, doc_format):
+    """Zip member name for one report: the row number keeps names unique, and the id is reduced to
+    characters that are safe in a file name (no path separators, no leading dots)"""
+    safe_id = UNSAFE_NAME_CHARS.sub('_', patient_id)[:MAX_NAME_ID_CHARS].strip('._') or 'patient'
+    return f"{number:06d}_{safe_id}_risk_report.{doc_format}"
+
+def iter_patient_reports(source, fmt, chunk_rows=risk_scoring.CHUNK_ROWS):
+    """Yield (row number, patient id, Report) for every successfully scored row, one chunk in memory at a time"""
+    number = 0
+    for chunk in risk_scoring.iter_chunks(source, fmt, chunk_rows):
+        risk_scoring.check_columns(chunk.columns)
+        if risk_scoring.PREDICTION_COLUMN not in chunk.columns:
+            raise risk_scoring.ScoringError(f"Missing column: {risk_scoring.PREDICTION_COLUMN}. Score the file first.")
+        for row in chunk.to_dict('records'):
+            number += 1
+            level = row[risk_scoring.PREDICTION_COLUMN]
+            error = row.get(risk_scoring.ERROR_COLUMN)
+            # Rows that failed validation were kept in the scored file without a prediction
+            if not isinstance(level, str) or not level.strip() or (isinstance(error, str) and error.strip()):
+                continue
+            level = level.strip()
+            patient_id = _patient_id(row, number)
+            input_data = {key: row[column] for (_, key), column in zip(reports.ML_PARAMETERS, risk_scoring.FEATURE_COLUMNS)}
+            yield number, patient_id, reports.build_ml_report(
+                user_data={}, username=patient_id, input_data=input_data,
+                prediction_result=level, risk_level=level
+            )
+
+# ----------------------------------------------------
+# --- PARALLEL RENDERING ---
+# ----------------------------------------------------
+
+def _render_one(doc_format, report):
+    if doc_format == 'txt':
+        return reports.generate_report_txt(report).encode('utf-8')
+    if doc_format == 'docx':
+        return reports.generate_report_docx(report).getvalue()
+    return reports.generate_report_pdf(report).getvalue()
+
+def _render_part(report_list):
+    return reports.generate_reports_pdf(report_list).getvalue()
+
+def bounded_map(executor, fn, items, window):
+    """Ordered executor.map that never has more than window tasks submitted ahead of the consumer"""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, *item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def _executor(workers):
+    # Spawned so workers never inherit model threads or database connections from the app
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        part = list(islice(iterator, size))
+        if not part:
+            return
+        yield part
+
+def write_zip(patient_reports, out, doc_format='pdf', workers=BULK_REPORT_WORKERS, on_progress=None):
+    """Write one document per patient into a zip archive; out is a path or binary file object"""
+    started = time.perf_counter()
+    written = 0
+    names = deque()
+
+    def tasks():
+        for number, patient_id, report in patient_reports:
+            names.append(report_file_name(number, patient_id, doc_format))
+            yield doc_format, report
+
+    with _executor(workers) as executor, zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for data in bounded_map(executor, _render_one, tasks(), workers * IN_FLIGHT_PER_WORKER):
+            archive.writestr(names.popleft(), data)
+            written += 1
+            if on_progress is not None:
+                on_progress(written)
+    return {'reports': written, 'seconds': time.perf_counter() - started}
+
+def write_merged_pdf(patient_reports, out, workers=BULK_REPORT_WORKERS, part_reports=PDF_PART_REPORTS, on_progress=None):
+    """Write every patient report into a single PDF; out is a path or binary file object"""
+    if not MERGE_AVAILABLE:
+        raise reports.ReportUnavailable("Merged PDF output needs pypdf. Install it or choose zip output.")
+    from pypdf import PdfReader, PdfWriter
+
+    started = time.perf_counter()
+    written = 0
+    writer = PdfWriter()
+    sizes = deque()
+
+    def tasks():
+        for part in _chunked(patient_reports, part_reports):
+            sizes.append(len(part))
+            yield ([report for _, _, report in part],)
+
+    with _executor(workers) as executor:
+        for data in bounded_map(executor, _render_part, tasks(), workers * IN_FLIGHT_PER_WORKER):
+            writer.append(PdfReader(io.BytesIO(data)))
+            written += sizes.popleft()
+            if on_progress is not None:
+                on_progress(written)
+    writer.write(out)
+    return {'reports': written, 'seconds': time.perf_counter() - started}
+
+def generate(source, fmt, out, output_format='zip', doc_format='pdf', workers=BULK_REPORT_WORKERS, on_progress=None):
+    """Render reports for every scored row of source into out; returns a summary with throughput"""
+    patient_reports = iter_patient_reports(source, fmt)
+    if output_format == 'pdf':
+        summary = write_merged_pdf(patient_reports, out, workers, on_progress=on_progress)
+    else:
+        summary = write_zip(patient_reports, out, doc_format, workers, on_progress=on_progress)
+    summary['reports_per_second'] = summary['reports'] / summary['seconds'] if summary['seconds'] else 0.0
+    return summary
+
+# ----------------------------------------------------
+# --- ENTRY POINT ---
+# ----------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Render risk reports for every patient in a scored file")
+    parser.add_argument('source', help="Scored CSV/Parquet file (output of the bulk risk scoring)")
+    parser.add_argument('-o', '--output', required=True, help="Output .zip or .pdf file")
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, help="Default: from the output file extension")
+    parser.add_argument('--doc-format', choices=DOC_FORMATS, default='pdf', help="Document format inside a zip")
+    parser.add_argument('--workers', type=int, default=BULK_REPORT_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    output_format = args.output_format or ('pdf' if args.output.lower().endswith('.pdf') else 'zip')
+    summary = generate(args.source, risk_scoring.file_format(args.source), args.output, output_format,
+                       args.doc_format, args.workers,
+                       on_progress=lambda n: n % 100 == 0 and logger.info("%d reports written", n))
+    logger.info("Wrote %d reports to %s in %.1fs (%.1f reports/s)", summary['reports'], args.output,
+                summary['seconds'], summary['reports_per_second'])
+
+if __name__ == '__main__':
+    main()
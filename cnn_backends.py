@@ -0,0 +1,124 @@
+import os
+
+import numpy as np
+
+# ----------------------------------------------------
+# --- BACKEND CONFIGURATION ---
+# ----------------------------------------------------
+
+# Which runtime serves the CT-scan CNN: keras, tflite or onnx
+CNN_BACKEND = os.environ.get('CNN_BACKEND', 'keras')
+
+# Default model file per backend (written by convert_cnn_model.py)
+DEFAULT_MODEL_PATHS = {
+    'keras': 'cnn model/lungcancer_model_cnn.h5',
+    'tflite': 'cnn model/lungcancer_model_cnn_int8.tflite',
+    'onnx': 'cnn model/lungcancer_model_cnn.onnx',
+}
+
+# Threads used by the TFLite interpreter and ONNX Runtime (None = library default)
+CNN_NUM_THREADS = int(os.environ['CNN_NUM_THREADS']) if os.environ.get('CNN_NUM_THREADS') else None
+
+def default_model_path(backend=CNN_BACKEND):
+    return DEFAULT_MODEL_PATHS[backend]
+
+# ----------------------------------------------------
+# --- INFERENCE BACKENDS ---
+# ----------------------------------------------------
+#
+# Every backend mimics the part of the Keras model API the app uses:
+# ``input_shape`` and ``predict(batch, batch_size=..., verbose=0)`` returning
+# an (N, 1) array of 'Normal' probabilities, so cnn_inference, the CNN page
+# and the inference server work with any of them unchanged.
+
+class TFLiteBackend:
+    """Runs a .tflite export, including int8-quantized models"""
+
+    def __init__(self, path, num_threads=CNN_NUM_THREADS):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        self.path = path
+        self._interpreter = Interpreter(model_path=path, num_threads=num_threads)
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+        self.input_shape = (None,) + tuple(int(d) for d in self._input['shape'][1:])
+
+    def _resize(self, batch_size):
+        if batch_size != self._batch_size:
+            self._interpreter.resize_tensor_input(self._input['index'], [batch_size] + list(self.input_shape[1:]))
+            self._interpreter.allocate_tensors()
+            self._batch_size = batch_size
+
+    def _quantize(self, batch):
+        dtype = self._input['dtype']
+        if dtype == np.float32:
+            return batch.astype(np.float32, copy=False)
+        scale, zero_point = self._input['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, output):
+        if output.dtype == np.float32:
+            return output
+        scale, zero_point = self._output['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch, batch_size=32, verbose=0):
+        batch = np.asarray(batch)
+        outputs = []
+        for start in range(0, len(batch), batch_size):
+            chunk = batch[start:start + batch_size]
+            self._resize(len(chunk))
+            self._interpreter.set_tensor(self._input['index'], self._quantize(chunk))
+            self._interpreter.invoke()
+            outputs.append(self._dequantize(self._interpreter.get_tensor(self._output['index'])).copy())
+        return np.concatenate(outputs) if outputs else np.empty((0, 1), dtype=np.float32)
+
+class OnnxBackend:
+    """Runs an ONNX export with ONNX Runtime on the CPU"""
+
+    def __init__(self, path, num_threads=CNN_NUM_THREADS):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.path = path
+        self._session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        model_input = self._session.get_inputs()[0]
+        self._input_name = model_input.name
+        self.input_shape = (None,) + tuple(d if isinstance(d, int) else None for d in model_input.shape[1:])
+
+    def predict(self, batch, batch_size=32, verbose=0):
+        batch = np.asarray(batch, dtype=np.float32)
+        outputs = [
+            self._session.run(None, {self._input_name: batch[start:start + batch_size]})[0]
+            for start in range(0, len(batch), batch_size)
+        ]
+        return np.concatenate(outputs) if outputs else np.empty((0, 1), dtype=np.float32)
+
+def load_keras(path):
+    # TensorFlow is imported on first use so processes that only need the
+    # tabular model never pay for it
+    from tensorflow.keras.models import load_model
+    return load_model(path)
+
+def load_tflite(path):
+    return TFLiteBackend(path)
+
+def load_onnx(path):
+    return OnnxBackend(path)
+
+BACKEND_LOADERS = {
+    'keras': load_keras,
+    'tflite': load_tflite,
+    'onnx': load_onnx,
+}
+
+def load_backend(backend, path=None):
+    """Load the CNN with the named backend"""
+    if backend not in BACKEND_LOADERS:
+        raise ValueError(f"Unknown CNN backend '{backend}' (expected one of {', '.join(BACKEND_LOADERS)})")
+    return BACKEND_LOADERS[backend](path or default_model_path(backend))
@@ -0,0 +1,369 @@
+"""Probability calibration and risk-band thresholds for the CT-scan CNN.
+
+The model's P(normal) is first calibrated (temperature or Platt scaling on
+its logit), then banded: P(cancer) >= high is High risk, >= medium is
+Medium. Both are fitted per model version on the validation split of the
+training tree (cnn_inference.validation_split, the slices train_cnn held
+out), so ctscan_images/test stays unseen for evaluate_cnn. Only a model
+whose manifest records that same split has really not seen those slices;
+for any other (the shipped notebook model was trained on the whole tree)
+the config is marked overlaps_training and a warning is logged. The
+'decision' cut-off is only used for evaluate_cnn's accuracy; the app
+classifies by the bands. The result is
+saved next to the model file as '<model>.thresholds.json'; the CNN page,
+the inference server and evaluate_cnn read it from there and fall back to
+cnn_inference.DEFAULT_THRESHOLDS when it is missing or was fitted for a
+different version:
+
+    python cnn_calibration.py
+    python cnn_calibration.py --method platt --high-precision 0.9 --medium-sensitivity 0.99
+    CNN_BACKEND=tflite python cnn_calibration.py --data ctscan_images/holdout --subset all
+
+The model runs once per version over the labelled set and its outputs are
+cached beside the tensor store. Every candidate threshold is then scored in
+one vectorized pass over the sorted probabilities, so re-tuning takes
+milliseconds and a new model costs one batched inference pass.
+"""
+import argparse
+import datetime
+import functools
+import json
+import logging
+import os
+
+import numpy as np
+
+import cnn_backends
+import cnn_inference
+import ct_tensor_store
+import model_registry
+
+logger = logging.getLogger("cnn_calibration")
+
+# ----------------------------------------------------
+# --- CALIBRATION CONFIGURATION ---
+# ----------------------------------------------------
+
+CONFIG_FORMAT = 1
+# Labelled tree the thresholds are fitted on, and which of its slices: the held-out
+# validation split (the default, for the training tree) or every slice (a dedicated tree)
+CALIBRATION_DIR = 'ctscan_images/train'
+SUBSETS = ('validation', 'all')
+METHODS = ('temperature', 'platt', 'none')
+
+# Targets for choosing the bands
+HIGH_PRECISION = 0.95       # share of High-risk slices that really are cancer
+MEDIUM_SENSITIVITY = 0.98   # share of cancer slices flagged Medium or High
+THRESHOLD_GRID = np.linspace(0.0, 1.0, 1001)
+
+# Keeps logits finite for outputs of exactly 0 or 1
+EPSILON = 1e-6
+
+DEFAULT_CONFIG = {
+    'format': CONFIG_FORMAT,
+    'model_version': None,
+    'calibration': {'method': 'none'},
+    'thresholds': dict(cnn_inference.DEFAULT_THRESHOLDS),
+    'source': 'default',
+}
+
+def config_path(model_path):
+    return f"{model_path}.thresholds.json"
+
+# ----------------------------------------------------
+# --- LOADING AND APPLYING ---
+# ----------------------------------------------------
+
+@functools.lru_cache(maxsize=16)
+def _read_config(path, model_version, mtime_ns):
+    # mtime_ns is part of the cache key, so a re-tuned file is read again
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable thresholds config %s: %s", path, e)
+        return DEFAULT_CONFIG
+    if config.get('format') != CONFIG_FORMAT or config.get('model_version') != model_version:
+        logger.info("%s was fitted for model version %s, not %s; using default thresholds",
+                    path, config.get('model_version'), model_version)
+        return DEFAULT_CONFIG
+    return dict(config, source=path)
+
+def config_for(model_path, model_version):
+    """Calibration and thresholds for this version of the model, or the defaults"""
+    path = config_path(model_path)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return DEFAULT_CONFIG
+    return _read_config(path, model_version, mtime_ns)
+
+def _logit(prob):
+    prob = np.clip(prob, EPSILON, 1.0 - EPSILON)
+    return np.log(prob) - np.log1p(-prob)
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-z))
+
+def calibrate(prob_normal, calibration):
+    """Calibrated P(normal) for raw model outputs (scalar or array)"""
+    method = calibration.get('method', 'none')
+    if method == 'none':
+        return np.asarray(prob_normal, dtype=np.float64)
+    return _sigmoid(calibration['a'] * _logit(np.asarray(prob_normal, dtype=np.float64)) + calibration['b'])
+
+# ----------------------------------------------------
+# --- FITTING ---
+# ----------------------------------------------------
+
+def fit_scaling(prob_normal, normal, method='temperature', l2=1e-3, iterations=100):
+    """Fit P(normal) = sigmoid(a * logit(p) + b) by Newton's method on the log loss.
+
+    Temperature scaling fixes b = 0 (a = 1 / T); Platt scaling fits both.
+    The small L2 term keeps the fit finite when the set is separable.
+    """
+    if method == 'none':
+        return {'method': 'none'}
+    z = _logit(np.asarray(prob_normal, dtype=np.float64))
+    y = np.asarray(normal, dtype=np.float64)
+    X = np.column_stack([z, np.ones_like(z)]) if method == 'platt' else z[:, None]
+    w = np.zeros(X.shape[1])
+    w[0] = 1.0
+    for _ in range(iterations):
+        p = _sigmoid(X @ w)
+        gradient = X.T @ (p - y) + l2 * w
+        hessian = (X * (p * (1.0 - p))[:, None]).T @ X + l2 * np.eye(len(w))
+        step = np.linalg.solve(hessian, gradient)
+        w -= step
+        if np.max(np.abs(step)) < 1e-9:
+            break
+    calibration = {'method': method, 'a': float(w[0]), 'b': float(w[1]) if method == 'platt' else 0.0}
+    if method == 'temperature':
+        calibration['temperature'] = 1.0 / calibration['a'] if calibration['a'] else None
+    return calibration
+
+def probability_metrics(prob_normal, normal, bins=10):
+    """Log loss, Brier score and expected calibration error of P(normal)"""
+    p = np.clip(np.asarray(prob_normal, dtype=np.float64), EPSILON, 1.0 - EPSILON)
+    y = np.asarray(normal, dtype=np.float64)
+    confidence = np.maximum(p, 1.0 - p)
+    correct = (p >= 0.5) == (y == 1)
+    bin_idx = np.minimum(((confidence - 0.5) * 2 * bins).astype(int), bins - 1)
+    counts = np.bincount(bin_idx, minlength=bins)
+    gap = np.abs(np.bincount(bin_idx, confidence - correct, minlength=bins))
+    return {
+        'log_loss': float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))),
+        'brier': float(np.mean((p - y) ** 2)),
+        'ece': float(gap.sum() / counts.sum()),
+    }
+
+def sweep(prob_cancer, cancer, grid=THRESHOLD_GRID):
+    """Confusion counts and rates of 'prob_cancer >= t' for every t in grid at once.
+
+    Two sorts and two searchsorted calls replace one thresholding pass per
+    candidate value.
+    """
+    prob_cancer = np.asarray(prob_cancer, dtype=np.float64)
+    cancer = np.asarray(cancer, dtype=bool)
+    positives = np.sort(prob_cancer[cancer])
+    negatives = np.sort(prob_cancer[~cancer])
+    tp = len(positives) - np.searchsorted(positives, grid, side='left')
+    fp = len(negatives) - np.searchsorted(negatives, grid, side='left')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), np.nan)
+    return {
+        'threshold': grid,
+        'tp': tp,
+        'fp': fp,
+        'sensitivity': tp / len(positives),
+        'specificity': (len(negatives) - fp) / len(negatives),
+        'precision': precision,
+    }
+
+def choose_thresholds(curve, high_precision=HIGH_PRECISION, medium_sensitivity=MEDIUM_SENSITIVITY):
+    """Risk bands from a sweep.
+
+    high: the lowest threshold whose High band reaches high_precision (the
+    most precise one if none does). medium: the highest threshold that still
+    flags medium_sensitivity of cancer slices, never above high. decision:
+    the threshold maximizing sensitivity + specificity (Youden's J), which
+    evaluate_cnn scores accuracy at; predictions are classified by the bands.
+    """
+    grid = curve['threshold']
+    precise = np.flatnonzero(curve['precision'] >= high_precision)
+    high = grid[precise[0]] if len(precise) else grid[np.nanargmax(curve['precision'])]
+    sensitive = np.flatnonzero(curve['sensitivity'] >= medium_sensitivity)
+    medium = min(grid[sensitive[-1]], high)
+    decision = grid[np.argmax(curve['sensitivity'] + curve['specificity'])]
+    return {'high': float(high), 'medium': float(medium), 'decision': float(decision)}
+
+def band_metrics(curve, thresholds):
+    """Sensitivity, specificity and precision of the sweep at each chosen threshold"""
+    grid = curve['threshold']
+    result = {}
+    for name, value in thresholds.items():
+        idx = int(np.argmin(np.abs(grid - value)))
+        precision = curve['precision'][idx]
+        result[name] = {
+            'sensitivity': float(curve['sensitivity'][idx]),
+            'specificity': float(curve['specificity'][idx]),
+            'precision': None if np.isnan(precision) else float(precision),
+        }
+    return result
+
+# ----------------------------------------------------
+# --- CACHED MODEL OUTPUTS ---
+# ----------------------------------------------------
+
+def subset_indices(labels, subset='validation'):
+    """Store indices of the calibration slices: the validation split, or all of them"""
+    if subset == 'all':
+        return np.arange(len(labels))
+    if subset == 'validation':
+        return cnn_inference.validation_split(labels)[1]
+    raise ValueError(f"Unknown calibration subset '{subset}'")
+
+def training_overlap(model_path, version, data_dir, subset):
+    """True when the model may have been trained on the calibration slices.
+
+    Decided from the model's manifest: the slices are unseen only if it was
+    trained on a different tree, or on this one holding out the same
+    validation split. Without a manifest, the training tree is assumed seen.
+    """
+    training = (model_registry.read_manifest(model_path, version) or {}).get('training')
+    same_tree = os.path.realpath(data_dir) == os.path.realpath((training or {}).get('train_dir', CALIBRATION_DIR))
+    if not same_tree:
+        return False
+    return not (subset == 'validation' and training
+                and training.get('validation_fraction') == cnn_inference.VALIDATION_FRACTION
+                and training.get('split_seed') == cnn_inference.SPLIT_SEED)
+
+def cached_probabilities(backend, model_path, data_dir=CALIBRATION_DIR, batch_size=cnn_inference.DEFAULT_BATCH_SIZE,
+                         subset='validation'):
+    """(raw P(normal), labels, classes, model version) for the subset's slices under data_dir.
+
+    The model only runs when this version has not scored this subset of the store yet.
+    """
+    store = ct_tensor_store.open_store(data_dir)
+    indices = subset_indices(store.labels, subset)
+    labels = store.labels[indices]
+    version = model_registry.file_version(model_path)
+    cache_path = f"{os.path.splitext(store.path)[0]}.{backend}-{version}.{subset}.probs.npz"
+    store_mtime = os.stat(store.path).st_mtime_ns
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if int(cached['store_mtime']) == store_mtime and len(cached['prob_normal']) == len(indices):
+                return cached['prob_normal'], labels, store.classes, version
+
+    logger.info("Scoring %d %s slices from %s with %s version %s", len(indices), subset, data_dir, backend, version)
+    model = cnn_backends.load_backend(backend, model_path)
+    # Sorted indices: each batch reads only its own pages of the memmap
+    prob_normal = np.concatenate([
+        cnn_inference.predict_batch(model, ct_tensor_store.normalize(store.images[indices[start:start + batch_size]]),
+                                    batch_size=batch_size)
+        for start in range(0, len(indices), batch_size)
+    ])
+    tmp_path = f"{cache_path}.tmp.npz"
+    np.savez(tmp_path, prob_normal=prob_normal, store_mtime=store_mtime)
+    os.replace(tmp_path, cache_path)
+    return prob_normal, labels, store.classes, version
+
+# ----------------------------------------------------
+# --- CALIBRATION RUN ---
+# ----------------------------------------------------
+
+def fit_config(prob_normal, normal, method='temperature', high_precision=HIGH_PRECISION,
+               medium_sensitivity=MEDIUM_SENSITIVITY):
+    """Calibration, thresholds and their metrics from raw outputs and labels (no model needed)"""
+    normal = np.asarray(normal, dtype=bool)
+    if normal.all() or not normal.any():
+        raise ValueError("Calibration needs both cancer and normal slices")
+    calibration = fit_scaling(prob_normal, normal, method)
+    calibrated = calibrate(prob_normal, calibration)
+    curve = sweep(1.0 - calibrated, ~normal)
+    thresholds = choose_thresholds(curve, high_precision, medium_sensitivity)
+    return {
+        'calibration': calibration,
+        'thresholds': thresholds,
+        'targets': {'high_precision': high_precision, 'medium_sensitivity': medium_sensitivity},
+        'metrics': {
+            'raw': probability_metrics(prob_normal, normal),
+            'calibrated': probability_metrics(calibrated, normal),
+            'bands': band_metrics(curve, thresholds),
+        },
+    }
+
+def run(backend, model_path, data_dir=CALIBRATION_DIR, method='temperature', high_precision=HIGH_PRECISION,
+        medium_sensitivity=MEDIUM_SENSITIVITY, batch_size=cnn_inference.DEFAULT_BATCH_SIZE, subset='validation'):
+    """Fit and save the thresholds config for the model at model_path; returns it"""
+    prob_normal, labels, classes, version = cached_probabilities(backend, model_path, data_dir, batch_size, subset)
+    config = fit_config(prob_normal, labels == classes.index('normal'), method, high_precision, medium_sensitivity)
+    overlap = training_overlap(model_path, version, data_dir, subset)
+    if overlap:
+        logger.warning("Model version %s may have been trained on the %s slices of %s (no manifest recording the "
+                       "same validation split): the fitted bands are optimistic. Calibrate on a tree it has not "
+                       "seen with --data DIR --subset all.", version, subset, data_dir)
+    config = dict({
+        'format': CONFIG_FORMAT,
+        'model_version': version,
+        'model_path': model_path,
+        'backend': backend,
+        'created_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'data': data_dir,
+        'subset': subset,
+        'split': ({'fraction': cnn_inference.VALIDATION_FRACTION, 'seed': cnn_inference.SPLIT_SEED}
+                  if subset == 'validation' else None),
+        'slices': int(len(labels)),
+        'overlaps_training': overlap,
+    }, **config)
+
+    path = config_path(model_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
+    return config
+
+# ----------------------------------------------------
+# --- ENTRY POINT ---
+# ----------------------------------------------------
+
+def main():
+    default_path, default_backend = model_registry.MODEL_CONFIG['cnn']
+    parser = argparse.ArgumentParser(description="Fit probability calibration and risk thresholds for the CNN")
+    parser.add_argument('--backend', default=default_backend, choices=sorted(cnn_backends.BACKEND_LOADERS))
+    parser.add_argument('--model', help="Model file (default: the configured path for the backend)")
+    parser.add_argument('--data', default=CALIBRATION_DIR, help="Labelled class-per-folder image tree")
+    parser.add_argument('--subset', default='validation', choices=SUBSETS,
+                        help="Slices of --data to fit on: the held-out validation split, or all of them")
+    parser.add_argument('--method', default='temperature', choices=METHODS)
+    parser.add_argument('--high-precision', type=float, default=HIGH_PRECISION,
+                        help="Minimum share of High-risk slices that are cancer")
+    parser.add_argument('--medium-sensitivity', type=float, default=MEDIUM_SENSITIVITY,
+                        help="Minimum share of cancer slices flagged Medium or High")
+    parser.add_argument('--batch-size', type=int, default=cnn_inference.DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    model_path = args.model or (default_path if args.backend == default_backend
+                                else cnn_backends.default_model_path(args.backend))
+    config = run(args.backend, model_path, args.data, args.method, args.high_precision,
+                 args.medium_sensitivity, args.batch_size, args.subset)
+
+    thresholds, metrics = config['thresholds'], config['metrics']
+    print(f"Model {model_path} version {config['model_version']}, {config['slices']} {args.subset} slices "
+          f"of {args.data}, "
+          f"calibration: {config['calibration']}")
+    for stage in ('raw', 'calibrated'):
+        print(f"  {stage:>10}: log loss {metrics[stage]['log_loss']:.4f}  brier {metrics[stage]['brier']:.4f}  "
+              f"ECE {metrics[stage]['ece']:.4f}")
+    for name in ('high', 'medium', 'decision'):
+        band = metrics['bands'][name]
+        precision = '-' if band['precision'] is None else f"{band['precision']:.3f}"
+        print(f"  {name:>10}: P(cancer) >= {thresholds[name]:.3f}  sensitivity {band['sensitivity']:.3f}  "
+              f"specificity {band['specificity']:.3f}  precision {precision}")
+    logger.info("Wrote %s", config_path(model_path))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import io
+import os
+import zipfile
+
+import numpy as np
+from PIL import Image
+
+# ----------------------------------------------------
+# --- CNN INPUT CONFIGURATION ---
+# ----------------------------------------------------
+
+# The CNN was trained on 150x150 RGB slices rescaled to [0, 1]
+IMG_SIZE = (150, 150)
+IMG_CHANNELS = 3
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+DEFAULT_BATCH_SIZE = 32
+
+# Share of each class in the training tree held out for validation and threshold calibration
+VALIDATION_FRACTION = 0.15
+SPLIT_SEED = 42
+
+# Risk bands applied to the cancer probability (1 - model output). These are
+# the fallbacks: cnn_calibration fits replacements per model version.
+HIGH_RISK_THRESHOLD = 0.75
+MEDIUM_RISK_THRESHOLD = 0.25
+# Cancer probability above which a slice counts as cancer for accuracy
+DECISION_THRESHOLD = 0.5
+DEFAULT_THRESHOLDS = {'high': HIGH_RISK_THRESHOLD, 'medium': MEDIUM_RISK_THRESHOLD, 'decision': DECISION_THRESHOLD}
+
+RISK_PREDICTIONS = {
+    "High": "Lung Cancer Case",
+    "Medium": "Requires Further Evaluation",
+    "Low": "Normal Case"
+}
+
+# ----------------------------------------------------
+# --- DECODING AND PREPROCESSING ---
+# ----------------------------------------------------
+
+def decode_uploads(uploaded_files):
+    """Decode uploaded images and zip archives into (file name, PIL image) pairs"""
+    slices = []
+    errors = []
+
+    for uploaded in uploaded_files:
+        name = uploaded.name
+        data = uploaded.getvalue()
+
+        if name.lower().endswith('.zip'):
+            try:
+                with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                    for member in sorted(archive.namelist()):
+                        # Skip folders and macOS resource forks packed into the archive
+                        if member.endswith('/') or member.startswith('__MACOSX'):
+                            continue
+                        if not member.lower().endswith(IMAGE_EXTENSIONS):
+                            continue
+                        try:
+                            img = Image.open(io.BytesIO(archive.read(member)))
+                            slices.append((f"{name}/{member}", img.convert("RGB")))
+                        except Exception as e:
+                            errors.append((f"{name}/{member}", str(e)))
+            except zipfile.BadZipFile as e:
+                errors.append((name, str(e)))
+        else:
+            try:
+                img = Image.open(io.BytesIO(data))
+                slices.append((name, img.convert("RGB")))
+            except Exception as e:
+                errors.append((name, str(e)))
+
+    return slices, errors
+
+def list_labelled_images(root):
+    """(path, label) pairs and class names from a class-per-folder image tree.
+
+    Labels follow Keras' flow_from_directory: classes are the sorted folder
+    names, so the cancer folder is 0 and 'normal' is 1 (the model's output).
+    """
+    classes = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    items = []
+    for label, class_name in enumerate(classes):
+        class_dir = os.path.join(root, class_name)
+        for fname in sorted(os.listdir(class_dir)):
+            if fname.lower().endswith(IMAGE_EXTENSIONS):
+                items.append((os.path.join(class_dir, fname), label))
+    return items, classes
+
+def validation_split(labels, fraction=VALIDATION_FRACTION, seed=SPLIT_SEED):
+    """(training indices, validation indices) of a stratified, seeded split of a labelled tree.
+
+    labels are in list_labelled_images order (also the tensor store's), so the
+    same tree always splits the same way: train_cnn validates on the slices
+    cnn_calibration later fits the risk thresholds on, and neither touches
+    the test tree.
+    """
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    held_out = np.zeros(len(labels), dtype=bool)
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        held_out[rng.permutation(members)[:int(round(len(members) * fraction))]] = True
+    return np.flatnonzero(~held_out), np.flatnonzero(held_out)
+
+def load_image_files(paths):
+    """Open image files from disk as RGB PIL images"""
+    return [Image.open(path).convert("RGB") for path in paths]
+
+def build_batch_tensor(images):
+    """Resize and normalize PIL images into a single (N, 150, 150, 3) float32 tensor"""
+    batch = np.empty((len(images), IMG_SIZE[1], IMG_SIZE[0], IMG_CHANNELS), dtype=np.float32)
+
+    for idx, img in enumerate(images):
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        batch[idx] = np.asarray(img.resize(IMG_SIZE), dtype=np.float32)
+
+    # Normalize the whole tensor in place instead of per image
+    batch *= 1.0 / 255.0
+    return batch
+
+# ----------------------------------------------------
+# --- BATCHED PREDICTION ---
+# ----------------------------------------------------
+
+def predict_batch(model, batch, batch_size=DEFAULT_BATCH_SIZE):
+    """Run a single batched predict call and return the per-slice 'Normal' probabilities"""
+    if len(batch) == 0:
+        return np.empty((0,), dtype=np.float32)
+
+    preds = model.predict(batch, batch_size=batch_size, verbose=0)
+    return np.asarray(preds, dtype=np.float32).reshape(len(batch), -1)[:, 0]
+
+def risk_level_for(prob_cancer, thresholds=None):
+    """Map a cancer probability to the app's High/Medium/Low risk bands"""
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    if prob_cancer >= thresholds['high']:
+        return "High"
+    elif prob_cancer >= thresholds['medium']:
+        return "Medium"
+    return "Low"
+
+def risk_levels(prob_cancer, thresholds=None):
+    """Vectorized risk_level_for over an array of cancer probabilities"""
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    prob_cancer = np.asarray(prob_cancer)
+    return np.select(
+        [prob_cancer >= thresholds['high'], prob_cancer >= thresholds['medium']], ["High", "Medium"], "Low"
+    )
+
+def final_prediction_for(risk_level):
+    """Plain-text prediction label for a risk band"""
+    return RISK_PREDICTIONS[risk_level]
+
+def summarize_study(file_names, prob_normal, thresholds=None):
+    """Build per-slice result rows and a study-level aggregate from batched predictions"""
+    prob_normal = np.asarray(prob_normal, dtype=np.float32)
+    prob_cancer = 1.0 - prob_normal
+
+    rows = [
+        {
+            'Slice': name,
+            'Cancer Confidence': float(pc),
+            'Normal Confidence': float(pn),
+            'Risk Level': risk_level_for(pc, thresholds),
+        }
+        for name, pc, pn in zip(file_names, prob_cancer, prob_normal)
+    ]
+
+    if len(prob_cancer) == 0:
+        return rows, {}
+
+    risk_counts = {level: 0 for level in ("High", "Medium", "Low")}
+    for row in rows:
+        risk_counts[row['Risk Level']] += 1
+
+    # A single suspicious slice is enough to flag the whole study
+    max_idx = int(np.argmax(prob_cancer))
+    summary = {
+        'slices': len(rows),
+        'mean_cancer_confidence': float(prob_cancer.mean()),
+        'max_cancer_confidence': float(prob_cancer[max_idx]),
+        'most_suspicious_slice': rows[max_idx]['Slice'],
+        'risk_counts': risk_counts,
+        'study_risk_level': risk_level_for(prob_cancer[max_idx], thresholds),
+    }
+    return rows, summary
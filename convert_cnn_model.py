@@ -0,0 +1,195 @@
+"""Export the CT-scan CNN for faster CPU inference and check it against Keras.
+
+Run with:
+
+    python convert_cnn_model.py
+    python convert_cnn_model.py --formats fp16 int8 onnx --report "cnn model/conversion_report.json"
+
+Writes next to the source model:
+    lungcancer_model_cnn_fp16.tflite   float16 weights
+    lungcancer_model_cnn_int8.tflite   int8 post-training quantization calibrated on ctscan_images/train
+    lungcancer_model_cnn.onnx          ONNX export (needs tf2onnx)
+
+Every export is then scored on ctscan_images/test next to the Keras model
+(accuracy, agreement and max probability difference) and timed for single
+image latency and batched throughput. Serve an export with e.g.
+``CNN_BACKEND=tflite streamlit run app.py``.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import time
+
+import numpy as np
+
+import cnn_backends
+import cnn_inference
+import ct_tensor_store
+
+logger = logging.getLogger("convert_cnn_model")
+
+CALIBRATION_DIR = 'ctscan_images/train'
+TEST_DIR = 'ctscan_images/test'
+CALIBRATION_SAMPLES = 200
+FORMATS = ('fp16', 'int8', 'onnx')
+
+# ----------------------------------------------------
+# --- EXPORTS ---
+# ----------------------------------------------------
+
+def export_path(model_path, fmt):
+    stem = os.path.splitext(model_path)[0]
+    return f"{stem}.onnx" if fmt == 'onnx' else f"{stem}_{fmt}.tflite"
+
+def calibration_batches(calibration_dir, samples, seed=0):
+    """Representative dataset for int8 calibration: single preprocessed slices"""
+    store = ct_tensor_store.open_store(calibration_dir)
+    indices = list(range(len(store)))
+    random.Random(seed).shuffle(indices)
+    indices = indices[:samples]
+
+    def generator():
+        for idx in indices:
+            yield [ct_tensor_store.normalize(store.images[idx:idx + 1])]
+
+    return generator
+
+def export_tflite(model, output_path, fmt, calibration_dir=CALIBRATION_DIR, calibration_samples=CALIBRATION_SAMPLES):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if fmt == 'fp16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif fmt == 'int8':
+        # Full integer kernels; input and output stay float32 so callers are unchanged
+        converter.representative_dataset = calibration_batches(calibration_dir, calibration_samples)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    else:
+        raise ValueError(f"Unknown TFLite format '{fmt}'")
+
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+    return output_path
+
+def export_onnx(model, output_path):
+    import tensorflow as tf
+    import tf2onnx
+
+    signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='input')]
+    tf2onnx.convert.from_keras(model, input_signature=signature, output_path=output_path)
+    return output_path
+
+# ----------------------------------------------------
+# --- PARITY AND LATENCY ---
+# ----------------------------------------------------
+
+def load_test_set(test_dir):
+    # Decoded once into the tensor store; later runs only map the file
+    store = ct_tensor_store.open_store(test_dir)
+    return ct_tensor_store.normalize(store.images), store.labels, store.classes
+
+def time_backend(model, batch, batch_size, latency_samples=50):
+    """Single-image latency percentiles and batched throughput"""
+    model.predict(batch[:1], batch_size=1, verbose=0)
+
+    latencies = []
+    for idx in range(min(latency_samples, len(batch))):
+        started = time.perf_counter()
+        model.predict(batch[idx:idx + 1], batch_size=1, verbose=0)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    cnn_inference.predict_batch(model, batch, batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'latency_p50_ms': float(np.percentile(latencies, 50)),
+        'latency_p95_ms': float(np.percentile(latencies, 95)),
+        'throughput_images_per_s': float(len(batch) / elapsed),
+    }
+
+def evaluate(name, model, batch, labels, reference, batch_size):
+    """Accuracy on the test set and agreement with the Keras reference probabilities"""
+    prob_normal = cnn_inference.predict_batch(model, batch, batch_size=batch_size)
+    result = {
+        'backend': name,
+        # Output is P(normal) and 'normal' is label 1
+        'accuracy': float(np.mean((prob_normal > 0.5).astype(int) == labels)),
+    }
+    if reference is not None:
+        risk = [cnn_inference.risk_level_for(1.0 - p) for p in prob_normal]
+        reference_risk = [cnn_inference.risk_level_for(1.0 - p) for p in reference]
+        result['max_abs_diff'] = float(np.max(np.abs(prob_normal - reference)))
+        result['label_agreement'] = float(np.mean((prob_normal > 0.5) == (reference > 0.5)))
+        result['risk_band_agreement'] = float(np.mean([a == b for a, b in zip(risk, reference_risk)]))
+    result.update(time_backend(model, batch, batch_size))
+    return result, prob_normal
+
+def print_report(rows):
+    header = f"{'backend':<12}{'size MB':>9}{'acc':>8}{'agree':>8}{'max diff':>10}{'p50 ms':>9}{'p95 ms':>9}{'img/s':>9}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        agree = row.get('label_agreement')
+        diff = row.get('max_abs_diff')
+        print(f"{row['backend']:<12}{row['size_mb']:>9.2f}{row['accuracy']:>8.3f}"
+              f"{'-' if agree is None else f'{agree:.3f}':>8}{'-' if diff is None else f'{diff:.4f}':>10}"
+              f"{row['latency_p50_ms']:>9.2f}{row['latency_p95_ms']:>9.2f}{row['throughput_images_per_s']:>9.1f}")
+
+# ----------------------------------------------------
+# --- ENTRY POINT ---
+# ----------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the CT-scan CNN to TFLite/ONNX and compare backends")
+    parser.add_argument('--model', default=cnn_backends.DEFAULT_MODEL_PATHS['keras'], help="Source Keras .h5 model")
+    parser.add_argument('--formats', nargs='+', default=['fp16', 'int8'], choices=FORMATS)
+    parser.add_argument('--calibration-dir', default=CALIBRATION_DIR)
+    parser.add_argument('--calibration-samples', type=int, default=CALIBRATION_SAMPLES)
+    parser.add_argument('--test-dir', default=TEST_DIR)
+    parser.add_argument('--batch-size', type=int, default=cnn_inference.DEFAULT_BATCH_SIZE)
+    parser.add_argument('--skip-eval', action='store_true', help="Only write the exports")
+    parser.add_argument('--report', help="Write the comparison as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    model = cnn_backends.load_keras(args.model)
+    exports = {}
+    for fmt in args.formats:
+        output_path = export_path(args.model, fmt)
+        if fmt == 'onnx':
+            export_onnx(model, output_path)
+        else:
+            export_tflite(model, output_path, fmt, args.calibration_dir, args.calibration_samples)
+        exports[fmt] = output_path
+        logger.info("Wrote %s (%.2f MB)", output_path, os.path.getsize(output_path) / 1e6)
+
+    if args.skip_eval:
+        return
+
+    batch, labels, classes = load_test_set(args.test_dir)
+    logger.info("Evaluating on %d test slices (classes: %s)", len(batch), ', '.join(classes))
+
+    row, reference = evaluate('keras', model, batch, labels, None, args.batch_size)
+    row['size_mb'] = os.path.getsize(args.model) / 1e6
+    rows = [row]
+    for fmt, path in exports.items():
+        runtime = 'onnx' if fmt == 'onnx' else 'tflite'
+        backend = cnn_backends.load_backend(runtime, path)
+        name = runtime if fmt == 'onnx' else f"tflite-{fmt}"
+        row, _ = evaluate(name, backend, batch, labels, reference, args.batch_size)
+        row['size_mb'] = os.path.getsize(path) / 1e6
+        row['path'] = path
+        rows.append(row)
+
+    print_report(rows)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'test_dir': args.test_dir, 'slices': len(batch), 'backends': rows}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
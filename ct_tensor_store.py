@@ -0,0 +1,171 @@
+"""Pre-decoded CT-scan tensors for evaluation, retraining and batch inference.
+
+Converts a class-per-folder image tree (e.g. ctscan_images/train) into one
+memory-mapped uint8 array of shape (N, 150, 150, 3) plus a JSON index of
+file names, labels and class names. Later runs open the array with
+np.load(mmap_mode='r') and slice it without decoding a single PNG; the
+store is rebuilt only when files under the tree are added, removed or
+changed.
+
+    python ct_tensor_store.py ctscan_images/train ctscan_images/test
+    python ct_tensor_store.py ctscan_images/test --force
+
+Pixels are resized exactly like cnn_inference.build_batch_tensor, so
+normalize(store.images[a:b]) equals the tensor built from the same files.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import cnn_inference
+
+logger = logging.getLogger("ct_tensor_store")
+
+# ----------------------------------------------------
+# --- STORE CONFIGURATION ---
+# ----------------------------------------------------
+
+TENSOR_DIR = os.environ.get('CT_TENSOR_DIR', 'ctscan_images/.tensors')
+DECODE_WORKERS = min(8, os.cpu_count() or 2)
+INDEX_VERSION = 1
+
+def store_paths(root, tensor_dir=TENSOR_DIR):
+    """(array path, index path) of the store built from root"""
+    name = os.path.normpath(root).strip(os.sep).replace(os.sep, '__')
+    return os.path.join(tensor_dir, f"{name}.npy"), os.path.join(tensor_dir, f"{name}.json")
+
+def _signature(root, items):
+    # Relative path, size and mtime of every source image; any difference forces a rebuild
+    signature = []
+    for path, _ in items:
+        stat = os.stat(path)
+        signature.append([os.path.relpath(path, root), stat.st_size, stat.st_mtime_ns])
+    return signature
+
+# ----------------------------------------------------
+# --- BUILDING ---
+# ----------------------------------------------------
+
+def _decode_into(images, idx, path):
+    with Image.open(path) as img:
+        # PIL releases the GIL while decoding and resizing, so threads scale here
+        images[idx] = np.asarray(img.convert("RGB").resize(cnn_inference.IMG_SIZE), dtype=np.uint8)
+
+def build(root, tensor_dir=TENSOR_DIR, workers=DECODE_WORKERS):
+    """Decode every image under root into a new store and return it opened"""
+    items, classes = cnn_inference.list_labelled_images(root)
+    if not items:
+        raise ValueError(f"No images found under {root}")
+    array_path, index_path = store_paths(root, tensor_dir)
+    os.makedirs(tensor_dir, exist_ok=True)
+    shape = (len(items), cnn_inference.IMG_SIZE[1], cnn_inference.IMG_SIZE[0], cnn_inference.IMG_CHANNELS)
+
+    started = time.perf_counter()
+    tmp_array = f"{array_path}.tmp.npy"
+    images = np.lib.format.open_memmap(tmp_array, mode='w+', dtype=np.uint8, shape=shape)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() surfaces the first decoding error
+        list(executor.map(lambda job: _decode_into(images, *job), ((idx, path) for idx, (path, _) in enumerate(items))))
+    images.flush()
+    del images
+
+    index = {
+        'version': INDEX_VERSION,
+        'root': root,
+        'classes': classes,
+        'image_size': list(cnn_inference.IMG_SIZE),
+        'paths': [os.path.relpath(path, root) for path, _ in items],
+        'labels': [label for _, label in items],
+        'signature': _signature(root, items),
+    }
+    tmp_index = f"{index_path}.tmp"
+    with open(tmp_index, 'w') as f:
+        json.dump(index, f)
+    # Array first, then the index that validates it
+    os.replace(tmp_array, array_path)
+    os.replace(tmp_index, index_path)
+    logger.info("Built %s: %d images in %.1fs (%.1f MB)", array_path, len(items),
+                time.perf_counter() - started, os.path.getsize(array_path) / 1e6)
+    return TensorStore(array_path, index)
+
+# ----------------------------------------------------
+# --- READING ---
+# ----------------------------------------------------
+
+class TensorStore:
+    """Read-only view of a built store.
+
+    ``images`` is a uint8 memmap: slicing it reads only the pages touched and
+    copies nothing. ``labels`` and ``paths`` are aligned with it.
+    """
+
+    def __init__(self, array_path, index):
+        self.path = array_path
+        self.images = np.load(array_path, mmap_mode='r')
+        self.labels = np.asarray(index['labels'], dtype=np.int64)
+        self.paths = index['paths']
+        self.classes = index['classes']
+        self.root = index['root']
+
+    def __len__(self):
+        return len(self.labels)
+
+    def iter_batches(self, batch_size=cnn_inference.DEFAULT_BATCH_SIZE):
+        """Yield (uint8 image view, labels) in file order"""
+        for start in range(0, len(self), batch_size):
+            yield self.images[start:start + batch_size], self.labels[start:start + batch_size]
+
+def normalize(images):
+    """float32 model input in [0, 1] from uint8 images (same values as build_batch_tensor)"""
+    batch = np.asarray(images, dtype=np.float32)
+    batch *= 1.0 / 255.0
+    return batch
+
+def _load_index(index_path):
+    try:
+        with open(index_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def open_store(root, tensor_dir=TENSOR_DIR, rebuild=False, workers=DECODE_WORKERS):
+    """Open the store for root, building it first if it is missing or out of date"""
+    array_path, index_path = store_paths(root, tensor_dir)
+    index = None if rebuild else _load_index(index_path)
+    if index is not None and index.get('version') == INDEX_VERSION and os.path.exists(array_path):
+        items, _ = cnn_inference.list_labelled_images(root)
+        if index['image_size'] == list(cnn_inference.IMG_SIZE) and index['signature'] == _signature(root, items):
+            return TensorStore(array_path, index)
+        logger.info("%s changed since %s was built; rebuilding", root, array_path)
+    return build(root, tensor_dir, workers)
+
+# ----------------------------------------------------
+# --- ENTRY POINT ---
+# ----------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-decode CT-scan image folders into memory-mapped tensors")
+    parser.add_argument('roots', nargs='+', help="Class-per-folder image trees, e.g. ctscan_images/train")
+    parser.add_argument('--tensor-dir', default=TENSOR_DIR)
+    parser.add_argument('--workers', type=int, default=DECODE_WORKERS)
+    parser.add_argument('--force', action='store_true', help="Rebuild even if the store is up to date")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    for root in args.roots:
+        started = time.perf_counter()
+        store = open_store(root, args.tensor_dir, rebuild=args.force, workers=args.workers)
+        counts = np.bincount(store.labels, minlength=len(store.classes))
+        print(f"{root}: {len(store)} images {tuple(store.images.shape)} in {time.perf_counter() - started:.2f}s -> {store.path}")
+        for class_name, count in zip(store.classes, counts):
+            print(f"  {class_name}: {count}")
+
+if __name__ == '__main__':
+    main()
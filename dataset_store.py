@@ -0,0 +1,112 @@
+import importlib.util
+import glob
+import os
+import threading
+
+import pandas as pd
+
+# ----------------------------------------------------
+# --- DATASET CONFIGURATION ---
+# ----------------------------------------------------
+
+# name -> (csv path, read_csv keyword arguments)
+DATASETS = {
+    'data': ('datasets/data.csv', {}),
+    'train': ('datasets/train.csv', {'index_col': 0}),
+    'trainy': ('datasets/trainy.csv', {'index_col': 0}),
+    'testx': ('datasets/testx.csv', {'index_col': 0}),
+    'testy': ('datasets/testy.csv', {'index_col': 0}),
+}
+
+LEVEL_CATEGORIES = ['Low', 'Medium', 'High']
+
+# Columnar copies of the parsed frames (needs pyarrow; set to '' to disable)
+SIDECAR_DIR = os.environ.get('DATASET_CACHE_DIR', 'datasets/.cache')
+SIDECAR_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+_INDEX_COLUMN = '__index__'
+
+# ----------------------------------------------------
+# --- PARSING ---
+# ----------------------------------------------------
+
+def compact_dtypes(frame):
+    """Downcast integer columns (the 1-9 scales and Age fit int8) and make Level a category"""
+    for column in frame.columns:
+        if column == 'Level':
+            frame[column] = pd.Categorical(frame[column], categories=LEVEL_CATEGORIES, ordered=True)
+        elif pd.api.types.is_integer_dtype(frame[column]):
+            frame[column] = pd.to_numeric(frame[column], downcast='integer')
+    if pd.api.types.is_integer_dtype(frame.index):
+        frame.index = pd.Index(pd.to_numeric(frame.index, downcast='integer'), name=frame.index.name)
+    return frame
+
+def _sidecar_path(name, stat):
+    # The source file's mtime and size are part of the name, so an edited CSV
+    # never matches an old sidecar
+    return os.path.join(SIDECAR_DIR, f"{name}-{stat.st_mtime_ns}-{stat.st_size}.feather")
+
+def _read_sidecar(path):
+    frame = pd.read_feather(path)
+    return frame.set_index(_INDEX_COLUMN).rename_axis(None)
+
+def _write_sidecar(name, path, frame):
+    os.makedirs(SIDECAR_DIR, exist_ok=True)
+    # Drop sidecars of older versions of this dataset
+    for stale in glob.glob(os.path.join(SIDECAR_DIR, f"{name}-*.feather")):
+        os.remove(stale)
+    tmp_path = f"{path}.tmp"
+    frame.rename_axis(_INDEX_COLUMN).reset_index().to_feather(tmp_path)
+    os.replace(tmp_path, path)
+
+def _parse(name, stat):
+    csv_path, read_kwargs = DATASETS[name]
+    use_sidecar = SIDECAR_AVAILABLE and bool(SIDECAR_DIR)
+    sidecar = _sidecar_path(name, stat) if use_sidecar else None
+
+    if sidecar and os.path.exists(sidecar):
+        try:
+            return _read_sidecar(sidecar)
+        except Exception:
+            pass  # Unreadable sidecar: fall back to the CSV and rewrite it
+
+    frame = compact_dtypes(pd.read_csv(csv_path, **read_kwargs))
+    if sidecar:
+        try:
+            _write_sidecar(name, sidecar, frame)
+        except OSError:
+            pass
+    return frame
+
+# ----------------------------------------------------
+# --- CACHED ACCESS ---
+# ----------------------------------------------------
+
+_cache = {}
+_lock = threading.Lock()
+
+def load(name):
+    """Parsed, compactly typed dataset, re-read only when the CSV changes on disk.
+
+    The same DataFrame is shared by every caller (and every Streamlit
+    session), so treat it as read-only: copy before modifying it.
+    Raises FileNotFoundError when the CSV is missing, like pd.read_csv.
+    """
+    csv_path, _ = DATASETS[name]
+    stat = os.stat(csv_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _cache.get(name)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    with _lock:
+        cached = _cache.get(name)
+        if cached is None or cached[0] != signature:
+            cached = (signature, _parse(name, stat))
+            _cache[name] = cached
+    return cached[1]
+
+def memory_usage(name):
+    """Deep memory footprint of a loaded dataset in bytes"""
+    return int(load(name).memory_usage(deep=True).sum())
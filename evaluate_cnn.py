@@ -0,0 +1,238 @@
+"""Quality and speed of the configured CT-scan CNN on ctscan_images/test.
+
+Loads the model the app serves (model_registry.MODEL_CONFIG['cnn'], i.e.
+CNN_BACKEND / CNN_MODEL_PATH, or --backend / --model), scores every test
+slice from the tensor store in batches and writes one JSON artifact per
+model version:
+
+    python evaluate_cnn.py
+    CNN_BACKEND=tflite python evaluate_cnn.py --batch-size 64
+    python evaluate_cnn.py --compare "cnn model/evaluations/*.json"
+
+Quality: accuracy at the decision threshold, ROC-AUC, and the confusion
+matrix of true class against the app's High/Medium/Low risk bands, all after
+the model's calibration (cnn_calibration.config_for). A calibration fitted
+on the tree being evaluated is flagged (calibration.overlaps_test) and
+warned about, since its bands were tuned on the same slices; so is one
+fitted on slices the model was trained on (calibration.overlaps_training). Speed: batched
+images/s, single-slice latency percentiles, model load time and the peak
+RSS of the process.
+"""
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+import cnn_backends
+import cnn_calibration
+import cnn_inference
+import ct_tensor_store
+import model_registry
+from process_stats import peak_rss_mb
+
+logger = logging.getLogger("evaluate_cnn")
+
+TEST_DIR = 'ctscan_images/test'
+EVALUATION_DIR = 'cnn model/evaluations'
+LATENCY_SAMPLES = 100
+RISK_BANDS = ("High", "Medium", "Low")
+
+# ----------------------------------------------------
+# --- QUALITY METRICS ---
+# ----------------------------------------------------
+
+def roc_auc(positive, scores):
+    """Area under the ROC curve from ranks (Mann-Whitney U), ties averaged"""
+    positive = np.asarray(positive, dtype=bool)
+    scores = np.asarray(scores, dtype=np.float64)
+    n_pos = int(positive.sum())
+    n_neg = len(positive) - n_pos
+    if not n_pos or not n_neg:
+        return None
+    order = np.argsort(scores, kind='mergesort')
+    _, first, counts = np.unique(scores[order], return_index=True, return_counts=True)
+    ranks = np.empty(len(scores))
+    ranks[order] = np.repeat(first + (counts + 1) / 2.0, counts)
+    return float((ranks[positive].sum() - n_pos * (n_pos + 1) / 2.0) / (n_pos * n_neg))
+
+def quality_metrics(prob_normal, labels, classes, thresholds=None):
+    """Accuracy, ROC-AUC and the class x risk band confusion matrix"""
+    thresholds = thresholds or cnn_inference.DEFAULT_THRESHOLDS
+    normal = labels == classes.index('normal')
+    prob_cancer = 1.0 - prob_normal
+    bands = cnn_inference.risk_levels(prob_cancer, thresholds)
+    matrix = [[int(np.sum(bands[rows] == band)) for band in RISK_BANDS] for rows in (~normal, normal)]
+    cancer_total, normal_total = int((~normal).sum()), int(normal.sum())
+    return {
+        'accuracy': float(np.mean((prob_cancer < thresholds['decision']) == normal)),
+        'roc_auc': roc_auc(~normal, prob_cancer),
+        'thresholds': dict(thresholds),
+        'risk_bands': {
+            'rows': ['Cancer', 'Normal'],
+            'columns': list(RISK_BANDS),
+            'matrix': matrix,
+        },
+        # Cancer slices flagged High, and flagged at least Medium; normal slices left Low
+        'high_sensitivity': matrix[0][0] / cancer_total if cancer_total else None,
+        'flagged_sensitivity': (matrix[0][0] + matrix[0][1]) / cancer_total if cancer_total else None,
+        'low_specificity': matrix[1][2] / normal_total if normal_total else None,
+    }
+
+def calibration_overlaps(config, test_dir):
+    """True when the thresholds config was fitted on slices of test_dir"""
+    data = config.get('data')
+    return bool(data) and os.path.realpath(data) == os.path.realpath(test_dir)
+
+# ----------------------------------------------------
+# --- SPEED ---
+# ----------------------------------------------------
+
+def score_store(model, store, batch_size):
+    """P(normal) for every slice, batch by batch, plus the time of each batch call"""
+    prob_normal = np.empty(len(store), dtype=np.float32)
+    batch_seconds = []
+    offset = 0
+    for images, _ in store.iter_batches(batch_size):
+        batch = ct_tensor_store.normalize(images)
+        started = time.perf_counter()
+        prob_normal[offset:offset + len(batch)] = cnn_inference.predict_batch(model, batch, batch_size=batch_size)
+        batch_seconds.append(time.perf_counter() - started)
+        offset += len(batch)
+    return prob_normal, batch_seconds
+
+def single_latency(model, store, samples=LATENCY_SAMPLES):
+    """Latency percentiles of one-slice predict calls, the app's single upload case"""
+    latencies = []
+    for idx in range(min(samples, len(store))):
+        batch = ct_tensor_store.normalize(store.images[idx:idx + 1])
+        started = time.perf_counter()
+        cnn_inference.predict_batch(model, batch, batch_size=1)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {f'p{q}': float(np.percentile(latencies, q)) for q in (50, 95, 99)}
+
+# ----------------------------------------------------
+# --- EVALUATION RUN ---
+# ----------------------------------------------------
+
+def evaluate(backend, model_path, test_dir=TEST_DIR, batch_size=cnn_inference.DEFAULT_BATCH_SIZE,
+             latency_samples=LATENCY_SAMPLES):
+    """Score one model on the test tree and return the evaluation artifact"""
+    store = ct_tensor_store.open_store(test_dir)
+
+    started = time.perf_counter()
+    model = cnn_backends.load_backend(backend, model_path)
+    load_seconds = time.perf_counter() - started
+    # Warm-up outside the timings (graph tracing, interpreter allocation)
+    cnn_inference.predict_batch(model, ct_tensor_store.normalize(store.images[:1]), batch_size=1)
+
+    prob_normal, batch_seconds = score_store(model, store, batch_size)
+    total_seconds = sum(batch_seconds)
+    version = model_registry.file_version(model_path)
+    config = cnn_calibration.config_for(model_path, version)
+    overlap = calibration_overlaps(config, test_dir)
+    if overlap:
+        logger.warning("The thresholds in %s were fitted on %s, the tree being evaluated: risk band metrics are "
+                       "optimistic. Re-run cnn_calibration.py on the training split.", config['source'], test_dir)
+    if config.get('overlaps_training'):
+        logger.warning("The thresholds in %s were fitted on slices the model may have been trained on: risk band "
+                       "metrics are optimistic. Re-run cnn_calibration.py on a tree it has not seen.", config['source'])
+    return {
+        'model': {
+            'backend': backend,
+            'path': model_path,
+            'version': version,
+            'size_bytes': os.path.getsize(model_path),
+            'manifest': model_registry.read_manifest(model_path, version),
+        },
+        'evaluated_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'test_dir': test_dir,
+        'slices': len(store),
+        'classes': store.classes,
+        'calibration': dict(config['calibration'], source=config['source'], data=config.get('data'),
+                            subset=config.get('subset'), overlaps_test=overlap,
+                            overlaps_training=bool(config.get('overlaps_training'))),
+        'quality': quality_metrics(cnn_calibration.calibrate(prob_normal, config['calibration']),
+                                   store.labels, store.classes, config['thresholds']),
+        'speed': {
+            'batch_size': batch_size,
+            'images_per_second': len(store) / total_seconds if total_seconds else None,
+            'batch_latency_ms': {f'p{q}': float(np.percentile(batch_seconds, q) * 1000) for q in (50, 95, 99)},
+            'single_latency_ms': single_latency(model, store, latency_samples),
+            'load_seconds': load_seconds,
+            'peak_rss_mb': peak_rss_mb(),
+        },
+    }
+
+def artifact_path(result, evaluation_dir=EVALUATION_DIR):
+    return os.path.join(evaluation_dir, f"{result['model']['backend']}-{result['model']['version']}.json")
+
+def print_rows(results):
+    header = (f"{'backend':<8}{'version':<14}{'acc':>7}{'auc':>7}{'high sens':>10}{'low spec':>10}"
+              f"{'img/s':>9}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}{'RSS MB':>8}")
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        quality, speed = result['quality'], result['speed']
+        latency = speed['single_latency_ms']
+        auc = quality['roc_auc']
+        print(f"{result['model']['backend']:<8}{result['model']['version']:<14}{quality['accuracy']:>7.3f}"
+              f"{'-' if auc is None else f'{auc:.3f}':>7}{quality['high_sensitivity'] or 0:>10.3f}"
+              f"{quality['low_specificity'] or 0:>10.3f}{speed['images_per_second'] or 0:>9.1f}"
+              f"{latency['p50']:>8.2f}{latency['p95']:>8.2f}{latency['p99']:>8.2f}{speed['peak_rss_mb'] or 0:>8.0f}"
+              f"{'  *' if result['calibration'].get('overlaps_test') else ''}"
+              f"{'  +' if result['calibration'].get('overlaps_training') else ''}")
+    if any(result['calibration'].get('overlaps_test') for result in results):
+        print("* thresholds calibrated on the evaluated slices; band metrics are optimistic")
+    if any(result['calibration'].get('overlaps_training') for result in results):
+        print("+ thresholds calibrated on slices the model was trained on; band metrics are optimistic")
+
+# ----------------------------------------------------
+# --- ENTRY POINT ---
+# ----------------------------------------------------
+
+def main():
+    default_path, default_backend = model_registry.MODEL_CONFIG['cnn']
+    parser = argparse.ArgumentParser(description="Evaluate the CT-scan CNN on the test set for quality and speed")
+    parser.add_argument('--backend', default=default_backend, choices=sorted(cnn_backends.BACKEND_LOADERS))
+    parser.add_argument('--model', help="Model file (default: the configured path for the backend)")
+    parser.add_argument('--test-dir', default=TEST_DIR)
+    parser.add_argument('--batch-size', type=int, default=cnn_inference.DEFAULT_BATCH_SIZE)
+    parser.add_argument('--latency-samples', type=int, default=LATENCY_SAMPLES)
+    parser.add_argument('--output', help=f"JSON artifact (default: {EVALUATION_DIR}/<backend>-<version>.json)")
+    parser.add_argument('--compare', nargs='+', metavar='ARTIFACT',
+                        help="Print earlier artifacts side by side instead of evaluating")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.compare:
+        paths = sorted({path for pattern in args.compare for path in glob.glob(pattern)})
+        results = []
+        for path in paths:
+            with open(path) as f:
+                results.append(json.load(f))
+        print_rows(results)
+        return
+
+    model_path = args.model or (default_path if args.backend == default_backend
+                                else cnn_backends.default_model_path(args.backend))
+    result = evaluate(args.backend, model_path, args.test_dir, args.batch_size, args.latency_samples)
+    output = args.output or artifact_path(result)
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print_rows([result])
+    matrix = result['quality']['risk_bands']
+    print(f"\n{'':<8}" + "".join(f"{band:>8}" for band in matrix['columns']))
+    for name, row in zip(matrix['rows'], matrix['matrix']):
+        print(f"{name:<8}" + "".join(f"{count:>8}" for count in row))
+    logger.info("Wrote %s", output)
+
+if __name__ == '__main__':
+    main()
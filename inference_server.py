@@ -0,0 +1,512 @@
+"""Headless inference service for the lung cancer risk (ML) and CT-scan (CNN) models.
+
+Run with:
+
+    python inference_server.py --port 8502
+
+Endpoints:
+    GET  /health            model load status, versions and metadata
+    GET  /metrics           user and appointment counters (Prometheus text format)
+    GET  /metrics.json      the same counters plus rolling activity windows as JSON
+    POST /models/<name>/reload  hot-swap a model from its file
+    POST /predict/risk      {"features": [17 values]} or {"instances": [[...], ...]}
+    POST /predict/ctscan    {"image": "<base64>"} / {"images": [...]} or a raw image body
+"""
+import argparse
+import base64
+import io
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+from PIL import Image
+
+import cnn_backends
+import cnn_calibration
+import cnn_inference
+import metrics
+import model_registry
+import risk_scoring
+import storage
+
+logger = logging.getLogger("inference_server")
+
+# ----------------------------------------------------
+# --- CONFIGURATION ---
+# ----------------------------------------------------
+
+ML_MODEL_PATH = model_registry.MODEL_CONFIG['risk'][0]
+CNN_MODEL_PATH = model_registry.MODEL_CONFIG['cnn'][0]
+
+# Column order expected by models/final_model.sav (same as datasets/testx.csv)
+RISK_FEATURES = risk_scoring.FEATURE_COLUMNS
+
+MAX_BODY_BYTES = 20 * 1024 * 1024
+# Seconds a connection may sit idle or stall mid-request before its worker drops it
+REQUEST_TIMEOUT = 30.0
+
+class RequestError(Exception):
+    """Raised for malformed client requests (mapped to HTTP 400)"""
+
+class ServiceUnavailable(Exception):
+    """Raised when a model is not loaded or the server is saturated (mapped to HTTP 503)"""
+
+# ----------------------------------------------------
+# --- REQUEST BATCHING ---
+# ----------------------------------------------------
+
+class MicroBatcher:
+    """Collects concurrent single requests into one batched model call.
+
+    Callers submit one input and block on a Future. A background thread
+    drains the queue until ``max_batch_size`` items are collected or
+    ``max_wait_ms`` has passed since the first one, then runs ``predict_fn``
+    once on the stacked batch and resolves every Future with its own row.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5, name="batcher"):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queue a single input and return a Future for its prediction"""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            inputs = [item for item, _ in items]
+            futures = [future for _, future in items]
+            try:
+                outputs = self.predict_fn(inputs)
+                for future, output in zip(futures, outputs):
+                    future.set_result(output)
+            except Exception as e:
+                logger.exception("Batched prediction failed")
+                for future in futures:
+                    future.set_exception(e)
+
+# ----------------------------------------------------
+# --- INFERENCE SERVICE ---
+# ----------------------------------------------------
+
+class InferenceService:
+    """Serves the registry's models through batchers for the lifetime of the process"""
+
+    def __init__(self, ml_model_path=ML_MODEL_PATH, cnn_model_path=CNN_MODEL_PATH,
+                 max_batch_size=32, max_wait_ms=5, request_timeout=30.0, registry=None,
+                 cnn_backend=cnn_backends.CNN_BACKEND, db_path=storage.DB_PATH):
+        self.request_timeout = request_timeout
+        self.db_path = db_path
+        self._db_pool = None
+        self._db_lock = threading.Lock()
+        if registry is None:
+            registry = model_registry.ModelRegistry({
+                'risk': (ml_model_path, 'sklearn'),
+                'cnn': (cnn_model_path, cnn_backend),
+            })
+            # Load and warm both models before the first request is accepted
+            registry.load_all()
+        self.registry = registry
+
+        self.risk_batcher = MicroBatcher(self._predict_risk_batch, max_batch_size, max_wait_ms, "risk-batcher")
+        self.ct_batcher = MicroBatcher(self._predict_ct_batch, max_batch_size, max_wait_ms, "ctscan-batcher")
+
+    # Read through the registry on every batch so hot-swapped models are used immediately
+    @property
+    def ml_model(self):
+        return self.registry.get('risk')
+
+    @property
+    def cnn_model(self):
+        return self.registry.get('cnn')
+
+    def health(self):
+        """Report load status, version and metadata of each model"""
+        return self.registry.health()
+
+    def reload_model(self, name):
+        """Hot-swap a model from its file without restarting the server"""
+        if name not in self.registry.names():
+            raise RequestError(f"Unknown model '{name}'")
+        if not self.registry.reload(name):
+            raise ServiceUnavailable(self.registry.metadata(name).get('error') or f"Could not reload '{name}'")
+        return self.registry.metadata(name)
+
+    def metrics_snapshot(self):
+        """Read the app's running counters from its SQLite database"""
+        if not os.path.exists(self.db_path):
+            raise ServiceUnavailable(f"Database '{self.db_path}' not found")
+        with self._db_lock:
+            if self._db_pool is None:
+                self._db_pool = storage.ConnectionPool(self.db_path, size=1)
+        try:
+            with self._db_pool.connection() as conn:
+                return metrics.snapshot(conn)
+        except sqlite3.OperationalError as e:
+            # Tables are created by the app on first start
+            raise ServiceUnavailable(f"Metrics unavailable: {e}")
+
+    # --- batched model calls (run on the batcher threads) ---
+
+    def _predict_risk_batch(self, rows):
+        model = self.ml_model
+        features = np.vstack(rows)
+        labels = model.predict(features)
+        probas = None
+        if hasattr(model, 'predict_proba'):
+            try:
+                probas = model.predict_proba(features)
+            except Exception:
+                probas = None
+
+        results = []
+        for idx, label in enumerate(labels):
+            result = {'risk_level': str(label)}
+            if probas is not None:
+                result['probabilities'] = {
+                    str(cls): float(p) for cls, p in zip(model.classes_, probas[idx])
+                }
+            results.append(result)
+        return results
+
+    def _predict_ct_batch(self, images):
+        # One read for both, so a batch running during a hot-swap uses the thresholds of the model that scored it
+        model, version = self.registry.get_with_version('cnn')
+        if model is None:
+            raise ServiceUnavailable("CT-scan model is not loaded")
+        batch = cnn_inference.build_batch_tensor(images)
+        prob_normal = cnn_inference.predict_batch(model, batch, batch_size=len(images))
+        # Same calibration and risk bands as the CNN page
+        config = cnn_calibration.config_for(self.registry.metadata('cnn')['path'], version)
+        prob_normal = cnn_calibration.calibrate(prob_normal, config['calibration'])
+
+        results = []
+        for pn in prob_normal:
+            prob_cancer = 1.0 - float(pn)
+            risk_level = cnn_inference.risk_level_for(prob_cancer, config['thresholds'])
+            results.append({
+                'cancer_confidence': prob_cancer,
+                'normal_confidence': float(pn),
+                'risk_level': risk_level,
+                'final_prediction': cnn_inference.final_prediction_for(risk_level)
+            })
+        return results
+
+    # --- request level API ---
+
+    def _gather(self, futures):
+        try:
+            return [future.result(timeout=self.request_timeout) for future in futures]
+        except FutureTimeoutError:
+            raise ServiceUnavailable("Prediction timed out")
+
+    def predict_risk(self, payload):
+        """Score one or more 17-feature rows"""
+        if self.ml_model is None:
+            raise ServiceUnavailable("Risk model is not loaded")
+
+        if 'instances' in payload:
+            instances = payload['instances']
+        elif 'features' in payload:
+            instances = [payload['features']]
+        else:
+            raise RequestError("Expected 'features' or 'instances' in request body")
+
+        if not isinstance(instances, list) or not instances:
+            raise RequestError("'instances' must be a non-empty list")
+
+        rows = [self._parse_risk_row(instance) for instance in instances]
+        return {'predictions': self._gather([self.risk_batcher.submit(row) for row in rows])}
+
+    def _parse_risk_row(self, instance):
+        if isinstance(instance, dict):
+            missing = [name for name in RISK_FEATURES if name not in instance]
+            if missing:
+                raise RequestError(f"Missing features: {', '.join(missing)}")
+            values = [instance[name] for name in RISK_FEATURES]
+        else:
+            values = instance
+
+        try:
+            arr = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            raise RequestError("All features must be numeric")
+        # Reject here, before queueing, so one bad row cannot fail a whole micro-batch
+        if arr.ndim != 1 or arr.size != len(RISK_FEATURES):
+            raise RequestError(f"Expected a flat list of {len(RISK_FEATURES)} features, got shape {list(arr.shape)}")
+        if not np.isfinite(arr).all():
+            raise RequestError("All features must be finite numbers")
+        return arr.reshape(1, -1)
+
+    def predict_ctscan(self, images):
+        """Score one or more decoded CT-scan images"""
+        if self.cnn_model is None:
+            raise ServiceUnavailable("CT-scan model is not loaded")
+        if not images:
+            raise RequestError("No images supplied")
+        return {'predictions': self._gather([self.ct_batcher.submit(img) for img in images])}
+
+# ----------------------------------------------------
+# --- HTTP LAYER ---
+# ----------------------------------------------------
+
+def decode_image_bytes(data):
+    """Decode raw image bytes into an RGB PIL image"""
+    try:
+        return Image.open(io.BytesIO(data)).convert("RGB")
+    except Exception as e:
+        raise RequestError(f"Could not decode image: {e}")
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """Routes JSON requests to the shared InferenceService"""
+
+    server_version = "LungCancerInference/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # StreamRequestHandler.setup applies this to the socket, so idle keep-alive
+        # or stalled clients give their worker back instead of holding it forever
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status, body):
+        self._send_bytes(status, json.dumps(body).encode('utf-8'), 'application/json')
+
+    def _send_text(self, status, text, content_type='text/plain; version=0.0.4'):
+        self._send_bytes(status, text.encode('utf-8'), content_type)
+
+    def _send_bytes(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _has_unread_body(self):
+        if self._body_read:
+            return False
+        length = self.headers.get('Content-Length')
+        return 'Transfer-Encoding' in self.headers or (length is not None and length.strip() != '0')
+
+    def _read_body(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            raise RequestError("Invalid Content-Length")
+        if length <= 0:
+            raise RequestError("Empty request body")
+        if length > MAX_BODY_BYTES:
+            raise RequestError("Request body too large")
+        self._body_read = True
+        return self.rfile.read(length)
+
+    def _read_json(self, body):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise RequestError("Request body is not valid JSON")
+        if not isinstance(payload, dict):
+            raise RequestError("Request body must be a JSON object")
+        return payload
+
+    def do_GET(self):
+        service = self.server.service
+        try:
+            if self.path == '/health':
+                self._send_json(200, service.health())
+            elif self.path == '/metrics':
+                self._send_text(200, metrics.to_prometheus(service.metrics_snapshot()))
+            elif self.path == '/metrics.json':
+                self._send_json(200, service.metrics_snapshot())
+            else:
+                self._send_json(404, {'error': f"Unknown endpoint {self.path}"})
+        except ServiceUnavailable as e:
+            self._send_json(503, {'error': str(e)})
+        except Exception as e:
+            logger.exception("Unhandled error for %s", self.path)
+            self._send_json(500, {'error': str(e)})
+
+    def do_POST(self):
+        self._body_read = False
+        try:
+            status, body = 200, self._dispatch()
+        except RequestError as e:
+            status, body = 400, {'error': str(e)}
+        except ServiceUnavailable as e:
+            status, body = 503, {'error': str(e)}
+        except Exception as e:
+            logger.exception("Unhandled error for %s", self.path)
+            status, body = 500, {'error': str(e)}
+        if self._has_unread_body():
+            # Left on a keep-alive connection, the body would be parsed as the next request
+            self.close_connection = True
+        self._send_json(status, body)
+
+    def _dispatch(self):
+        service = self.server.service
+
+        if self.path == '/predict/risk':
+            return service.predict_risk(self._read_json(self._read_body()))
+
+        if self.path == '/predict/ctscan':
+            body = self._read_body()
+            content_type = self.headers.get('Content-Type', '')
+            if content_type.startswith('image/') or content_type == 'application/octet-stream':
+                return service.predict_ctscan([decode_image_bytes(body)])
+
+            payload = self._read_json(body)
+            if 'images' in payload:
+                encoded = payload['images']
+            elif 'image' in payload:
+                encoded = [payload['image']]
+            else:
+                raise RequestError("Expected 'image' or 'images' (base64) in request body")
+            try:
+                images = [decode_image_bytes(base64.b64decode(item)) for item in encoded]
+            except (TypeError, ValueError) as e:
+                raise RequestError(f"Invalid base64 image data: {e}")
+            return service.predict_ctscan(images)
+
+        if self.path.startswith('/models/') and self.path.endswith('/reload'):
+            return service.reload_model(self.path[len('/models/'):-len('/reload')])
+
+        raise RequestError(f"Unknown endpoint {self.path}")
+
+class InferenceHTTPServer(HTTPServer):
+    """HTTP server that hands connections to a fixed worker pool.
+
+    At most max_concurrency connections are admitted at once (running or
+    waiting for a worker); anything beyond that is answered with 503 from the
+    accept loop instead of queueing without bound.
+    """
+
+    BUSY_RESPONSE = (b"HTTP/1.1 503 Service Unavailable\r\n"
+                     b"Content-Type: application/json\r\n"
+                     b"Content-Length: 37\r\n"
+                     b"Retry-After: 1\r\n"
+                     b"Connection: close\r\n\r\n"
+                     b'{"error": "Server busy, retry later"}')
+
+    def __init__(self, address, service, workers=8, max_concurrency=64, request_timeout=REQUEST_TIMEOUT):
+        if max_concurrency < workers:
+            raise ValueError(f"max_concurrency ({max_concurrency}) must be at least workers ({workers})")
+        super().__init__(address, InferenceRequestHandler)
+        self.service = service
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http-worker")
+        self.limiter = threading.BoundedSemaphore(max_concurrency)
+        self.request_timeout = request_timeout
+
+    def process_request(self, request, client_address):
+        if not self.limiter.acquire(blocking=False):
+            self._reject_busy(request)
+            return
+        try:
+            self.pool.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            # Pool already shut down (server closing)
+            self.limiter.release()
+            self.shutdown_request(request)
+
+    def _reject_busy(self, request):
+        try:
+            request.settimeout(1.0)
+            request.sendall(self.BUSY_RESPONSE)
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.limiter.release()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+# ----------------------------------------------------
+# --- ENTRY POINT ---
+# ----------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the lung cancer ML and CNN models over HTTP")
+    parser.add_argument('--host', default=os.environ.get('INFERENCE_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('INFERENCE_PORT', 8502)))
+    parser.add_argument('--ml-model', default=ML_MODEL_PATH, help="Path to the pickled risk model")
+    parser.add_argument('--cnn-model', help="Path to the CT-scan model (default depends on --cnn-backend)")
+    parser.add_argument('--cnn-backend', default=cnn_backends.CNN_BACKEND, choices=sorted(cnn_backends.BACKEND_LOADERS),
+                        help="Runtime used for the CT-scan model")
+    parser.add_argument('--workers', type=int, default=8, help="HTTP worker threads")
+    parser.add_argument('--max-concurrency', type=int, default=64,
+                        help="Maximum connections admitted (running or queued) before returning 503; "
+                             "must be at least --workers")
+    parser.add_argument('--request-timeout', type=float, default=REQUEST_TIMEOUT,
+                        help="Seconds a connection may stay idle before it is closed")
+    parser.add_argument('--max-batch-size', type=int, default=32, help="Largest batch sent to a model")
+    parser.add_argument('--batch-wait-ms', type=float, default=5.0,
+                        help="How long to wait for more requests before running a batch")
+    parser.add_argument('--watch-interval', type=float, default=model_registry.WATCH_INTERVAL,
+                        help="Seconds between checks for replaced model files (0 disables hot-swap)")
+    parser.add_argument('--db', default=storage.DB_PATH, help="App database read by /metrics")
+    args = parser.parse_args()
+    if args.max_concurrency < args.workers:
+        parser.error("--max-concurrency must be at least --workers")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    cnn_model = args.cnn_model or (CNN_MODEL_PATH if args.cnn_backend == cnn_backends.CNN_BACKEND
+                                   else cnn_backends.default_model_path(args.cnn_backend))
+    service = InferenceService(args.ml_model, cnn_model, args.max_batch_size, args.batch_wait_ms,
+                               cnn_backend=args.cnn_backend, db_path=args.db)
+    if args.watch_interval > 0:
+        service.registry.watch(args.watch_interval)
+    server = InferenceHTTPServer((args.host, args.port), service, args.workers, args.max_concurrency,
+                                 args.request_timeout)
+    logger.info("Serving on http://%s:%d (%s)", args.host, args.port, json.dumps(service.health()['models']))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import datetime
+
+# ----------------------------------------------------
+# --- METRICS CONFIGURATION ---
+# ----------------------------------------------------
+
+# Hourly event buckets older than this are pruned
+RETENTION_DAYS = 30
+
+# Rolling windows reported for every event, in hours
+WINDOWS = {'1h': 1, '24h': 24, '7d': 24 * 7}
+
+# Counter name -> (Prometheus name, type, help, label name); a None name keeps a counter out
+# of /metrics (only in the JSON snapshot), for labels that grow without bound
+COUNTERS = {
+    'users_total': ('lung_users_total', 'counter', "Registered users", None),
+    'appointments_total': ('lung_appointments_total', 'counter', "Appointments booked", None),
+    'appointments_by_status': ('lung_appointments_by_status', 'gauge', "Appointments currently in each status", 'status'),
+    'appointments_by_specialization': ('lung_appointments_by_specialization_total', 'counter', "Appointments booked per specialization", 'specialization'),
+    'appointments_by_doctor': ('lung_appointments_by_doctor_total', 'counter', "Appointments booked per doctor id", 'doctor_id'),
+    'appointments_by_day': (None, None, "Appointments booked per appointment date", 'date'),
+}
+
+# Appointments per day are exported to Prometheus only for this many days from today,
+# labelled by offset so the series set stays fixed
+PROMETHEUS_UPCOMING_DAYS = 14
+
+# Events with rolling-window histograms
+EVENTS = ('registrations', 'bookings', 'confirmations', 'cancellations', 'completions')
+STATUS_EVENTS = {'Confirmed': 'confirmations', 'Cancelled': 'cancellations', 'Completed': 'completions'}
+
+# Tables are created by storage.SCHEMA
+SQL_INCREMENT_COUNTER = """
+INSERT INTO metric_counters (name, label, value) VALUES (?, ?, ?)
+ON CONFLICT (name, label) DO UPDATE SET value = value + excluded.value
+"""
+SQL_INCREMENT_BUCKET = """
+INSERT INTO metric_buckets (name, bucket, value) VALUES (?, ?, ?)
+ON CONFLICT (name, bucket) DO UPDATE SET value = value + excluded.value
+"""
+SQL_READ_COUNTERS = "SELECT name, label, value FROM metric_counters"
+SQL_READ_BUCKETS = "SELECT name, bucket, value FROM metric_buckets WHERE bucket >= ? ORDER BY bucket"
+SQL_PRUNE_BUCKETS = "DELETE FROM metric_buckets WHERE bucket < ?"
+SQL_HAS_COUNTERS = "SELECT 1 FROM metric_counters LIMIT 1"
+
+# Backfill queries used when counters are first created on an existing database
+SQL_BACKFILL_COUNTERS = [
+    "SELECT 'users_total', '', COUNT(*) FROM users",
+    "SELECT 'appointments_total', '', COUNT(*) FROM appointments",
+    "SELECT 'appointments_by_status', status, COUNT(*) FROM appointments GROUP BY status",
+    "SELECT 'appointments_by_specialization', specialization, COUNT(*) FROM appointments GROUP BY specialization",
+    "SELECT 'appointments_by_doctor', CAST(doctor_id AS TEXT), COUNT(*) FROM appointments GROUP BY doctor_id",
+    "SELECT 'appointments_by_day', appointment_date, COUNT(*) FROM appointments GROUP BY appointment_date",
+]
+SQL_BACKFILL_BUCKETS = [
+    "SELECT 'registrations', strftime('%Y-%m-%d %H', created_at, 'localtime'), COUNT(*) FROM users GROUP BY 2",
+    "SELECT 'bookings', strftime('%Y-%m-%d %H', booked_at), COUNT(*) FROM appointments GROUP BY 2",
+]
+
+def hour_bucket(moment):
+    return moment.strftime('%Y-%m-%d %H')
+
+# ----------------------------------------------------
+# --- EVENT RECORDING ---
+# ----------------------------------------------------
+# Each recorder runs on the caller's connection, inside the same transaction
+# as the write it describes, so counters never drift from the tables.
+
+def _increment(conn, name, label='', amount=1):
+    conn.execute(SQL_INCREMENT_COUNTER, (name, str(label), amount))
+
+def _event(conn, name, now=None):
+    conn.execute(SQL_INCREMENT_BUCKET, (name, hour_bucket(now or datetime.datetime.now()), 1))
+
+def record_user_registered(conn, now=None):
+    _increment(conn, 'users_total')
+    _event(conn, 'registrations', now)
+
+def record_appointment_booked(conn, appointment, now=None):
+    _increment(conn, 'appointments_total')
+    _increment(conn, 'appointments_by_status', appointment['status'])
+    _increment(conn, 'appointments_by_specialization', appointment['specialization'])
+    _increment(conn, 'appointments_by_doctor', appointment['doctor_id'])
+    _increment(conn, 'appointments_by_day', appointment['date'])
+    _event(conn, 'bookings', now)
+
+def record_status_change(conn, old_status, new_status, now=None):
+    if old_status == new_status:
+        return
+    _increment(conn, 'appointments_by_status', old_status, -1)
+    _increment(conn, 'appointments_by_status', new_status)
+    _event(conn, STATUS_EVENTS[new_status], now)
+
+def backfill(conn):
+    """Create the counters from the base tables if they have never been populated"""
+    if conn.execute(SQL_HAS_COUNTERS).fetchone():
+        return False
+    for sql in SQL_BACKFILL_COUNTERS:
+        conn.executemany(SQL_INCREMENT_COUNTER, [tuple(row) for row in conn.execute(sql) if row[2]])
+    for sql in SQL_BACKFILL_BUCKETS:
+        conn.executemany(SQL_INCREMENT_BUCKET, [tuple(row) for row in conn.execute(sql) if row[1]])
+    # Marks the counters as initialised even on an empty database
+    _increment(conn, 'users_total', amount=0)
+    return True
+
+def prune(conn, now=None, retention_days=RETENTION_DAYS):
+    cutoff = (now or datetime.datetime.now()) - datetime.timedelta(days=retention_days)
+    conn.execute(SQL_PRUNE_BUCKETS, (hour_bucket(cutoff),))
+
+# ----------------------------------------------------
+# --- READING ---
+# ----------------------------------------------------
+
+def snapshot(conn, now=None):
+    """All counters plus rolling-window totals and the last 24 hourly buckets per event.
+
+    Cost depends on the number of distinct counters and buckets, never on
+    the number of users or appointments.
+    """
+    now = now or datetime.datetime.now()
+    counters = {name: ({} if label_name else 0) for name, (_, _, _, label_name) in COUNTERS.items()}
+    for row in conn.execute(SQL_READ_COUNTERS):
+        name, label, value = row[0], row[1], row[2]
+        if name not in counters:
+            continue
+        if COUNTERS[name][3]:
+            if value:
+                counters[name][label] = value
+        else:
+            counters[name] = value
+
+    current = hour_bucket(now)
+    window_starts = {
+        window: hour_bucket(now - datetime.timedelta(hours=hours - 1)) for window, hours in WINDOWS.items()
+    }
+    hourly_start = hour_bucket(now - datetime.timedelta(hours=23))
+    windows = {event: {window: 0 for window in WINDOWS} for event in EVENTS}
+    hourly = {event: {} for event in EVENTS}
+    for row in conn.execute(SQL_READ_BUCKETS, (min(window_starts.values()),)):
+        name, bucket, value = row[0], row[1], row[2]
+        if name not in windows or bucket > current:
+            continue
+        for window, start in window_starts.items():
+            if bucket >= start:
+                windows[name][window] += value
+        if bucket >= hourly_start:
+            hourly[name][bucket] = value
+
+    return {
+        'generated_at': now.strftime('%Y-%m-%d %H:%M:%S'),
+        'counters': counters,
+        'windows': windows,
+        'hourly': hourly,
+    }
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def to_prometheus(snap):
+    """Render a snapshot in the Prometheus text exposition format"""
+    lines = []
+    for name, (prom_name, metric_type, help_text, label_name) in COUNTERS.items():
+        if prom_name is None:
+            continue
+        lines.append(f"# HELP {prom_name} {help_text}")
+        lines.append(f"# TYPE {prom_name} {metric_type}")
+        value = snap['counters'][name]
+        if label_name:
+            for label, count in sorted(value.items()):
+                lines.append(f'{prom_name}{{{label_name}="{_escape_label(label)}"}} {count}')
+        else:
+            lines.append(f"{prom_name} {value}")
+
+    today = datetime.datetime.strptime(snap['generated_at'], '%Y-%m-%d %H:%M:%S').date()
+    by_day = snap['counters']['appointments_by_day']
+    lines.append("# HELP lung_appointments_upcoming Appointments booked for the date days_ahead days from today")
+    lines.append("# TYPE lung_appointments_upcoming gauge")
+    for days_ahead in range(PROMETHEUS_UPCOMING_DAYS):
+        date = (today + datetime.timedelta(days=days_ahead)).isoformat()
+        lines.append(f'lung_appointments_upcoming{{days_ahead="{days_ahead}"}} {by_day.get(date, 0)}')
+
+    lines.append("# HELP lung_events_window Events in the trailing time window")
+    lines.append("# TYPE lung_events_window gauge")
+    for event, windows in snap['windows'].items():
+        for window, count in windows.items():
+            lines.append(f'lung_events_window{{event="{event}",window="{window}"}} {count}')
+    return "\n".join(lines) + "\n"
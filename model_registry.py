@@ -0,0 +1,305 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+import time
+
+import numpy as np
+
+import cnn_backends
+
+logger = logging.getLogger("model_registry")
+
+# ----------------------------------------------------
+# --- MODEL CONFIGURATION ---
+# ----------------------------------------------------
+
+# name -> (path, kind); paths can be overridden through the environment
+MODEL_CONFIG = {
+    'risk': (os.environ.get('ML_MODEL_PATH', 'models/final_model.sav'), 'sklearn'),
+    'cnn': (os.environ.get('CNN_MODEL_PATH', cnn_backends.default_model_path()), cnn_backends.CNN_BACKEND),
+    'keras': (os.environ.get('KERAS_MODEL_PATH', 'models/keras_model.h5'), 'keras'),
+}
+
+WATCH_INTERVAL = 10.0  # seconds between checks for replaced model files
+
+# ----------------------------------------------------
+# --- LOADERS AND WARM-UP ---
+# ----------------------------------------------------
+
+def _load_sklearn(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def _warm_sklearn(model):
+    n_features = getattr(model, 'n_features_in_', 17)
+    model.predict(np.zeros((1, n_features)))
+
+def _warm_cnn(model):
+    # Works for Keras models and every cnn_backends runtime
+    input_shape = tuple(dim or 1 for dim in model.input_shape[1:])
+    model.predict(np.zeros((1,) + input_shape, dtype=np.float32), verbose=0)
+
+LOADERS = {
+    'sklearn': (_load_sklearn, _warm_sklearn),
+    'keras': (cnn_backends.load_keras, _warm_cnn),
+    'tflite': (cnn_backends.load_tflite, _warm_cnn),
+    'onnx': (cnn_backends.load_onnx, _warm_cnn),
+}
+
+def file_version(path):
+    """Short content hash used as the model version"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+# ----------------------------------------------------
+# --- TRAINING MANIFESTS ---
+# ----------------------------------------------------
+# Training scripts publish a JSON manifest next to each model file. It is
+# stamped with the model's version, so a manifest left behind by an older
+# file is ignored.
+
+def manifest_path(path):
+    return f"{path}.json"
+
+def read_manifest(path, version):
+    """Manifest describing this version of the model at path, or None"""
+    try:
+        with open(manifest_path(path)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == version else None
+
+def publish_model(path, write, manifest):
+    """Atomically replace the model at path; write(tmp_path) saves the new model.
+
+    The manifest lands before the model file, so a watching registry never
+    picks up a model without its manifest. Returns the stamped manifest.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    root, ext = os.path.splitext(path)
+    # Keep the extension: Keras picks the save format from it
+    tmp_path = f"{root}.tmp{ext}"
+    write(tmp_path)
+    manifest = dict(manifest, version=file_version(tmp_path))
+    tmp_manifest = f"{manifest_path(path)}.tmp"
+    with open(tmp_manifest, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_manifest, manifest_path(path))
+    os.replace(tmp_path, path)
+    return manifest
+
+class PromotionRefused(Exception):
+    """Raised when a candidate model would replace a live model that scores better"""
+
+def candidate_path(path):
+    """Where training scripts write a new model for review instead of replacing the one at path"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.candidate{ext}"
+
+def promote_model(candidate, path, metric=None, force=False):
+    """Publish a trained candidate (and its manifest) over the live model at path.
+
+    With metric, the candidate is refused unless its manifest's metrics[metric]
+    is at least the live model's, and also when the live model has no manifest
+    or metric to compare against; force skips the check. The scores are only
+    comparable when both manifests were measured on the same holdout, i.e.
+    both models were trained from the same --data. Returns the published
+    manifest.
+    """
+    manifest = read_manifest(candidate, file_version(candidate))
+    if manifest is None:
+        raise PromotionRefused(f"{candidate} has no manifest for its current version")
+    if metric and not force and os.path.exists(path):
+        live = read_manifest(path, file_version(path)) or {}
+        live_score = live.get('metrics', {}).get(metric)
+        score = manifest.get('metrics', {}).get(metric)
+        if live_score is None:
+            raise PromotionRefused(f"The live model at {path} has no manifest recording its {metric}")
+        if score is None or score < live_score:
+            raise PromotionRefused(f"Candidate {metric} {score} is below the live model's {live_score}")
+    return publish_model(path, lambda tmp_path: shutil.copyfile(candidate, tmp_path), manifest)
+
+# ----------------------------------------------------
+# --- MODEL REGISTRY ---
+# ----------------------------------------------------
+
+class ModelEntry:
+    """A configured model, the currently served instance and its metadata"""
+
+    def __init__(self, name, path, kind):
+        self.name = name
+        self.path = path
+        self.kind = kind
+        self.model = None
+        # (model, version) swapped as one reference so readers never pair a model with another's version
+        self.served = (None, None)
+        self.metadata = {'name': name, 'path': path, 'kind': kind, 'status': 'pending'}
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+
+class ModelRegistry:
+    """Loads every configured model once per process and serves them by name.
+
+    Models are loaded (optionally in background threads) and warmed with a
+    dummy inference. A replaced model file is picked up by ``reload`` or by
+    the ``watch`` thread: the new model is loaded and warmed next to the old
+    one and swapped in only when ready, so requests never see a half-loaded
+    model and a broken file leaves the previous version in service.
+    """
+
+    def __init__(self, config=None):
+        config = MODEL_CONFIG if config is None else config
+        self._entries = {name: ModelEntry(name, path, kind) for name, (path, kind) in config.items()}
+        self._watcher = None
+        self._listeners = []
+
+    def subscribe(self, listener):
+        """Call listener(name, metadata) after a model is (re)loaded"""
+        self._listeners.append(listener)
+
+    def names(self):
+        return list(self._entries)
+
+    def _load(self, entry, path=None):
+        path = path or entry.path
+        load_fn, warm_fn = LOADERS[entry.kind]
+        with entry.lock:
+            try:
+                started = time.perf_counter()
+                model = load_fn(path)
+                loaded = time.perf_counter()
+                warm_fn(model)
+                warmed = time.perf_counter()
+                stat = os.stat(path)
+                version = file_version(path)
+                metadata = {
+                    'name': entry.name,
+                    'path': path,
+                    'kind': entry.kind,
+                    'status': 'ready',
+                    'version': version,
+                    'size_bytes': stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'loaded_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'load_seconds': round(loaded - started, 3),
+                    'warmup_seconds': round(warmed - loaded, 3),
+                    'manifest': read_manifest(path, version),
+                    'error': None,
+                }
+            except Exception as e:
+                logger.error("Could not load model '%s' from '%s': %s", entry.name, path, e)
+                if entry.model is None:
+                    entry.metadata = {'name': entry.name, 'path': path, 'kind': entry.kind,
+                                      'status': 'failed', 'error': str(e)}
+                else:
+                    # Keep serving the previous version
+                    entry.metadata = dict(entry.metadata, error=f"Reload failed: {e}")
+                entry.ready.set()
+                return False
+
+            entry.model = model
+            entry.served = (model, metadata['version'])
+            entry.path = path
+            entry.metadata = metadata
+            entry.ready.set()
+
+        logger.info("Loaded model '%s' version %s", entry.name, metadata['version'])
+        for listener in self._listeners:
+            try:
+                listener(entry.name, metadata)
+            except Exception:
+                logger.exception("Model listener failed for '%s'", entry.name)
+        return True
+
+    def load_all(self, background=False):
+        """Load and warm every configured model (each in its own thread when background=True)"""
+        threads = []
+        for entry in self._entries.values():
+            if background:
+                entry.metadata['status'] = 'loading'
+                thread = threading.Thread(target=self._load, args=(entry,), name=f"load-{entry.name}", daemon=True)
+                thread.start()
+                threads.append(thread)
+            else:
+                self._load(entry)
+        return threads
+
+    def _wait_ready(self, name, timeout=None):
+        entry = self._entries[name]
+        if not entry.ready.is_set():
+            if entry.metadata['status'] == 'pending':
+                # Not scheduled by load_all: load it on first use
+                self._load(entry)
+            entry.ready.wait(timeout)
+        return entry
+
+    def get(self, name, timeout=None):
+        """Return the served model for name (waiting for its first load), or None"""
+        return self._wait_ready(name, timeout).model
+
+    def get_with_version(self, name, timeout=None):
+        """(model, version) of the served model, read together so a concurrent hot-swap
+        cannot pair one version's model with the other's version; (None, None) if not loaded"""
+        return self._wait_ready(name, timeout).served
+
+    def metadata(self, name):
+        return dict(self._entries[name].metadata)
+
+    def version(self, name):
+        return self._entries[name].metadata.get('version')
+
+    def health(self):
+        """Load status and metadata of every model"""
+        models = {name: dict(entry.metadata) for name, entry in self._entries.items()}
+        status = 'ok' if all(m['status'] == 'ready' for m in models.values()) else 'degraded'
+        return {'status': status, 'models': models}
+
+    def reload(self, name, path=None):
+        """Hot-swap a model from its (possibly new) file; returns True on success"""
+        return self._load(self._entries[name], path)
+
+    def check_for_updates(self):
+        """Reload any model whose file changed on disk since it was loaded"""
+        reloaded = []
+        for name, entry in self._entries.items():
+            if entry.metadata['status'] in ('pending', 'loading'):
+                continue
+            try:
+                mtime = os.stat(entry.path).st_mtime
+            except OSError:
+                continue
+            # Skip files already served, and broken files until they change again
+            if mtime in (entry.metadata.get('mtime'), entry.metadata.get('failed_mtime')):
+                continue
+            if self.reload(name):
+                reloaded.append(name)
+            else:
+                entry.metadata['failed_mtime'] = mtime
+        return reloaded
+
+    def watch(self, interval=WATCH_INTERVAL):
+        """Start a daemon thread that hot-swaps models when their files change"""
+        if self._watcher is not None:
+            return
+
+        def _watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.check_for_updates()
+                except Exception:
+                    logger.exception("Model watch failed")
+
+        self._watcher = threading.Thread(target=_watch, name="model-watcher", daemon=True)
+        self._watcher.start()
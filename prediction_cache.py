@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# ----------------------------------------------------
+# --- CACHE CONFIGURATION ---
+# ----------------------------------------------------
+
+CACHE_MAX_ENTRIES = int(os.environ.get('PREDICTION_CACHE_SIZE', 1024))
+CACHE_TTL_SECONDS = float(os.environ.get('PREDICTION_CACHE_TTL', 24 * 3600))
+# Optional on-disk tier shared across restarts (disabled when unset)
+CACHE_DIR = os.environ.get('PREDICTION_CACHE_DIR') or None
+
+def cache_key(data, model_version, namespace='cnn'):
+    """Content address for a prediction: the input bytes' sha256 plus the model version"""
+    return f"{namespace}:{model_version}:{hashlib.sha256(data).hexdigest()}"
+
+# ----------------------------------------------------
+# --- PREDICTION CACHE ---
+# ----------------------------------------------------
+
+class PredictionCache:
+    """LRU + TTL cache of model outputs with an optional on-disk tier.
+
+    Values are small JSON-serializable dicts (probabilities, not images).
+    The memory tier holds at most ``max_entries`` items and evicts the least
+    recently used one; every entry expires ``ttl_seconds`` after it was
+    stored. When ``disk_dir`` is set, entries are also written there as one
+    JSON file each, and memory misses fall back to disk before giving up.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS, disk_dir=CACHE_DIR):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.disk_dir, digest[:2], f"{digest}.json")
+
+    def _read_disk(self, key, now):
+        try:
+            with open(self._disk_path(key)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get('key') != key or now - record['stored_at'] > self.ttl_seconds:
+            return None
+        return record
+
+    def _write_disk(self, key, value, stored_at):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'key': key, 'stored_at': stored_at, 'value': value}, f)
+        # Atomic so concurrent readers never see a partial file
+        os.replace(tmp_path, path)
+
+    def _remember(self, key, value, stored_at):
+        self._entries[key] = (value, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def get(self, key):
+        """Cached value for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return value
+                del self._entries[key]
+
+        if self.disk_dir:
+            record = self._read_disk(key, now)
+            if record is not None:
+                with self._lock:
+                    self._remember(key, record['value'], record['stored_at'])
+                    self._stats['disk_hits'] += 1
+                return record['value']
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, value, stored_at)
+        if self.disk_dir:
+            try:
+                self._write_disk(key, value, stored_at)
+            except OSError:
+                # The disk tier is best effort; the memory tier still has the value
+                pass
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, computing and storing it on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
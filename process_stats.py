@@ -0,0 +1,18 @@
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ----------------------------------------------------
+# --- PROCESS RESOURCE USAGE ---
+# ----------------------------------------------------
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, or None where unsupported"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
@@ -0,0 +1,226 @@
+"""Background rendering of PDF and DOCX documents.
+
+Documents are rendered in a small process pool, one format per job, so
+reportlab layout never runs on a Streamlit session thread or next to model
+inference. Jobs are addressed by the hash of their content: submitting the
+same document twice returns the running job or the cached bytes.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import reports
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------------------------------
+# --- JOB CONFIGURATION ---
+# ----------------------------------------------------
+
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 2))
+# Rendered documents kept in memory, by total size
+REPORT_CACHE_BYTES = int(os.environ.get('REPORT_CACHE_MB', 64)) * 1024 * 1024
+# Failed jobs are remembered (so their error can be shown) for this long, and at most this many
+FAILED_JOB_TTL = 15 * 60  # seconds
+MAX_FAILED_JOBS = 256
+# Times a job is resubmitted after a worker process died under it
+MAX_POOL_RETRIES = 1
+
+# (document, format) -> generator name in reports, resolved inside the worker
+GENERATORS = {
+    ('report', 'pdf'): 'generate_report_pdf',
+    ('report', 'docx'): 'generate_report_docx',
+    ('appointment', 'pdf'): 'generate_appointment_pdf',
+    ('appointment', 'docx'): 'generate_appointment_docx',
+}
+
+MIME_TYPES = {
+    'pdf': 'application/pdf',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+}
+
+def _encode(value):
+    # Structured reports hash by their attributes, anything else by its string form
+    return vars(value) if hasattr(value, '__dict__') else str(value)
+
+def job_key(document, fmt, args):
+    """Content address of a document: sha256 over its kind, format and generator arguments"""
+    payload = json.dumps([document, fmt, list(args)], sort_keys=True, default=_encode)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _render(document, fmt, args):
+    # Runs in a worker process; only reports (and its lazy imports) is loaded there
+    generate = getattr(reports, GENERATORS[(document, fmt)])
+    return generate(*args).getvalue()
+
+# ----------------------------------------------------
+# --- JOB QUEUE ---
+# ----------------------------------------------------
+
+class ReportJobQueue:
+    """Process pool for document rendering with status polling and a byte-bounded result cache.
+
+    ``submit`` returns a job id immediately; ``status`` reports 'queued',
+    'running', 'done', 'failed' or 'unknown' (never submitted, its result was
+    evicted, or it failed more than FAILED_JOB_TTL ago), and ``result`` returns
+    the rendered bytes once done. A job whose worker process dies is retried
+    on a fresh pool.
+    """
+
+    def __init__(self, workers=REPORT_WORKERS, cache_bytes=REPORT_CACHE_BYTES):
+        self.workers = workers
+        self.cache_bytes = cache_bytes
+        self._executor = None
+        self._jobs = {}
+        self._results = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'cache_hits': 0, 'completed': 0, 'failed': 0}
+
+    def _pool(self):
+        if self._executor is None:
+            # Spawned workers never inherit the app's model threads or database connections
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def submit(self, document, fmt, *args):
+        """Queue one document in one format and return its job id"""
+        if (document, fmt) not in GENERATORS:
+            raise ValueError(f"Unknown document '{document}' in format '{fmt}'")
+        key = job_key(document, fmt, args)
+        with self._lock:
+            if key in self._results:
+                self._stats['cache_hits'] += 1
+                return key
+            self._prune_failed()
+            job = self._jobs.get(key)
+            if job is not None and job['state'] not in ('done', 'failed'):
+                return key
+            job = {'state': 'queued', 'future': None, 'pool': None, 'task': (document, fmt, args), 'retries': 0,
+                   'submitted_at': time.time(), 'finished_at': None, 'seconds': None, 'error': None}
+            self._jobs[key] = job
+            future = self._start(job)
+            self._stats['submitted'] += 1
+        future.add_done_callback(partial(self._finish, key))
+        return key
+
+    def _start(self, job):
+        """Submit a job's task to the pool, replacing the pool once if a worker died and broke it"""
+        try:
+            job['future'] = self._pool().submit(_render, *job['task'])
+        except BrokenProcessPool:
+            self._reset_pool()
+            job['future'] = self._pool().submit(_render, *job['task'])
+        job['pool'] = self._executor
+        return job['future']
+
+    def _reset_pool(self, broken=None):
+        # Only replace the pool the failure came from; another job may already have replaced it
+        if self._executor is not None and (broken is None or self._executor is broken):
+            logger.warning("Report worker pool is broken (a worker process died); starting a new one")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _finish(self, key, future):
+        retried = None
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job['future'] is not future:
+                return
+            try:
+                data = future.result()
+            except BrokenProcessPool:
+                # The job may be fine and only shared the pool with one that crashed; try it again
+                if job['retries'] < MAX_POOL_RETRIES:
+                    job['retries'] += 1
+                    self._reset_pool(job['pool'])
+                    try:
+                        retried = self._start(job)
+                    except RuntimeError as e:
+                        # Interpreter or queue shutting down
+                        self._fail(job, str(e))
+                else:
+                    self._fail(job, "Rendering worker stopped unexpectedly")
+            except Exception as e:
+                if not isinstance(e, reports.ReportError):
+                    logger.exception("Report job %s failed", key)
+                self._fail(job, str(e) or type(e).__name__)
+            else:
+                self._done(job)
+                self._store(key, data)
+        if retried is not None:
+            # Outside the lock: the callback runs inline if the future has already finished
+            retried.add_done_callback(partial(self._finish, key))
+
+    def _done(self, job):
+        job['state'] = 'done'
+        job['future'] = job['pool'] = job['task'] = None
+        job['finished_at'] = time.time()
+        job['seconds'] = job['finished_at'] - job['submitted_at']
+        self._stats['completed'] += 1
+
+    def _fail(self, job, error):
+        job['state'] = 'failed'
+        job['future'] = job['pool'] = job['task'] = None
+        job['finished_at'] = time.time()
+        job['seconds'] = job['finished_at'] - job['submitted_at']
+        job['error'] = error
+        self._stats['failed'] += 1
+
+    def _prune_failed(self):
+        """Forget failed jobs after FAILED_JOB_TTL, and the oldest beyond MAX_FAILED_JOBS"""
+        failed = sorted((job['finished_at'], key) for key, job in self._jobs.items() if job['state'] == 'failed')
+        cutoff = time.time() - FAILED_JOB_TTL
+        excess = len(failed) - MAX_FAILED_JOBS
+        for position, (finished_at, key) in enumerate(failed):
+            if finished_at < cutoff or position < excess:
+                del self._jobs[key]
+
+    def _store(self, key, data):
+        self._results[key] = data
+        self._cached_bytes += len(data)
+        while self._cached_bytes > self.cache_bytes and len(self._results) > 1:
+            evicted_key, evicted = self._results.popitem(last=False)
+            self._cached_bytes -= len(evicted)
+            self._jobs.pop(evicted_key, None)
+
+    def status(self, key):
+        """{'state': ..., 'seconds': render time or None, 'error': message or None}"""
+        with self._lock:
+            if key in self._results:
+                job = self._jobs.get(key, {})
+                return {'state': 'done', 'seconds': job.get('seconds'), 'error': None}
+            job = self._jobs.get(key)
+            if job is None:
+                return {'state': 'unknown', 'seconds': None, 'error': None}
+            state = job['state']
+            if state == 'queued' and job['future'] is not None and job['future'].running():
+                state = 'running'
+            return {'state': state, 'seconds': job['seconds'], 'error': job['error']}
+
+    def result(self, key):
+        """Rendered bytes of a finished job, or None"""
+        with self._lock:
+            data = self._results.get(key)
+            if data is not None:
+                self._results.move_to_end(key)
+            return data
+
+    def stats(self):
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job['state'] == 'queued')
+            return dict(self._stats, pending=pending, cached=len(self._results), cached_bytes=self._cached_bytes)
+
+    def shutdown(self, wait=False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
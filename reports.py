@@ -0,0 +1,584 @@
+"""PDF and DOCX generation for reports and appointment confirmations.
+
+reportlab and python-docx are imported inside the generators, so importing
+this module (and rendering pages that never build a document) stays cheap.
+Prediction reports are built once as a structured ``Report`` and rendered
+to TXT, PDF or DOCX from that structure.
+"""
+import datetime
+import functools
+import importlib.util
+import io
+from xml.sax.saxutils import escape
+
+# Availability is checked without importing the libraries themselves
+PDF_AVAILABLE = importlib.util.find_spec('reportlab') is not None
+DOCX_AVAILABLE = importlib.util.find_spec('docx') is not None
+
+class ReportError(Exception):
+    """Raised when a document could not be generated"""
+
+class ReportUnavailable(ReportError):
+    """Raised when the library needed for a format is not installed"""
+
+# ----------------------------------------------------
+# --- PDF AND DOCX GENERATION FUNCTIONS ---
+# ----------------------------------------------------
+
+def generate_appointment_pdf(patient_data, doctor_data, appointment_data):
+    """Generate PDF appointment confirmation"""
+    buffer = io.BytesIO()
+    
+    if not PDF_AVAILABLE:
+        raise ReportUnavailable("PDF generation not available. Please install reportlab.")
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    
+    try:
+        doc = SimpleDocTemplate(buffer, pagesize=A4)
+        styles = getSampleStyleSheet()
+        story = []
+        
+        # Title
+        title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=16,
+            spaceAfter=30,
+            alignment=1,  # Center alignment
+            textColor=colors.HexColor('#2E7D32')
+        )
+        title = Paragraph("MEDICAL APPOINTMENT CONFIRMATION", title_style)
+        story.append(title)
+        story.append(Spacer(1, 20))
+        
+        # Appointment Details
+        story.append(Paragraph("APPOINTMENT DETAILS", styles['Heading2']))
+        appointment_info = [
+            ["Appointment ID:", appointment_data['appointment_id']],
+            ["Date:", appointment_data['date']],
+            ["Time:", appointment_data['time']],
+            ["Status:", appointment_data['status']]
+        ]
+        appointment_table = Table(appointment_info, colWidths=[2*inch, 3*inch])
+        appointment_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#E8F5E8')),
+            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#2E7D32')),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.black),
+            ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
+        ]))
+        story.append(appointment_table)
+        story.append(Spacer(1, 20))
+        
+        # Patient Information
+        story.append(Paragraph("PATIENT INFORMATION", styles['Heading2']))
+        patient_info = [
+            ["Name:", f"{patient_data['first_name']} {patient_data['last_name']}"],
+            ["Phone:", patient_data['phone']],
+            ["Email:", patient_data.get('email', 'Not provided')],
+            ["Address:", patient_data['address']]
+        ]
+        patient_table = Table(patient_info, colWidths=[1.5*inch, 4*inch])
+        patient_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#E3F2FD')),
+            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#1565C0')),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ]))
+        story.append(patient_table)
+        story.append(Spacer(1, 20))
+        
+        # Doctor Information
+        story.append(Paragraph("DOCTOR INFORMATION", styles['Heading2']))
+        doctor_info = [
+            ["Name:", doctor_data['name']],
+            ["Specialization:", doctor_data['specialization']],
+            ["Qualification:", doctor_data['qualification']],
+            ["Experience:", doctor_data['experience']],
+            ["Phone:", doctor_data['phone']],
+            ["Email:", doctor_data['email']],
+            ["Address:", doctor_data['address']],
+            ["Consultation Fees:", doctor_data['fees']]
+        ]
+        doctor_table = Table(doctor_info, colWidths=[1.5*inch, 4*inch])
+        doctor_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#FFF3E0')),
+            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#EF6C00')),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ]))
+        story.append(doctor_table)
+        story.append(Spacer(1, 20))
+        
+        # Medical Details
+        story.append(Paragraph("MEDICAL CONSULTATION DETAILS", styles['Heading2']))
+        medical_info = [
+            ["Reason for Visit:", appointment_data['reason']],
+            ["Symptoms:", appointment_data['symptoms']],
+            ["Previous Diagnosis:", appointment_data.get('previous_diagnosis', 'Not specified')]
+        ]
+        medical_table = Table(medical_info, colWidths=[1.5*inch, 4*inch])
+        story.append(medical_table)
+        story.append(Spacer(1, 20))
+        
+        # Instructions
+        story.append(Paragraph("IMPORTANT INSTRUCTIONS", styles['Heading2']))
+        instructions = [
+            "1. Please arrive 15 minutes before your scheduled appointment time",
+            "2. Bring your ID and insurance card (if applicable)",
+            "3. Bring any previous medical reports or test results",
+            "4. List of current medications",
+            "5. Emergency contact information"
+        ]
+        for instruction in instructions:
+            story.append(Paragraph(instruction, styles['Normal']))
+            story.append(Spacer(1, 5))
+        
+        story.append(Spacer(1, 15))
+        story.append(Paragraph(f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
+        story.append(Paragraph("Lung Cancer Detection System - Medical Services", styles['Normal']))
+        
+        doc.build(story)
+        buffer.seek(0)
+        
+    except Exception as e:
+        raise ReportError(f"Error generating PDF: {e}") from e
+    
+    return buffer
+
+def generate_appointment_docx(patient_data, doctor_data, appointment_data):
+    """Generate DOCX appointment confirmation"""
+    buffer = io.BytesIO()
+    
+    if not DOCX_AVAILABLE:
+        raise ReportUnavailable("DOCX generation not available. Please install python-docx.")
+    from docx import Document
+    
+    try:
+        doc = Document()
+        
+        # Title
+        title = doc.add_heading('MEDICAL APPOINTMENT CONFIRMATION', 0)
+        title.alignment = 1  # Center alignment
+        
+        # Appointment Details
+        doc.add_heading('APPOINTMENT DETAILS', level=1)
+        appointment_info = [
+            ['Appointment ID:', appointment_data['appointment_id']],
+            ['Date:', appointment_data['date']],
+            ['Time:', appointment_data['time']],
+            ['Status:', appointment_data['status']]
+        ]
+        table = doc.add_table(rows=4, cols=2)
+        for i, (key, value) in enumerate(appointment_info):
+            table.cell(i, 0).text = key
+            table.cell(i, 1).text = value
+        
+        # Patient Information
+        doc.add_heading('PATIENT INFORMATION', level=1)
+        patient_info = [
+            ['Name:', f"{patient_data['first_name']} {patient_data['last_name']}"],
+            ['Phone:', patient_data['phone']],
+            ['Email:', patient_data.get('email', 'Not provided')],
+            ['Address:', patient_data['address']]
+        ]
+        table = doc.add_table(rows=4, cols=2)
+        for i, (key, value) in enumerate(patient_info):
+            table.cell(i, 0).text = key
+            table.cell(i, 1).text = value
+        
+        # Doctor Information
+        doc.add_heading('DOCTOR INFORMATION', level=1)
+        doctor_info = [
+            ['Name:', doctor_data['name']],
+            ['Specialization:', doctor_data['specialization']],
+            ['Qualification:', doctor_data['qualification']],
+            ['Experience:', doctor_data['experience']],
+            ['Phone:', doctor_data['phone']],
+            ['Email:', doctor_data['email']],
+            ['Address:', doctor_data['address']],
+            ['Consultation Fees:', doctor_data['fees']]
+        ]
+        table = doc.add_table(rows=8, cols=2)
+        for i, (key, value) in enumerate(doctor_info):
+            table.cell(i, 0).text = key
+            table.cell(i, 1).text = value
+        
+        # Medical Details
+        doc.add_heading('MEDICAL CONSULTATION DETAILS', level=1)
+        medical_info = [
+            ['Reason for Visit:', appointment_data['reason']],
+            ['Symptoms:', appointment_data['symptoms']],
+            ['Previous Diagnosis:', appointment_data.get('previous_diagnosis', 'Not specified')]
+        ]
+        table = doc.add_table(rows=3, cols=2)
+        for i, (key, value) in enumerate(medical_info):
+            table.cell(i, 0).text = key
+            table.cell(i, 1).text = value
+        
+        # Instructions
+        doc.add_heading('IMPORTANT INSTRUCTIONS', level=1)
+        instructions = [
+            "Please arrive 15 minutes before your scheduled appointment time",
+            "Bring your ID and insurance card (if applicable)",
+            "Bring any previous medical reports or test results",
+            "List of current medications",
+            "Emergency contact information"
+        ]
+        for instruction in instructions:
+            doc.add_paragraph(instruction, style='ListBullet')
+        
+        doc.add_paragraph(f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        doc.add_paragraph("Lung Cancer Detection System - Medical Services")
+        
+        doc.save(buffer)
+        buffer.seek(0)
+        
+    except Exception as e:
+        raise ReportError(f"Error generating DOCX: {e}") from e
+    
+    return buffer
+
+# ----------------------------------------------------
+# --- STRUCTURED PREDICTION REPORTS ---
+# ----------------------------------------------------
+
+# Report kind -> (title, subtitle, accent colour)
+REPORT_TYPES = {
+    'ML': ("LUNG CANCER RISK ASSESSMENT REPORT", "HEALTH PARAMETERS ANALYSIS", '#2E7D32'),
+    'CNN': ("LUNG CANCER DETECTION REPORT", "CT-SCAN ANALYSIS", '#1565C0'),
+}
+
+class Section:
+    """A report section: a heading followed by key/value rows, lists and text lines"""
+
+    def __init__(self, heading):
+        self.heading = heading
+        # (kind, content) with kind 'rows', 'bullets', 'numbered' or 'text'
+        self.blocks = []
+
+    def rows(self, pairs):
+        self.blocks.append(('rows', [[str(key), str(value)] for key, value in pairs]))
+        return self
+
+    def bullets(self, items):
+        self.blocks.append(('bullets', [str(item) for item in items]))
+        return self
+
+    def numbered(self, items):
+        self.blocks.append(('numbered', [str(item) for item in items]))
+        return self
+
+    def text(self, *lines):
+        self.blocks.append(('text', [str(line) for line in lines]))
+        return self
+
+class Report:
+    """Content of a prediction report, independent of the output format.
+
+    Only plain strings and lists are stored, so a report pickles cheaply to
+    render workers and hashes deterministically for the job cache.
+    """
+
+    def __init__(self, kind, generated_at=None):
+        self.kind = kind
+        self.title, self.subtitle, _ = REPORT_TYPES[kind]
+        self.generated_at = (generated_at or datetime.datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+        self.sections = []
+        self.footer = []
+
+    def section(self, heading):
+        section = Section(heading)
+        self.sections.append(section)
+        return section
+
+# --- report content ---
+
+# Label in the report -> key in the ML page's input data
+ML_PARAMETERS = [
+    ("Age", 'Age'), ("Gender", 'Gender'), ("Air Pollution Exposure", 'AirPollution'),
+    ("Alcohol Use", 'Alcoholuse'), ("Balanced Diet", 'BalancedDiet'), ("Obesity", 'Obesity'),
+    ("Smoking", 'Smoking'), ("Passive Smoker", 'PassiveSmoker'), ("Fatigue", 'Fatigue'),
+    ("Weight Loss", 'WeightLoss'), ("Shortness of Breath", 'ShortnessofBreath'), ("Wheezing", 'Wheezing'),
+    ("Swallowing Difficulty", 'SwallowingDifficulty'), ("Clubbing of Finger Nails", 'ClubbingofFingerNails'),
+    ("Frequent Cold", 'FrequentCold'), ("Dry Cough", 'DryCough'), ("Snoring", 'Snoring'),
+]
+
+ML_INTERPRETATION = {
+    'High': "HIGH RISK: Immediate medical consultation recommended",
+    'Medium': "MODERATE RISK: Follow-up with healthcare provider advised",
+    'Low': "LOW RISK: Continue regular health monitoring",
+}
+
+ML_RECOMMENDATIONS = {
+    'High': [
+        "Consult a pulmonologist or oncologist immediately",
+        "Schedule diagnostic tests (CT scan, biopsy)",
+        "Discuss family history and genetic factors",
+        "Implement lifestyle changes immediately"
+    ],
+    'Medium': [
+        "Schedule appointment with primary care physician",
+        "Consider preventive screening in 3-6 months",
+        "Monitor symptoms and maintain health journal",
+        "Review and reduce risk factors"
+    ],
+    'Low': [
+        "Continue regular health check-ups",
+        "Maintain healthy lifestyle habits",
+        "Be aware of early warning signs",
+        "Annual health screening recommended"
+    ],
+}
+
+# Keyed by the risk band the CNN page assigned with its calibrated thresholds
+CNN_CONFIDENCE_ANALYSIS = {
+    'High': "High confidence in detection - Strong indicators present",
+    'Medium': "Moderate confidence - Requires follow-up evaluation",
+    'Low': "Low confidence - Likely normal case",
+}
+
+def _patient_section(report, user_data, username):
+    report.section("PATIENT INFORMATION").rows([
+        ("Name", f"{user_data.get('first_name', 'N/A')} {user_data.get('last_name', 'N/A')}"),
+        ("Username", username),
+    ])
+
+def _footer(report):
+    report.footer = ["Report generated by Lung Cancer Detection System",
+                     datetime.datetime.now().strftime("%B %d, %Y")]
+
+def build_ml_report(user_data, username, input_data, prediction_result, risk_level):
+    """Structured report for a health-parameter (ML) risk prediction"""
+    report = Report('ML')
+    _patient_section(report, user_data, username)
+    report.section("HEALTH PARAMETERS ANALYZED").bullets(
+        f"{label}: {input_data.get(key, 'N/A')}" for label, key in ML_PARAMETERS
+    )
+    report.section("RISK ASSESSMENT RESULTS").rows([("Risk Level", risk_level), ("Prediction", prediction_result)])
+    # Anything other than High/Medium is reported as low risk
+    level = risk_level if risk_level in ('High', 'Medium') else 'Low'
+    report.section("RISK INTERPRETATION").text(ML_INTERPRETATION[level])
+    report.section("RECOMMENDED ACTIONS").numbered(ML_RECOMMENDATIONS[level])
+    report.section("MODEL INFORMATION").rows([
+        ("AI Model", "Ensemble Machine Learning Model"),
+        ("Algorithm", "Multiple Classifiers (SVM, Decision Tree, KNN)"),
+        ("Features", "17 health parameters"),
+        ("Accuracy", ">95% on validation data"),
+    ])
+    report.section("IMPORTANT DISCLAIMER").text(
+        "This assessment is based on machine learning analysis of provided parameters.",
+        "It is intended for educational and screening purposes only.",
+        "NOT a substitute for professional medical diagnosis.",
+        "Always consult healthcare providers for medical decisions.",
+    )
+    _footer(report)
+    return report
+
+def build_cnn_report(user_data, username, file_details, prediction_data, risk_level, recommendations,
+                     risk_bands=(0.75, 0.25)):
+    """Structured report for a CT-scan (CNN) prediction"""
+    report = Report('CNN')
+    _patient_section(report, user_data, username)
+    report.section("CT-SCAN INFORMATION").rows([
+        ("File Name", file_details['FileName']),
+        ("File Type", file_details['FileType']),
+        ("File Size", file_details['FileSize']),
+    ])
+    report.section("AI PREDICTION RESULTS").rows([
+        ("Risk Level", risk_level),
+        ("Final Prediction", prediction_data['final_prediction']),
+        ("Cancer Confidence", f"{prediction_data['cancer_confidence']:.2%}"),
+        ("Normal Confidence", f"{prediction_data['normal_confidence']:.2%}"),
+    ])
+    report.section("CONFIDENCE ANALYSIS").text(CNN_CONFIDENCE_ANALYSIS[risk_level])
+    report.section("MEDICAL RECOMMENDATIONS").numbered(recommendations)
+    report.section("TECHNICAL DETAILS").rows([
+        ("AI Model", "Convolutional Neural Network (CNN)"),
+        ("Model Input", "CT-Scan Images (150x150 pixels)"),
+        ("Classification", "Binary (Cancer/Normal)"),
+        ("Risk Bands", f"High >= {risk_bands[0]:.0%}, Medium >= {risk_bands[1]:.0%} cancer confidence"),
+    ])
+    report.section("IMPORTANT MEDICAL DISCLAIMER").text(
+        "This report is generated by an AI system for assistive purposes only.",
+        "It should NOT be used as a substitute for professional medical diagnosis.",
+        "Always consult with qualified healthcare providers for medical decisions.",
+        "False positives and false negatives are possible with AI systems.",
+    )
+    _footer(report)
+    return report
+
+# --- renderers ---
+
+def generate_report_txt(report):
+    """Plain-text rendering of a report"""
+    heading = f"{report.title} - {report.subtitle}"
+    lines = ['', heading, '=' * len(heading), '', f"Generated on: {report.generated_at}", '']
+    for section in report.sections:
+        lines += [section.heading, '-' * len(section.heading)]
+        for kind, content in section.blocks:
+            if kind == 'rows':
+                lines += [f"{key}: {value}" for key, value in content]
+            elif kind == 'bullets':
+                lines += [f"- {item}" for item in content]
+            elif kind == 'numbered':
+                lines += [f"{i}. {item}" for i, item in enumerate(content, 1)]
+            else:
+                lines += content
+        lines.append('')
+    lines += report.footer
+    return '\n'.join(lines) + '\n'
+
+@functools.lru_cache(maxsize=None)
+def _pdf_styles():
+    """Paragraph and table styles, built once per process and shared by every PDF report"""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import TableStyle
+
+    sheet = getSampleStyleSheet()
+    return {
+        'titles': {
+            kind: ParagraphStyle(f'ReportTitle{kind}', parent=sheet['Heading1'], fontSize=16,
+                                 spaceAfter=10, alignment=1, textColor=colors.HexColor(color))
+            for kind, (_, _, color) in REPORT_TYPES.items()
+        },
+        'subtitle': ParagraphStyle('ReportSubtitle', parent=sheet['Heading2'], fontSize=12,
+                                   spaceAfter=30, alignment=1, textColor=colors.gray),
+        'heading': sheet['Heading2'],
+        'normal': sheet['Normal'],
+        'rows': TableStyle([
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]),
+    }
+
+def _report_story(report, styles):
+    """reportlab flowables for one report"""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer, Table
+
+    story = [
+        Paragraph(escape(report.title), styles['titles'][report.kind]),
+        Paragraph(escape(report.subtitle), styles['subtitle']),
+        Paragraph(f"Generated on: {report.generated_at}", styles['normal']),
+        Spacer(1, 20),
+    ]
+    
+    for section in report.sections:
+        story.append(Paragraph(escape(section.heading), styles['heading']))
+        story.append(Spacer(1, 10))
+        for kind, content in section.blocks:
+            if kind == 'rows':
+                story.append(Table(content, colWidths=[2 * inch, 4 * inch], style=styles['rows'], hAlign='LEFT'))
+                story.append(Spacer(1, 8))
+            elif kind in ('bullets', 'numbered'):
+                for i, item in enumerate(content, 1):
+                    marker = "•" if kind == 'bullets' else f"{i}."
+                    story.append(Paragraph(f"{marker} {escape(item)}", styles['normal']))
+                    story.append(Spacer(1, 5))
+            else:
+                for line in content:
+                    story.append(Paragraph(escape(line), styles['normal']))
+                    story.append(Spacer(1, 8))
+    
+    story.append(Spacer(1, 20))
+    for line in report.footer:
+        story.append(Paragraph(escape(line), styles['normal']))
+    return story
+
+def generate_report_pdf(report):
+    """Generate PDF report"""
+    return generate_reports_pdf([report])
+
+def generate_reports_pdf(report_list):
+    """One PDF with every report in report_list, each starting on a new page"""
+    buffer = io.BytesIO()
+    
+    if not PDF_AVAILABLE:
+        raise ReportUnavailable("PDF generation not available. Please install reportlab.")
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, PageBreak
+    
+    try:
+        styles = _pdf_styles()
+        doc = SimpleDocTemplate(buffer, pagesize=A4)
+        story = []
+        for report in report_list:
+            if story:
+                story.append(PageBreak())
+            story.extend(_report_story(report, styles))
+        
+        doc.build(story)
+        buffer.seek(0)
+        
+    except Exception as e:
+        raise ReportError(f"Error generating PDF report: {e}") from e
+    
+    return buffer
+
+@functools.lru_cache(maxsize=None)
+def _docx_template():
+    """Serialized blank document; each report is opened from these bytes instead of the packaged template"""
+    from docx import Document
+
+    buffer = io.BytesIO()
+    Document().save(buffer)
+    return buffer.getvalue()
+
+def generate_report_docx(report):
+    """Generate DOCX report"""
+    buffer = io.BytesIO()
+    
+    if not DOCX_AVAILABLE:
+        raise ReportUnavailable("DOCX generation not available. Please install python-docx.")
+    from docx import Document
+    
+    try:
+        doc = Document(io.BytesIO(_docx_template()))
+        
+        title = doc.add_heading(report.title, 0)
+        title.alignment = 1
+        doc.add_heading(report.subtitle, level=1).alignment = 1
+        doc.add_paragraph(f"Generated on: {report.generated_at}")
+        
+        for section in report.sections:
+            doc.add_heading(section.heading, level=1)
+            for kind, content in section.blocks:
+                if kind == 'rows':
+                    table = doc.add_table(rows=len(content), cols=2)
+                    for row, (key, value) in zip(table.rows, content):
+                        row.cells[0].text = key
+                        row.cells[1].text = value
+                elif kind == 'bullets':
+                    for item in content:
+                        doc.add_paragraph(item, style='ListBullet')
+                elif kind == 'numbered':
+                    for item in content:
+                        doc.add_paragraph(item, style='ListNumber')
+                else:
+                    for line in content:
+                        doc.add_paragraph(line)
+        
+        for line in report.footer:
+            doc.add_paragraph(line)
+        
+        doc.save(buffer)
+        buffer.seek(0)
+        
+    except Exception as e:
+        raise ReportError(f"Error generating DOCX report: {e}") from e
+    
+    return buffer
@@ -0,0 +1,217 @@
+import csv
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# ----------------------------------------------------
+# --- RISK MODEL INPUT LAYOUT ---
+# ----------------------------------------------------
+
+# Column order expected by models/final_model.sav (same as datasets/testx.csv)
+FEATURE_COLUMNS = [
+    'Age', 'Gender', 'Air Pollution', 'Alcohol use', 'Balanced Diet', 'Obesity',
+    'Smoking', 'Passive Smoker', 'Fatigue', 'Weight Loss', 'Shortness of Breath',
+    'Wheezing', 'Swallowing Difficulty', 'Clubbing of Finger Nails', 'Frequent Cold',
+    'Dry Cough', 'Snoring'
+]
+
+# Rows read, validated and scored at a time
+CHUNK_ROWS = 10000
+
+PREDICTION_COLUMN = 'Predicted Level'
+ERROR_COLUMN = 'Error'
+
+class ScoringError(Exception):
+    """Raised when an upload cannot be scored at all (unreadable file, missing columns)"""
+
+class ModelUnavailable(Exception):
+    """Raised when the risk model is not loaded (failed or missing model file)"""
+
+# ----------------------------------------------------
+# --- READING ---
+# ----------------------------------------------------
+
+def file_format(filename):
+    """'csv' or 'parquet' from a file name"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.parquet', '.pq'):
+        return 'parquet'
+    raise ScoringError(f"Unsupported file type '{ext}'. Upload a CSV or Parquet file.")
+
+def iter_chunks(source, fmt, chunk_rows=CHUNK_ROWS):
+    """Yield DataFrames of at most chunk_rows rows without reading the whole file.
+
+    Any failure to read or parse the source, on the first chunk or a later
+    one, is raised as ScoringError.
+    """
+    if fmt not in ('csv', 'parquet'):
+        raise ScoringError(f"Unsupported format '{fmt}'")
+    try:
+        if fmt == 'csv':
+            # Keep the raw text so validation, not the parser, decides what is numeric
+            yield from pd.read_csv(source, chunksize=chunk_rows, dtype=str, keep_default_na=False)
+        else:
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ScoringError("Reading Parquet files requires pyarrow")
+            for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+                yield batch.to_pandas()
+    # ParserError, UnicodeDecodeError and pyarrow's ArrowInvalid are all ValueErrors;
+    # ArrowIOError is an OSError
+    except (ValueError, OSError) as e:
+        raise ScoringError(f"Could not read the file: {e}")
+
+# ----------------------------------------------------
+# --- VALIDATION AND SCORING ---
+# ----------------------------------------------------
+
+def check_columns(columns):
+    missing = [name for name in FEATURE_COLUMNS if name not in columns]
+    if missing:
+        raise ScoringError(f"Missing columns: {', '.join(missing)}")
+
+def validate_chunk(chunk):
+    """Convert the feature columns in one vectorized pass.
+
+    Returns (features, errors): a float64 (rows, 17) array and a per-row
+    error message Series ('' for valid rows).
+    """
+    check_columns(chunk.columns)
+    raw = chunk[FEATURE_COLUMNS]
+    if raw.dtypes.map(pd.api.types.is_numeric_dtype).all():
+        values = raw.astype(np.float64)
+    else:
+        values = raw.apply(pd.to_numeric, errors='coerce')
+
+    invalid = values.isna().to_numpy()
+    errors = pd.Series('', index=chunk.index)
+    bad_rows = invalid.any(axis=1)
+    if bad_rows.any():
+        # Name the offending columns for each rejected row
+        names = np.array(FEATURE_COLUMNS, dtype=object)
+        errors[bad_rows] = [
+            "Missing or non-numeric: " + ", ".join(names[row]) for row in invalid[bad_rows]
+        ]
+    return values.to_numpy(dtype=np.float64), errors
+
+def score_chunk(model, chunk):
+    """Score one chunk; invalid rows are kept with an error message and no prediction"""
+    features, errors = validate_chunk(chunk)
+    valid = (errors == '').to_numpy()
+
+    result = chunk.copy()
+    result[PREDICTION_COLUMN] = ''
+    classes = getattr(model, 'classes_', None)
+    has_proba = hasattr(model, 'predict_proba') and classes is not None
+    if has_proba:
+        for cls in classes:
+            result[f"P({cls})"] = np.nan
+
+    if valid.any():
+        rows = features[valid]
+        result.loc[valid, PREDICTION_COLUMN] = model.predict(rows)
+        if has_proba:
+            probas = model.predict_proba(rows)
+            for idx, cls in enumerate(classes):
+                result.loc[valid, f"P({cls})"] = probas[:, idx]
+
+    result[ERROR_COLUMN] = errors
+    return result
+
+def score_stream(model, source, fmt, out, chunk_rows=CHUNK_ROWS, on_progress=None):
+    """Score a CSV/Parquet source chunk by chunk, appending CSV rows to the text stream out.
+
+    Only one chunk is held in memory at a time. Returns a summary with row
+    counts, the predicted level distribution and throughput.
+    """
+    started = time.perf_counter()
+    summary = {'rows': 0, 'scored': 0, 'invalid': 0, 'levels': {}}
+    header = True
+
+    for chunk in iter_chunks(source, fmt, chunk_rows):
+        result = score_chunk(model, chunk)
+        result.to_csv(out, index=False, header=header, quoting=csv.QUOTE_MINIMAL)
+        header = False
+
+        invalid = int((result[ERROR_COLUMN] != '').sum())
+        summary['rows'] += len(result)
+        summary['invalid'] += invalid
+        summary['scored'] += len(result) - invalid
+        for level, count in result.loc[result[ERROR_COLUMN] == '', PREDICTION_COLUMN].value_counts().items():
+            summary['levels'][str(level)] = summary['levels'].get(str(level), 0) + int(count)
+        if on_progress is not None:
+            on_progress(summary)
+
+    summary['seconds'] = time.perf_counter() - started
+    summary['rows_per_second'] = summary['rows'] / summary['seconds'] if summary['seconds'] else 0.0
+    return summary
+
+# ----------------------------------------------------
+# --- MEMOIZED SINGLE-ROW PREDICTIONS ---
+# ----------------------------------------------------
+
+# Distinct feature vectors remembered per model version
+MEMO_MAX_ENTRIES = int(os.environ.get('RISK_MEMO_SIZE', 50000))
+
+def feature_key(values, model_version):
+    """Cache key from a 17-value row: '32', 32 and 32.0 all normalize to the same key"""
+    row = tuple(float(v) for v in values)
+    if len(row) != len(FEATURE_COLUMNS):
+        raise ValueError(f"Expected {len(FEATURE_COLUMNS)} features, got {len(row)}")
+    return f"risk:{model_version}:{row}"
+
+def _prediction_records(model, features):
+    labels = model.predict(features)
+    probas = model.predict_proba(features) if hasattr(model, 'predict_proba') else None
+    records = []
+    for idx, label in enumerate(labels):
+        record = {'prediction': label.item() if hasattr(label, 'item') else label, 'confidence': None}
+        if probas is not None:
+            record['confidence'] = float(np.max(probas[idx]))
+        records.append(record)
+    return records
+
+class MemoizedRiskModel:
+    """Bounded memo over the registry's risk model.
+
+    Rows are keyed by their normalized feature tuple and the model version,
+    so repeated scoring of the same questionnaire is a dictionary lookup and
+    a hot-swapped model starts from an empty key space. ``precompute`` scores
+    a whole frame in one vectorized call to pre-fill the memo.
+    """
+
+    def __init__(self, registry, cache, name='risk'):
+        self.registry = registry
+        self.cache = cache
+        self.name = name
+
+    def predict_row(self, values):
+        """{'prediction': label, 'confidence': max class probability or None} for one row"""
+        model, version = self.registry.get_with_version(self.name)
+        if model is None:
+            raise ModelUnavailable(f"Risk model is not loaded: {self.registry.metadata(self.name).get('error')}")
+        key = feature_key(values, version)
+        record = self.cache.get(key)
+        if record is None:
+            features = np.asarray([[float(v) for v in values]], dtype=np.float64)
+            record = _prediction_records(model, features)[0]
+            self.cache.put(key, record)
+        return record
+
+    def precompute(self, frame):
+        """Score every row of a DataFrame with the feature columns and memoize the results"""
+        model, version = self.registry.get_with_version(self.name)
+        if model is None or frame.empty:
+            return 0
+        features = frame[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+        for row, record in zip(features, _prediction_records(model, features)):
+            self.cache.put(feature_key(row, version), record)
+        return len(features)
+
+    def stats(self):
+        return self.cache.stats()
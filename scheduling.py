@@ -0,0 +1,188 @@
+import datetime
+import threading
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# ----------------------------------------------------
+# --- APPOINTMENT SLOT INDEX ---
+# ----------------------------------------------------
+
+class SlotIndex:
+    """In-memory index of confirmed appointment slots.
+
+    Slots are grouped per (doctor_id, date) so both "is this slot taken?"
+    and "which times are still free for this doctor on this day?" are
+    dictionary lookups instead of scans over every appointment. The index
+    lives for the whole server process and is shared by all sessions.
+    """
+
+    def __init__(self):
+        self._days = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def subscribe(self, listener):
+        """Call listener(doctor_id, date, time, booked) whenever a slot changes"""
+        self._listeners.append(listener)
+
+    def _notify(self, doctor_id, date, time, booked):
+        for listener in self._listeners:
+            listener(doctor_id, date, time, booked)
+
+    def load(self, appointments):
+        """Rebuild the index from (doctor_id, date, time, appointment_id) tuples"""
+        days = {}
+        for doctor_id, date, time, appointment_id in appointments:
+            days.setdefault((doctor_id, date), {})[time] = appointment_id
+        with self._lock:
+            self._days = days
+
+    def is_booked(self, doctor_id, date, time):
+        day = self._days.get((doctor_id, date))
+        return day is not None and time in day
+
+    def booked_times(self, doctor_id, date):
+        """Times already confirmed for a doctor on a day"""
+        return set(self._days.get((doctor_id, date), ()))
+
+    def available_times(self, doctor_id, date, candidate_times):
+        """Filter candidate_times down to those still free, preserving order"""
+        day = self._days.get((doctor_id, date), {})
+        return [time for time in candidate_times if time not in day]
+
+    def reserve(self, doctor_id, date, time, appointment_id):
+        """Claim a slot; returns False if it is already taken"""
+        with self._lock:
+            day = self._days.setdefault((doctor_id, date), {})
+            if time in day:
+                return False
+            day[time] = appointment_id
+        self._notify(doctor_id, date, time, True)
+        return True
+
+    def release(self, doctor_id, date, time, appointment_id=None):
+        """Free a slot (only if it is held by appointment_id, when given)"""
+        with self._lock:
+            day = self._days.get((doctor_id, date))
+            if not day or time not in day:
+                return
+            if appointment_id is not None and day[time] != appointment_id:
+                return
+            del day[time]
+            if not day:
+                del self._days[(doctor_id, date)]
+        self._notify(doctor_id, date, time, False)
+
+# ----------------------------------------------------
+# --- SLOT AVAILABILITY ENGINE ---
+# ----------------------------------------------------
+
+class AvailabilityEngine:
+    """Precomputed free-slot bitmaps per doctor per day over a rolling horizon.
+
+    Bit ``i`` of a day's mask is set when ``slot_times[i]`` is free: the
+    doctor works that weekday and nobody holds a confirmed booking. Each
+    doctor's horizon is a bytearray (one mask per day, up to 8 slots), so
+    listing bookable dates and times never touches the appointments table.
+    """
+
+    def __init__(self, slot_times, horizon_days=60):
+        if len(slot_times) > 8:
+            raise ValueError("AvailabilityEngine supports at most 8 slots per day")
+        self.slot_times = list(slot_times)
+        self.horizon_days = horizon_days
+        self._slot_bit = {time: 1 << i for i, time in enumerate(self.slot_times)}
+        self._full_mask = (1 << len(self.slot_times)) - 1
+        self._working_days = {}
+        self._masks = {}
+        self._start = None
+        self._slot_index = None
+        self._lock = threading.Lock()
+
+    def attach(self, doctors, slot_index):
+        """Build bitmaps for doctors and follow bookings made through slot_index"""
+        self._working_days = {
+            doc['id']: {WEEKDAYS.index(day) for day in doc['availability']}
+            for doc in doctors
+        }
+        self._slot_index = slot_index
+        slot_index.subscribe(self._on_slot_change)
+        self.rebuild()
+
+    def rebuild(self, today=None):
+        """Recompute every doctor's bitmap for the horizon starting today"""
+        today = today or datetime.date.today()
+        masks = {}
+        for doctor_id, working_days in self._working_days.items():
+            bitmap = bytearray(self.horizon_days)
+            for offset in range(self.horizon_days):
+                day = today + datetime.timedelta(days=offset)
+                if day.weekday() not in working_days:
+                    continue
+                mask = self._full_mask
+                for time in self._slot_index.booked_times(doctor_id, day.strftime("%Y-%m-%d")):
+                    mask &= ~self._slot_bit.get(time, 0)
+                bitmap[offset] = mask
+            masks[doctor_id] = bitmap
+        with self._lock:
+            self._masks = masks
+            self._start = today
+
+    def _roll_forward(self):
+        # Rebuild lazily the first time the engine is queried on a new day
+        if self._start != datetime.date.today():
+            self.rebuild()
+
+    def _offset(self, date):
+        if isinstance(date, str):
+            date = datetime.date.fromisoformat(date)
+        offset = (date - self._start).days
+        return offset if 0 <= offset < self.horizon_days else None
+
+    def _on_slot_change(self, doctor_id, date, time, booked):
+        bit = self._slot_bit.get(time)
+        with self._lock:
+            bitmap = self._masks.get(doctor_id)
+            offset = self._offset(date) if self._start else None
+            if bit is None or bitmap is None or offset is None:
+                return
+            day = self._start + datetime.timedelta(days=offset)
+            if day.weekday() not in self._working_days[doctor_id]:
+                return
+            if booked:
+                bitmap[offset] &= ~bit
+            else:
+                bitmap[offset] |= bit
+
+    def _day_mask(self, doctor_id, date, now=None):
+        bitmap = self._masks.get(doctor_id)
+        offset = self._offset(date)
+        if bitmap is None or offset is None:
+            return 0
+        mask = bitmap[offset]
+        if offset == 0 and mask:
+            # Drop slots that have already started today
+            now = now or datetime.datetime.now()
+            for time, bit in self._slot_bit.items():
+                if datetime.datetime.strptime(time, "%I:%M %p").time() <= now.time():
+                    mask &= ~bit
+        return mask
+
+    def free_times(self, doctor_id, date):
+        """Bookable times for a doctor on a date, in slot order"""
+        self._roll_forward()
+        mask = self._day_mask(doctor_id, date)
+        return [time for time in self.slot_times if mask & self._slot_bit[time]]
+
+    def is_free(self, doctor_id, date, time):
+        self._roll_forward()
+        return bool(self._day_mask(doctor_id, date) & self._slot_bit.get(time, 0))
+
+    def available_dates(self, doctor_id):
+        """Dates in the horizon with at least one free slot for the doctor"""
+        self._roll_forward()
+        return [
+            self._start + datetime.timedelta(days=offset)
+            for offset in range(self.horizon_days)
+            if self._day_mask(doctor_id, self._start + datetime.timedelta(days=offset))
+        ]
@@ -0,0 +1,687 @@
+import atexit
+import datetime
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import metrics
+from scheduling import AvailabilityEngine, SlotIndex
+
+logger = logging.getLogger("storage")
+
+# ----------------------------------------------------
+# --- DATABASE CONFIGURATION ---
+# ----------------------------------------------------
+
+DB_PATH = os.environ.get('LUNG_CANCER_DB', 'lung_cancer.db')
+POOL_SIZE = 4
+WRITE_BATCH_SIZE = 50
+WRITE_FLUSH_INTERVAL = 2.0  # seconds
+# Rows kept for retry while the database is unavailable; the oldest are dropped beyond this
+WRITE_MAX_PENDING = 10000
+
+APPOINTMENT_STATUSES = ('Confirmed', 'Cancelled', 'Completed')
+
+# SQLite version of lung_cancer_db.sql
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    email TEXT,
+    phone TEXT,
+    address TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS doctors (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    specialization TEXT NOT NULL,
+    qualification TEXT,
+    experience TEXT,
+    phone TEXT,
+    email TEXT,
+    address TEXT,
+    fees TEXT,
+    rating TEXT,
+    availability TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    appointment_id TEXT UNIQUE NOT NULL,
+    user_id INTEGER NOT NULL,
+    doctor_id INTEGER NOT NULL,
+    patient_name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    email TEXT,
+    address TEXT NOT NULL,
+    specialization TEXT NOT NULL,
+    appointment_date DATE NOT NULL,
+    appointment_time TIME NOT NULL,
+    reason TEXT,
+    symptoms TEXT,
+    previous_diagnosis TEXT,
+    status TEXT DEFAULT 'Confirmed' CHECK (status IN ('Confirmed', 'Cancelled', 'Completed')),
+    booked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    FOREIGN KEY (doctor_id) REFERENCES doctors(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_appointments_slot
+    ON appointments(doctor_id, appointment_date, appointment_time, status);
+CREATE INDEX IF NOT EXISTS idx_appointments_user
+    ON appointments(user_id);
+CREATE INDEX IF NOT EXISTS idx_appointments_status
+    ON appointments(status, specialization);
+CREATE INDEX IF NOT EXISTS idx_appointments_date
+    ON appointments(appointment_date, appointment_time);
+
+-- Running totals maintained by metrics.py in the same transactions as the writes they count
+CREATE TABLE IF NOT EXISTS metric_counters (
+    name TEXT NOT NULL,
+    label TEXT NOT NULL DEFAULT '',
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, label)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS metric_buckets (
+    name TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS ml_predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    age INTEGER,
+    gender INTEGER,
+    air_pollution REAL,
+    alcohol_use REAL,
+    balanced_diet REAL,
+    obesity REAL,
+    smoking REAL,
+    passive_smoker REAL,
+    fatigue REAL,
+    weight_loss REAL,
+    shortness_of_breath REAL,
+    wheezing REAL,
+    swallowing_difficulty REAL,
+    clubbing_of_finger_nails REAL,
+    frequent_cold REAL,
+    dry_cough REAL,
+    snoring REAL,
+    prediction_result TEXT,
+    risk_level TEXT,
+    confidence_score REAL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+CREATE TABLE IF NOT EXISTS cnn_predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    file_name TEXT,
+    file_type TEXT,
+    file_size TEXT,
+    cancer_confidence REAL,
+    normal_confidence REAL,
+    final_prediction TEXT,
+    risk_level TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+"""
+
+# ----------------------------------------------------
+# --- SQL STATEMENTS ---
+# ----------------------------------------------------
+# Statements are module constants so sqlite3's per-connection statement
+# cache compiles each one once and reuses the prepared statement.
+
+SQL_INSERT_USER = """
+INSERT OR IGNORE INTO users (username, password, first_name, last_name, email, phone, address)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+SQL_GET_USER = "SELECT * FROM users WHERE username = ?"
+SQL_LIST_USERS = "SELECT * FROM users ORDER BY id"
+SQL_COUNT_USERS = "SELECT COUNT(*) FROM users"
+SQL_SEARCH_USERS = """
+SELECT * FROM users
+WHERE username LIKE ? ESCAPE '\\' OR first_name LIKE ? ESCAPE '\\'
+   OR last_name LIKE ? ESCAPE '\\' OR email LIKE ? ESCAPE '\\'
+ORDER BY id LIMIT ? OFFSET ?
+"""
+SQL_COUNT_SEARCH_USERS = """
+SELECT COUNT(*) FROM users
+WHERE username LIKE ? ESCAPE '\\' OR first_name LIKE ? ESCAPE '\\'
+   OR last_name LIKE ? ESCAPE '\\' OR email LIKE ? ESCAPE '\\'
+"""
+SQL_USERS_PAGE = "SELECT * FROM users ORDER BY id LIMIT ? OFFSET ?"
+
+SQL_UPSERT_DOCTOR = """
+INSERT INTO doctors (id, name, specialization, qualification, experience, phone, email, address, fees, rating, availability)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    name = excluded.name, specialization = excluded.specialization,
+    qualification = excluded.qualification, experience = excluded.experience,
+    phone = excluded.phone, email = excluded.email, address = excluded.address,
+    fees = excluded.fees, rating = excluded.rating, availability = excluded.availability
+"""
+
+SQL_SLOT_TAKEN = """
+SELECT appointment_id FROM appointments
+WHERE doctor_id = ? AND appointment_date = ? AND appointment_time = ? AND status = 'Confirmed'
+LIMIT 1
+"""
+SQL_INSERT_APPOINTMENT = """
+INSERT INTO appointments (appointment_id, user_id, doctor_id, patient_name, phone, email, address,
+                          specialization, appointment_date, appointment_time, reason, symptoms,
+                          previous_diagnosis, status, booked_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+SQL_SELECT_APPOINTMENTS = """
+SELECT a.*, d.name AS doctor_name, u.username AS username
+FROM appointments a
+JOIN doctors d ON d.id = a.doctor_id
+JOIN users u ON u.id = a.user_id
+"""
+SQL_LIST_APPOINTMENTS = SQL_SELECT_APPOINTMENTS + " ORDER BY a.id"
+# Newest first; idx_appointments_user also covers the rowid, so keyset pages are index range scans
+SQL_USER_APPOINTMENTS = SQL_SELECT_APPOINTMENTS + " WHERE a.user_id = ? ORDER BY a.id DESC"
+SQL_USER_APPOINTMENTS_PAGE = SQL_SELECT_APPOINTMENTS + " WHERE a.user_id = ? AND a.id < ? ORDER BY a.id DESC LIMIT ?"
+SQL_COUNT_USER_APPOINTMENTS = "SELECT COUNT(*) FROM appointments WHERE user_id = ?"
+SQL_GET_APPOINTMENT = SQL_SELECT_APPOINTMENTS + " WHERE a.appointment_id = ?"
+SQL_COUNT_APPOINTMENTS = """
+SELECT COUNT(*) FROM appointments a
+JOIN doctors d ON d.id = a.doctor_id
+JOIN users u ON u.id = a.user_id
+"""
+SQL_APPOINTMENT_STATUS = "SELECT status FROM appointments WHERE appointment_id = ?"
+SQL_UPDATE_APPOINTMENT_STATUS = "UPDATE appointments SET status = ? WHERE appointment_id = ?"
+SQL_CONFIRMED_SLOTS = """
+SELECT doctor_id, appointment_date, appointment_time, appointment_id
+FROM appointments WHERE status = 'Confirmed'
+"""
+
+SQL_INSERT_ML_PREDICTION = """
+INSERT INTO ml_predictions (user_id, age, gender, air_pollution, alcohol_use, balanced_diet, obesity,
+                            smoking, passive_smoker, fatigue, weight_loss, shortness_of_breath, wheezing,
+                            swallowing_difficulty, clubbing_of_finger_nails, frequent_cold, dry_cough,
+                            snoring, prediction_result, risk_level, confidence_score)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+SQL_INSERT_CNN_PREDICTION = """
+INSERT INTO cnn_predictions (user_id, file_name, file_type, file_size, cancer_confidence,
+                             normal_confidence, final_prediction, risk_level)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Admin table sort options -> ORDER BY clause (never built from user input)
+APPOINTMENT_SORTS = {
+    'Booked': 'a.id',
+    'Date': 'a.appointment_date {dir}, a.appointment_time',
+    'Patient': 'a.patient_name',
+    'Doctor': 'd.name',
+    'Status': 'a.status',
+}
+
+# Order of the ML input fields used by the prediction page (matches ml_predictions columns)
+ML_INPUT_FIELDS = [
+    'Age', 'Gender', 'AirPollution', 'Alcoholuse', 'BalancedDiet', 'Obesity', 'Smoking',
+    'PassiveSmoker', 'Fatigue', 'WeightLoss', 'ShortnessofBreath', 'Wheezing',
+    'SwallowingDifficulty', 'ClubbingofFingerNails', 'FrequentCold', 'DryCough', 'Snoring'
+]
+
+# ----------------------------------------------------
+# --- VALUE CONVERSION HELPERS ---
+# ----------------------------------------------------
+
+def to_db_time(display_time):
+    """Convert the app's '09:00 AM' time strings into sortable 'HH:MM' values"""
+    return datetime.datetime.strptime(display_time, "%I:%M %p").strftime("%H:%M")
+
+def from_db_time(db_time):
+    """Convert a stored 'HH:MM' value back into the app's '09:00 AM' format"""
+    return datetime.datetime.strptime(db_time, "%H:%M").strftime("%I:%M %p")
+
+def _user_from_row(row):
+    return {
+        'id': row['id'],
+        'username': row['username'],
+        'password': row['password'],
+        'profile': {
+            'first_name': row['first_name'],
+            'last_name': row['last_name'],
+            'phone': row['phone'] or '',
+            'address': row['address'] or '',
+            'email': row['email'] or ''
+        }
+    }
+
+def _appointment_from_row(row):
+    """Build the appointment dict shape used throughout the app"""
+    return {
+        'id': row['id'],
+        'appointment_id': row['appointment_id'],
+        'username': row['username'],
+        'patient_name': row['patient_name'],
+        'phone': row['phone'],
+        'email': row['email'] or '',
+        'address': row['address'],
+        'specialization': row['specialization'],
+        'doctor_id': row['doctor_id'],
+        'doctor_name': row['doctor_name'],
+        'date': row['appointment_date'],
+        'time': from_db_time(row['appointment_time']),
+        'reason': row['reason'],
+        'symptoms': row['symptoms'],
+        'previous_diagnosis': row['previous_diagnosis'] or '',
+        'status': row['status'],
+        'booked_on': row['booked_at']
+    }
+
+def _like(text):
+    """LIKE pattern matching text anywhere, with wildcards in text escaped"""
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+def _appointment_filters(status=None, specialization=None, search=None):
+    """WHERE clause and parameters for the admin appointment filters"""
+    clauses, params = [], []
+    if status:
+        clauses.append("a.status = ?")
+        params.append(status)
+    if specialization:
+        clauses.append("a.specialization = ?")
+        params.append(specialization)
+    if search:
+        pattern = _like(search)
+        clauses.append("(a.patient_name LIKE ? ESCAPE '\\' OR a.appointment_id LIKE ? ESCAPE '\\' "
+                       "OR u.username LIKE ? ESCAPE '\\' OR d.name LIKE ? ESCAPE '\\')")
+        params.extend([pattern] * 4)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+# ----------------------------------------------------
+# --- CONNECTION POOL ---
+# ----------------------------------------------------
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections shared by all Streamlit sessions"""
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self._connections = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._connections.put(self._connect(db_path))
+
+    @staticmethod
+    def _connect(db_path):
+        conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False,
+                               isolation_level=None, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the block"""
+        conn = self._connections.get()
+        try:
+            yield conn
+        finally:
+            self._connections.put(conn)
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """Borrow a connection and run the block inside a single transaction"""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+# ----------------------------------------------------
+# --- WRITE BATCHING ---
+# ----------------------------------------------------
+
+class WriteBatcher:
+    """Buffers append-only inserts and writes them with executemany in one transaction"""
+
+    def __init__(self, pool, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL):
+        self._pool = pool
+        self._batch_size = batch_size
+        self._pending = {}
+        self._count = 0
+        self._retrying = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._flush_periodically, args=(flush_interval,),
+                                        name="storage-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, sql, params):
+        """Queue one row for insertion, flushing when the batch is full"""
+        with self._lock:
+            self._pending.setdefault(sql, []).append(params)
+            self._count += 1
+            # While a failed batch waits for the next periodic retry, callers don't retry it inline
+            full = self._count >= self._batch_size and not self._retrying
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write every queued row, putting them back in the queue if the database is busy or unavailable"""
+        with self._lock:
+            pending, self._pending, self._count = self._pending, {}, 0
+        if not pending:
+            return
+        try:
+            with self._pool.transaction() as conn:
+                for sql, rows in pending.items():
+                    conn.executemany(sql, rows)
+        except sqlite3.OperationalError as e:
+            logger.warning("Batched write of %d rows failed, retrying later: %s",
+                           sum(len(rows) for rows in pending.values()), e)
+            self._requeue(pending)
+        else:
+            with self._lock:
+                self._retrying = False
+
+    def _requeue(self, pending):
+        with self._lock:
+            # Failed rows go back ahead of anything queued since, so insertion order is kept
+            for sql, rows in self._pending.items():
+                pending.setdefault(sql, []).extend(rows)
+            count = sum(len(rows) for rows in pending.values())
+            for sql in list(pending):
+                if count <= WRITE_MAX_PENDING:
+                    break
+                drop = min(count - WRITE_MAX_PENDING, len(pending[sql]))
+                logger.error("Dropping %d queued rows for %s", drop, sql.split('(')[0].strip())
+                del pending[sql][:drop]
+                count -= drop
+            self._pending = {sql: rows for sql, rows in pending.items() if rows}
+            self._count = count
+            self._retrying = True
+
+    def _flush_periodically(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                # Rows that can never be written (e.g. constraint errors) are lost; the writer keeps going
+                logger.exception("Batched write failed; discarding the batch")
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+# ----------------------------------------------------
+# --- STORE ---
+# ----------------------------------------------------
+
+class Store:
+    """Persistent storage for users, doctors, appointments and predictions"""
+
+    def __init__(self, db_path=DB_PATH, pool_size=POOL_SIZE):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path, pool_size)
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+            confirmed = [
+                (row['doctor_id'], row['appointment_date'], from_db_time(row['appointment_time']), row['appointment_id'])
+                for row in conn.execute(SQL_CONFIRMED_SLOTS)
+            ]
+        with self.pool.transaction(immediate=True) as conn:
+            metrics.backfill(conn)
+            metrics.prune(conn)
+        # Confirmed slots are mirrored in memory; every status change goes through this store
+        self.slots = SlotIndex()
+        self.slots.load(confirmed)
+        self.availability = None
+        self.writer = WriteBatcher(self.pool)
+        atexit.register(self.close)
+
+    def close(self):
+        self.writer.close()
+
+    # --- doctors ---
+
+    def seed_doctors(self, doctors):
+        """Insert or refresh the doctor directory"""
+        rows = [
+            (doc['id'], doc['name'], doc['specialization'], doc['qualification'], doc['experience'],
+             doc['phone'], doc['email'], doc['address'], doc['fees'], doc['rating'],
+             ','.join(doc['availability']))
+            for doc in doctors
+        ]
+        with self.pool.transaction() as conn:
+            conn.executemany(SQL_UPSERT_DOCTOR, rows)
+
+    def configure_availability(self, doctors, slot_times, horizon_days=60):
+        """Derive bookable slots from the doctors' working weekdays and current bookings"""
+        self.availability = AvailabilityEngine(slot_times, horizon_days)
+        self.availability.attach(doctors, self.slots)
+
+    # --- users ---
+
+    def create_user(self, username, password, profile):
+        """Create a user; returns False if the username is already taken"""
+        with self.pool.transaction() as conn:
+            cursor = conn.execute(SQL_INSERT_USER, (
+                username, password, profile.get('first_name', ''), profile.get('last_name', ''),
+                profile.get('email', ''), profile.get('phone', ''), profile.get('address', '')
+            ))
+            created = cursor.rowcount == 1
+            if created:
+                metrics.record_user_registered(conn)
+        return created
+
+    def get_user(self, username):
+        """Return the user dict ({'id', 'password', 'profile', ...}) or None"""
+        with self.pool.connection() as conn:
+            row = conn.execute(SQL_GET_USER, (username,)).fetchone()
+        return _user_from_row(row) if row else None
+
+    def list_users(self):
+        with self.pool.connection() as conn:
+            return [_user_from_row(row) for row in conn.execute(SQL_LIST_USERS)]
+
+    def count_users(self, search=None):
+        with self.pool.connection() as conn:
+            if search:
+                return conn.execute(SQL_COUNT_SEARCH_USERS, (_like(search),) * 4).fetchone()[0]
+            return conn.execute(SQL_COUNT_USERS).fetchone()[0]
+
+    def users_page(self, limit, offset=0, search=None):
+        """One page of users in registration order, optionally filtered by name/email"""
+        with self.pool.connection() as conn:
+            if search:
+                rows = conn.execute(SQL_SEARCH_USERS, (_like(search),) * 4 + (limit, offset))
+            else:
+                rows = conn.execute(SQL_USERS_PAGE, (limit, offset))
+            return [_user_from_row(row) for row in rows]
+
+    # --- appointments ---
+
+    def is_slot_taken(self, doctor_id, date, display_time):
+        """O(1) check for a confirmed booking in the given slot"""
+        return self.slots.is_booked(doctor_id, date, display_time)
+
+    def available_times(self, doctor_id, date, candidate_times):
+        """Candidate times that are still free for a doctor on a day"""
+        return self.slots.available_times(doctor_id, date, candidate_times)
+
+    def book_appointment(self, user_id, appointment):
+        """Insert an appointment unless its slot is taken; returns True when booked.
+
+        The slot is reserved in the in-memory index first, then the insert
+        runs in an IMMEDIATE transaction that re-checks the slot index in
+        the database, so concurrent sessions cannot double-book.
+        """
+        doctor_id, date, time = appointment['doctor_id'], appointment['date'], appointment['time']
+        if not self.slots.reserve(doctor_id, date, time, appointment['appointment_id']):
+            return False
+
+        db_time = to_db_time(time)
+        try:
+            with self.pool.transaction(immediate=True) as conn:
+                taken = conn.execute(SQL_SLOT_TAKEN, (doctor_id, date, db_time)).fetchone()
+                if taken:
+                    # Booked outside this process: point the index at the real booking
+                    self.slots.release(doctor_id, date, time, appointment['appointment_id'])
+                    self.slots.reserve(doctor_id, date, time, taken['appointment_id'])
+                    return False
+                conn.execute(SQL_INSERT_APPOINTMENT, (
+                    appointment['appointment_id'], user_id, doctor_id,
+                    appointment['patient_name'], appointment['phone'], appointment['email'],
+                    appointment['address'], appointment['specialization'], date, db_time,
+                    appointment['reason'], appointment['symptoms'], appointment['previous_diagnosis'],
+                    appointment['status'], appointment['booked_on']
+                ))
+                metrics.record_appointment_booked(conn, appointment)
+        except Exception:
+            self.slots.release(doctor_id, date, time, appointment['appointment_id'])
+            raise
+        return True
+
+    def list_appointments(self):
+        with self.pool.connection() as conn:
+            return [_appointment_from_row(row) for row in conn.execute(SQL_LIST_APPOINTMENTS)]
+
+    def user_appointments(self, user_id, limit=None, before_id=None):
+        """Appointments booked by one user, newest first.
+
+        With ``limit`` this returns one page; pass the last row's ``id`` as
+        ``before_id`` to fetch the next (older) page. Pages are read straight
+        from the appointments(user_id) index, so cost is O(page size).
+        """
+        with self.pool.connection() as conn:
+            if limit is None:
+                rows = conn.execute(SQL_USER_APPOINTMENTS, (user_id,))
+            else:
+                cursor_id = before_id if before_id is not None else 2 ** 63 - 1
+                rows = conn.execute(SQL_USER_APPOINTMENTS_PAGE, (user_id, cursor_id, limit))
+            return [_appointment_from_row(row) for row in rows]
+
+    def search_appointments(self, status=None, specialization=None, search=None,
+                            sort='Booked', descending=True, limit=None, offset=0):
+        """Filtered, sorted appointments for the admin dashboard, one page at a time.
+
+        Filtering and sorting run in SQLite (status/specialization and date
+        are indexed), so only ``limit`` rows are materialized per page.
+        """
+        where, params = _appointment_filters(status, specialization, search)
+        direction = "DESC" if descending else "ASC"
+        order = APPOINTMENT_SORTS[sort].format(dir=direction)
+        if sort != 'Booked':
+            # Newest booking breaks ties so pages are stable
+            order += f" {direction}, a.id"
+        sql = f"{SQL_SELECT_APPOINTMENTS}{where} ORDER BY {order} {direction}"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = params + [limit, offset]
+        with self.pool.connection() as conn:
+            return [_appointment_from_row(row) for row in conn.execute(sql, params)]
+
+    def count_appointments(self, status=None, specialization=None, search=None):
+        where, params = _appointment_filters(status, specialization, search)
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_COUNT_APPOINTMENTS + where, params).fetchone()[0]
+
+    def count_user_appointments(self, user_id):
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_COUNT_USER_APPOINTMENTS, (user_id,)).fetchone()[0]
+
+    def get_appointment(self, appointment_id):
+        with self.pool.connection() as conn:
+            row = conn.execute(SQL_GET_APPOINTMENT, (appointment_id,)).fetchone()
+        return _appointment_from_row(row) if row else None
+
+    def update_appointment_status(self, appointment_id, status):
+        """Change an appointment's status, keeping the slot index in sync.
+
+        Returns False if the appointment does not exist, or if re-confirming
+        it would clash with another confirmed booking in the same slot.
+        """
+        if status not in APPOINTMENT_STATUSES:
+            raise ValueError(f"Unknown appointment status: {status}")
+
+        appointment = self.get_appointment(appointment_id)
+        if appointment is None:
+            return False
+
+        slot = (appointment['doctor_id'], appointment['date'], appointment['time'])
+        reserving = status == 'Confirmed' and appointment['status'] != 'Confirmed'
+        if reserving and not self.slots.reserve(*slot, appointment_id):
+            return False
+
+        try:
+            with self.pool.transaction(immediate=True) as conn:
+                if reserving:
+                    # Same re-check as book_appointment: the slot may have been booked by another process
+                    taken = conn.execute(SQL_SLOT_TAKEN, (slot[0], slot[1], to_db_time(slot[2]))).fetchone()
+                    if taken and taken['appointment_id'] != appointment_id:
+                        self.slots.release(*slot, appointment_id)
+                        self.slots.reserve(*slot, taken['appointment_id'])
+                        return False
+                # Read the status again under the write lock so the counters move exactly once
+                old_status = conn.execute(SQL_APPOINTMENT_STATUS, (appointment_id,)).fetchone()['status']
+                conn.execute(SQL_UPDATE_APPOINTMENT_STATUS, (status, appointment_id))
+                metrics.record_status_change(conn, old_status, status)
+        except Exception:
+            if reserving:
+                self.slots.release(*slot, appointment_id)
+            raise
+
+        if status != 'Confirmed':
+            self.slots.release(*slot, appointment_id)
+        return True
+
+    # --- metrics ---
+
+    def metrics_snapshot(self):
+        """Running counters and rolling event windows (see metrics.snapshot)"""
+        with self.pool.connection() as conn:
+            return metrics.snapshot(conn)
+
+    # --- predictions (batched writes) ---
+
+    def record_ml_prediction(self, user_id, input_data, prediction_result, risk_level, confidence_score=None):
+        """Queue an ML prediction for the ml_predictions table"""
+        values = [_to_float(input_data.get(field)) for field in ML_INPUT_FIELDS]
+        self.writer.add(SQL_INSERT_ML_PREDICTION, (
+            user_id, *values, str(prediction_result), risk_level, confidence_score
+        ))
+
+    def record_cnn_prediction(self, user_id, file_details, prediction_data):
+        """Queue a CNN prediction for the cnn_predictions table"""
+        self.writer.add(SQL_INSERT_CNN_PREDICTION, (
+            user_id, file_details.get('FileName'), file_details.get('FileType'), file_details.get('FileSize'),
+            float(prediction_data['cancer_confidence']), float(prediction_data['normal_confidence']),
+            prediction_data['final_prediction'], prediction_data['risk_level']
+        ))
@@ -0,0 +1,320 @@
+"""Seeded training of the CT-scan CNN with a tf.data input pipeline.
+
+Replaces the notebook (pynb files/cnn_model_lung.ipynb), which fed the
+model through ImageDataGenerator.flow_from_directory: one Python thread
+decoding every PNG again on every epoch. Here images are decoded and
+resized in parallel by tf.data, cached on disk as uint8 after the first
+epoch, shuffled from a bounded buffer and prefetched while the model
+trains:
+
+    python train_cnn.py
+    python train_cnn.py --publish
+    python train_cnn.py --epochs 20 --data-threads 4 --compute-threads 12
+    python train_cnn.py --baseline-epochs 2      # also time the generator pipeline
+
+The architecture and optimizer are the notebook's. Validation uses a
+stratified split of the training tree (cnn_inference.validation_split), so
+the test tree is only used for the final test accuracy. The split, the
+shuffle order and the weight initialization are seeded, and decoding keeps
+file order, so reruns see the same batches.
+
+The model is written as a candidate next to the live one
+('cnn model/lungcancer_model_cnn.candidate.h5') with a manifest recording its
+validation and test accuracy, the training settings and the epoch times of
+both pipelines. --publish replaces the model model_registry loads, unless
+the live model's test accuracy is higher or it has no manifest, like the
+shipped notebook model (--force overrides).
+"""
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+import cnn_backends
+import cnn_inference
+import model_registry
+
+logger = logging.getLogger("train_cnn")
+
+# ----------------------------------------------------
+# --- TRAINING CONFIGURATION ---
+# ----------------------------------------------------
+
+TRAIN_DIR = 'ctscan_images/train'
+TEST_DIR = 'ctscan_images/test'
+MODEL_PATH = cnn_backends.DEFAULT_MODEL_PATHS['keras']
+CANDIDATE_PATH = model_registry.candidate_path(MODEL_PATH)
+# Manifest metric a candidate must not lose on to replace the live model
+PUBLISH_METRIC = 'accuracy'
+CACHE_DIR = os.environ.get('CNN_CACHE_DIR', 'ctscan_images/.tfcache')
+
+EPOCHS = 15
+BATCH_SIZE = cnn_inference.DEFAULT_BATCH_SIZE
+LEARNING_RATE = 0.001
+# Decoded slices held for shuffling (150x150x3 uint8 = 67 KB each)
+SHUFFLE_BUFFER = 2048
+SEED = 42
+
+# The input pipeline and the model get separate thread pools so decoding
+# never competes with the convolution kernels for the same threads
+CPU_COUNT = os.cpu_count() or 2
+DATA_THREADS = int(os.environ.get('TRAIN_DATA_THREADS', max(1, CPU_COUNT // 4)))
+COMPUTE_THREADS = int(os.environ.get('TRAIN_COMPUTE_THREADS', max(1, CPU_COUNT - DATA_THREADS)))
+
+def configure_threads(data_threads=DATA_THREADS, compute_threads=COMPUTE_THREADS):
+    """Size TensorFlow's op thread pools; must run before any TensorFlow op"""
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(compute_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(max(1, min(2, compute_threads)))
+
+# ----------------------------------------------------
+# --- INPUT PIPELINE ---
+# ----------------------------------------------------
+
+def _cache_file(root, items, cache_dir, subset=None):
+    # Keyed by the files' names, sizes and mtimes: any change starts a new cache.
+    # Each subset of a tree keeps its own cache, so they never remove each other's as stale
+    signature = []
+    for path, _ in items:
+        stat = os.stat(path)
+        signature.append([os.path.relpath(path, root), stat.st_size, stat.st_mtime_ns])
+    digest = hashlib.sha256(json.dumps([signature, list(cnn_inference.IMG_SIZE)]).encode('utf-8')).hexdigest()[:12]
+    name = os.path.normpath(root).strip(os.sep).replace(os.sep, '__') + (f".{subset}" if subset else '')
+    current = os.path.join(cache_dir, f"{name}-{digest}")
+    for stale in glob.glob(os.path.join(cache_dir, f"{name}-*")):
+        if not stale.startswith(current):
+            os.remove(stale)
+    return current
+
+def _decode(path, label):
+    import tensorflow as tf
+    image = tf.io.decode_image(tf.io.read_file(path), channels=cnn_inference.IMG_CHANNELS, expand_animations=False)
+    # Antialiased bicubic approximates the PIL resize the app applies at serving time
+    image = tf.image.resize(image, (cnn_inference.IMG_SIZE[1], cnn_inference.IMG_SIZE[0]),
+                            method='bicubic', antialias=True)
+    return tf.cast(tf.clip_by_value(tf.round(image), 0.0, 255.0), tf.uint8), label
+
+def _normalize(images, labels):
+    import tensorflow as tf
+    return tf.cast(images, tf.float32) * (1.0 / 255.0), labels
+
+def image_dataset(root, batch_size=BATCH_SIZE, training=True, cache_dir=CACHE_DIR, data_threads=DATA_THREADS,
+                  subset=None):
+    """(tf.data.Dataset of (image batch, label batch), class names, image count) for an image tree.
+
+    Labels follow list_labelled_images (and flow_from_directory): the model
+    output is the probability of the last class, 'normal'. subset 'training'
+    or 'validation' keeps only that side of cnn_inference.validation_split.
+    """
+    import tensorflow as tf
+
+    items, classes = cnn_inference.list_labelled_images(root)
+    if not items:
+        raise ValueError(f"No images found under {root}")
+    if len(classes) != 2 or classes[1] != 'normal':
+        raise ValueError(f"Expected a cancer folder and a 'normal' folder under {root}, found {classes}")
+    if subset is not None:
+        training_idx, validation_idx = cnn_inference.validation_split([label for _, label in items])
+        items = [items[idx] for idx in (training_idx if subset == 'training' else validation_idx)]
+
+    dataset = tf.data.Dataset.from_tensor_slices(
+        ([path for path, _ in items], np.array([label for _, label in items], dtype=np.float32))
+    )
+    # Parallel decoding that still yields in file order, so the seeded shuffle sees the same sequence every run
+    dataset = dataset.map(_decode, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        # uint8 slices: 4x smaller on disk than the normalized floats
+        dataset = dataset.cache(_cache_file(root, items, cache_dir, subset))
+    if training:
+        dataset = dataset.shuffle(min(len(items), SHUFFLE_BUFFER), seed=SEED, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(_normalize, num_parallel_calls=tf.data.AUTOTUNE)
+    dataset = dataset.prefetch(tf.data.AUTOTUNE)
+
+    options = tf.data.Options()
+    options.threading.private_threadpool_size = data_threads
+    options.threading.max_intra_op_parallelism = 1
+    return dataset.with_options(options), classes, len(items)
+
+# ----------------------------------------------------
+# --- MODEL ---
+# ----------------------------------------------------
+
+def build_model(learning_rate=LEARNING_RATE):
+    """The notebook's CNN: three conv/pool blocks and a 512-unit dense layer, sigmoid P(normal) output"""
+    import tensorflow as tf
+    width, height = cnn_inference.IMG_SIZE
+    model = tf.keras.models.Sequential([
+        tf.keras.layers.Conv2D(16, (3, 3), activation='relu', input_shape=(height, width, cnn_inference.IMG_CHANNELS)),
+        tf.keras.layers.MaxPooling2D(2, 2),
+        tf.keras.layers.Conv2D(32, (3, 3), activation='relu'),
+        tf.keras.layers.MaxPooling2D(2, 2),
+        tf.keras.layers.Conv2D(64, (3, 3), activation='relu'),
+        tf.keras.layers.MaxPooling2D(2, 2),
+        tf.keras.layers.Flatten(),
+        tf.keras.layers.Dense(512, activation='relu'),
+        tf.keras.layers.Dense(1, activation='sigmoid'),
+    ])
+    model.compile(optimizer=tf.keras.optimizers.RMSprop(learning_rate=learning_rate),
+                  loss='binary_crossentropy', metrics=['accuracy'])
+    return model
+
+def _epoch_timer():
+    import tensorflow as tf
+
+    class EpochTimer(tf.keras.callbacks.Callback):
+        # Training time only: the clock stops where validation starts
+        def __init__(self):
+            super().__init__()
+            self.seconds = []
+            self._started = None
+
+        def on_epoch_begin(self, epoch, logs=None):
+            self._started = time.perf_counter()
+
+        def _stop(self):
+            if self._started is not None:
+                self.seconds.append(time.perf_counter() - self._started)
+                self._started = None
+
+        def on_test_begin(self, logs=None):
+            self._stop()
+
+        def on_epoch_end(self, epoch, logs=None):
+            self._stop()
+
+    return EpochTimer()
+
+def epoch_summary(seconds, images):
+    """First epoch (decoding and cache fill) reported apart from the warm ones"""
+    warm = seconds[1:] or seconds
+    return {
+        'epochs': len(seconds),
+        'first_epoch_seconds': round(seconds[0], 3),
+        'warm_epoch_seconds': round(float(np.median(warm)), 3),
+        'warm_images_per_second': round(images / float(np.median(warm)), 1),
+        'epoch_seconds': [round(s, 3) for s in seconds],
+    }
+
+def baseline_epochs(train_dir, epochs, batch_size=BATCH_SIZE):
+    """Epoch times of the notebook's ImageDataGenerator pipeline on a fresh model"""
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+    generator = ImageDataGenerator(rescale=1.0 / 255).flow_from_directory(
+        train_dir, batch_size=batch_size, class_mode='binary', target_size=cnn_inference.IMG_SIZE, seed=SEED
+    )
+    timer = _epoch_timer()
+    build_model().fit(generator, epochs=epochs, verbose=0, callbacks=[timer])
+    return epoch_summary(timer.seconds, generator.samples)
+
+# ----------------------------------------------------
+# --- TRAINING RUN ---
+# ----------------------------------------------------
+
+def train(train_dir=TRAIN_DIR, test_dir=TEST_DIR, output=CANDIDATE_PATH, epochs=EPOCHS, batch_size=BATCH_SIZE,
+          cache_dir=CACHE_DIR, data_threads=DATA_THREADS, compute_threads=COMPUTE_THREADS, baseline=0):
+    """Train and evaluate the CNN and write it to output; returns its manifest"""
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(SEED)
+    train_ds, classes, train_images = image_dataset(train_dir, batch_size, True, cache_dir, data_threads, 'training')
+    val_ds, _, val_images = image_dataset(train_dir, batch_size, False, cache_dir, data_threads, 'validation')
+    test_ds, _, test_images = image_dataset(test_dir, batch_size, False, cache_dir, data_threads)
+    logger.info("%d training, %d validation and %d test slices (classes: %s)", train_images, val_images,
+                test_images, ', '.join(classes))
+
+    model = build_model()
+    timer = _epoch_timer()
+    history = model.fit(train_ds, epochs=epochs, validation_data=val_ds, verbose=2, callbacks=[timer])
+    timing = epoch_summary(timer.seconds, train_images)
+    logger.info("tf.data: first epoch %.1fs, warm epochs %.1fs (%.0f images/s)", timing['first_epoch_seconds'],
+                timing['warm_epoch_seconds'], timing['warm_images_per_second'])
+
+    val_loss, val_accuracy = model.evaluate(val_ds, verbose=0)
+    # The test tree is seen once, here, after training is finished
+    test_loss, test_accuracy = model.evaluate(test_ds, verbose=0)
+    manifest = {
+        'model': 'cnn',
+        'created_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'estimator': 'cnn',
+        'params': {'epochs': epochs, 'batch_size': batch_size, 'learning_rate': LEARNING_RATE},
+        'metrics': {'accuracy': float(test_accuracy), 'loss': float(test_loss),
+                    'validation_accuracy': float(val_accuracy), 'validation_loss': float(val_loss)},
+        'classes': classes,
+        'output': f"P({classes[1]})",
+        'history': {name: [float(v) for v in values] for name, values in history.history.items()},
+        'training': {
+            'train_dir': train_dir,
+            'test_dir': test_dir,
+            'train_images': train_images,
+            'validation_images': val_images,
+            'validation_fraction': cnn_inference.VALIDATION_FRACTION,
+            'split_seed': cnn_inference.SPLIT_SEED,
+            'test_images': test_images,
+            'seed': SEED,
+            'data_threads': data_threads,
+            'compute_threads': compute_threads,
+            'cache_dir': cache_dir,
+            'tensorflow_version': tf.__version__,
+            'tf_data': timing,
+        },
+    }
+
+    if baseline:
+        manifest['training']['generator_baseline'] = summary = baseline_epochs(train_dir, baseline, batch_size)
+        # Per image: the baseline reads the whole tree, tf.data only the training split
+        speedup = timing['warm_images_per_second'] / summary['warm_images_per_second']
+        manifest['training']['warm_epoch_speedup'] = round(speedup, 2)
+        logger.info("ImageDataGenerator: first epoch %.1fs, warm epochs %.1fs (%.0f images/s); tf.data is %.2fx faster per image",
+                    summary['first_epoch_seconds'], summary['warm_epoch_seconds'],
+                    summary['warm_images_per_second'], speedup)
+
+    # Keras picks the save format from the extension, which publish_model keeps
+    return model_registry.publish_model(output, model.save, manifest)
+
+# ----------------------------------------------------
+# --- ENTRY POINT ---
+# ----------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and publish the CT-scan CNN")
+    parser.add_argument('--train-dir', default=TRAIN_DIR)
+    parser.add_argument('--test-dir', default=TEST_DIR)
+    parser.add_argument('--output', default=CANDIDATE_PATH, help="Keras model to write (manifest goes next to it)")
+    parser.add_argument('--publish', action='store_true', help=f"Replace the live model ({MODEL_PATH}) with the result")
+    parser.add_argument('--force', action='store_true',
+                        help=f"With --publish: replace it even if the live model's test {PUBLISH_METRIC} is higher")
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="Decoded-slice cache; '' keeps nothing on disk")
+    parser.add_argument('--data-threads', type=int, default=DATA_THREADS, help="tf.data decoding threads")
+    parser.add_argument('--compute-threads', type=int, default=COMPUTE_THREADS, help="Model op threads")
+    parser.add_argument('--baseline-epochs', type=int, default=0,
+                        help="Also time this many epochs of the ImageDataGenerator pipeline")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    configure_threads(args.data_threads, args.compute_threads)
+    manifest = train(args.train_dir, args.test_dir, args.output, args.epochs, args.batch_size, args.cache_dir,
+                     args.data_threads, args.compute_threads, args.baseline_epochs)
+    logger.info("Wrote %s version %s: validation accuracy %.4f, test accuracy %.4f", args.output,
+                manifest['version'], manifest['metrics']['validation_accuracy'], manifest['metrics']['accuracy'])
+
+    if args.publish and os.path.abspath(args.output) != os.path.abspath(MODEL_PATH):
+        try:
+            model_registry.promote_model(args.output, MODEL_PATH, PUBLISH_METRIC, args.force)
+        except model_registry.PromotionRefused as e:
+            logger.error("Not publishing: %s (use --force to publish anyway)", e)
+            sys.exit(1)
+        logger.info("Published %s as %s", args.output, MODEL_PATH)
+
+if __name__ == '__main__':
+    main()
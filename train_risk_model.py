@@ -0,0 +1,500 @@
+"""Reproducible training of the tabular risk model.
+
+Replaces the hand-run notebook (pynb files/All_Algorithms.ipynb) with one
+command that reads datasets/data.csv, prunes correlated features, runs a
+cross-validated search over every candidate estimator in parallel and
+writes the winner as a candidate next to the live model
+(models/final_model.candidate.sav). --publish then replaces the model
+model_registry serves, unless its holdout macro F1 is lower than the live
+model's or the live model has no manifest (--force overrides). The two
+scores are only comparable when both models were trained from the same
+--data:
+
+    python train_risk_model.py
+    python train_risk_model.py --publish
+    python train_risk_model.py --data history.csv --jobs 16 --folds 5
+    python train_risk_model.py --output models/experiment.sav --candidates logistic_regression hist_gradient_boosting
+    python train_risk_model.py --out-of-core --data history.csv --memory-mb 256
+
+The model takes the app's 17 input columns (risk_scoring.FEATURE_COLUMNS)
+in their usual order and selects the kept ones itself, so it is a drop-in
+replacement for models/final_model.sav. A manifest with the CV results and
+holdout metrics is written next to it (model_registry.publish_model) and
+shown in the admin Models tab.
+
+--out-of-core is for histories larger than RAM: the file is streamed in
+chunks sized from --memory-mb and only incremental learners are trained,
+so peak memory does not grow with the number of rows.
+"""
+import argparse
+import datetime
+import logging
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import model_registry
+import risk_scoring
+from process_stats import peak_rss_mb
+
+logger = logging.getLogger("train_risk_model")
+
+# ----------------------------------------------------
+# --- TRAINING CONFIGURATION ---
+# ----------------------------------------------------
+
+DATA_PATH = 'datasets/data.csv'
+TARGET_COLUMN = 'Level'
+MODEL_PATH = model_registry.MODEL_CONFIG['risk'][0]
+CANDIDATE_PATH = model_registry.candidate_path(MODEL_PATH)
+# Holdout metric a candidate must not lose on to replace the live model
+PUBLISH_METRIC = 'f1_macro'
+
+# Features with |correlation| above this against an earlier feature are dropped
+CORRELATION_THRESHOLD = 0.8
+CV_FOLDS = 5
+HOLDOUT_FRACTION = 0.2
+SEED = 2  # The notebook's train_test_split random_state
+TRAIN_JOBS = int(os.environ.get('TRAIN_JOBS', os.cpu_count() or 2))
+
+# name -> (estimator factory, parameter grid, needs scaling)
+def _candidates():
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.svm import LinearSVC
+    from sklearn.tree import DecisionTreeClassifier
+    return {
+        'logistic_regression': (lambda: LogisticRegression(max_iter=1000),
+                                {'C': [0.1, 1.0, 10.0]}, True),
+        'linear_svc': (lambda: LinearSVC(dual=False),
+                       {'C': [0.1, 1.0, 10.0]}, True),
+        'decision_tree': (lambda: DecisionTreeClassifier(random_state=SEED),
+                          {'max_depth': [4, 8, None]}, False),
+        'hist_gradient_boosting': (lambda: HistGradientBoostingClassifier(random_state=SEED),
+                                   {'learning_rate': [0.05, 0.1], 'max_leaf_nodes': [15, 31]}, False),
+    }
+
+CANDIDATES = ('logistic_regression', 'linear_svc', 'decision_tree', 'hist_gradient_boosting')
+
+# ----------------------------------------------------
+# --- DATA AND FEATURE PRUNING ---
+# ----------------------------------------------------
+
+def load_data(path=DATA_PATH):
+    """(float64 features in FEATURE_COLUMNS order, target labels) from a training CSV"""
+    frame = pd.read_csv(path, usecols=risk_scoring.FEATURE_COLUMNS + [TARGET_COLUMN])
+    frame = frame.dropna()
+    return frame[risk_scoring.FEATURE_COLUMNS].to_numpy(dtype=np.float64), frame[TARGET_COLUMN].to_numpy()
+
+def keep_uncorrelated(corr, threshold=CORRELATION_THRESHOLD):
+    """Indices of the columns to keep, given their correlation matrix.
+
+    Same rule as the notebook's correlation() loop: a column is dropped when
+    its absolute correlation with any earlier column exceeds threshold. One
+    vectorized comparison instead of a Python double loop over the matrix.
+    """
+    # Constant columns have no defined correlation; keep them out of the comparison
+    corr = np.nan_to_num(np.abs(corr), nan=0.0)
+    dropped = (np.tril(corr, k=-1) > threshold).any(axis=1)
+    return np.flatnonzero(~dropped)
+
+def prune_correlated(X, threshold=CORRELATION_THRESHOLD):
+    """Indices of the columns of X to keep"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = np.corrcoef(X, rowvar=False)
+    return keep_uncorrelated(corr, threshold)
+
+def dropped_features(kept):
+    kept = set(kept.tolist())
+    return [name for i, name in enumerate(risk_scoring.FEATURE_COLUMNS) if i not in kept]
+
+def build_pipeline(estimator, kept, scale):
+    """Pipeline over the full 17-column input that keeps only the selected columns"""
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+    select = ColumnTransformer([('kept', StandardScaler() if scale else 'passthrough', list(kept))])
+    return Pipeline([('select', select), ('model', estimator)])
+
+# ----------------------------------------------------
+# --- PARALLEL MODEL SELECTION ---
+# ----------------------------------------------------
+
+def _param_grid(grid):
+    from sklearn.model_selection import ParameterGrid
+    return list(ParameterGrid(grid))
+
+def _fit_fold(name, params, kept, X, y, train_idx, test_idx):
+    # Runs in a joblib worker; X arrives memory-mapped for large inputs
+    from sklearn.metrics import accuracy_score, f1_score
+    factory, _, scale = _candidates()[name]
+    pipeline = build_pipeline(factory().set_params(**params), kept, scale)
+    started = time.perf_counter()
+    pipeline.fit(X[train_idx], y[train_idx])
+    fit_seconds = time.perf_counter() - started
+    predicted = pipeline.predict(X[test_idx])
+    return {
+        'accuracy': accuracy_score(y[test_idx], predicted),
+        'f1_macro': f1_score(y[test_idx], predicted, average='macro'),
+        'fit_seconds': fit_seconds,
+    }
+
+def search(X, y, kept, candidates=CANDIDATES, folds=CV_FOLDS, jobs=TRAIN_JOBS):
+    """Cross-validate every (candidate, parameters) pair; returns results sorted best first.
+
+    All fits of all candidates go into one flat joblib batch, so the work
+    spreads over every core instead of one estimator at a time. joblib
+    memory-maps X and y for its workers instead of copying them per task.
+    """
+    from joblib import Parallel, delayed
+    from sklearn.model_selection import StratifiedKFold
+
+    all_candidates = _candidates()
+    settings = [(name, params) for name in candidates for params in _param_grid(all_candidates[name][1])]
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=SEED).split(X, y))
+    scores = Parallel(n_jobs=jobs)(
+        delayed(_fit_fold)(name, params, kept, X, y, train_idx, test_idx)
+        for name, params in settings
+        for train_idx, test_idx in splits
+    )
+
+    results = []
+    for idx, (name, params) in enumerate(settings):
+        fold_scores = scores[idx * folds:(idx + 1) * folds]
+        accuracy = np.array([s['accuracy'] for s in fold_scores])
+        f1 = np.array([s['f1_macro'] for s in fold_scores])
+        results.append({
+            'estimator': name,
+            'params': params,
+            'accuracy_mean': float(accuracy.mean()),
+            'accuracy_std': float(accuracy.std()),
+            'f1_macro_mean': float(f1.mean()),
+            'f1_macro_std': float(f1.std()),
+            'fit_seconds_mean': float(np.mean([s['fit_seconds'] for s in fold_scores])),
+        })
+    # Ties go to the candidate listed first (the simpler model)
+    results.sort(key=lambda r: (-r['f1_macro_mean'], -r['accuracy_mean']))
+    return results
+
+def metrics_from_confusion(matrix, labels):
+    """Accuracy and macro F1 from a confusion matrix (rows: true, columns: predicted)"""
+    matrix = np.asarray(matrix, dtype=np.int64)
+    true_positives = np.diag(matrix).astype(np.float64)
+    denominator = matrix.sum(axis=0) + matrix.sum(axis=1)
+    f1 = np.divide(2 * true_positives, denominator, out=np.zeros_like(true_positives), where=denominator > 0)
+    total = matrix.sum()
+    return {
+        'accuracy': float(true_positives.sum() / total) if total else 0.0,
+        'f1_macro': float(f1.mean()),
+        'labels': [str(label) for label in labels],
+        'confusion_matrix': matrix.tolist(),
+    }
+
+def holdout_metrics(pipeline, X, y):
+    from sklearn.metrics import confusion_matrix
+    labels = sorted(set(y))
+    return metrics_from_confusion(confusion_matrix(y, pipeline.predict(X), labels=labels), labels)
+
+# ----------------------------------------------------
+# --- TRAINING RUN ---
+# ----------------------------------------------------
+
+def train(data_path=DATA_PATH, output=CANDIDATE_PATH, candidates=CANDIDATES, folds=CV_FOLDS,
+          threshold=CORRELATION_THRESHOLD, jobs=TRAIN_JOBS):
+    """Select, refit and write the risk model to output; returns its manifest"""
+    import sklearn
+    from sklearn.model_selection import train_test_split
+
+    started = time.perf_counter()
+    X, y = load_data(data_path)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=HOLDOUT_FRACTION, stratify=y, random_state=SEED
+    )
+    kept = prune_correlated(X_train, threshold)
+    dropped = dropped_features(kept)
+    logger.info("%d rows; keeping %d of %d features (dropped: %s)", len(X), len(kept), X.shape[1],
+                ", ".join(dropped) or "none")
+
+    search_started = time.perf_counter()
+    results = search(X_train, y_train, kept, candidates, folds, jobs)
+    search_seconds = time.perf_counter() - search_started
+    for result in results:
+        logger.info("%-24s %-45s f1 %.4f ± %.4f  acc %.4f", result['estimator'], result['params'],
+                    result['f1_macro_mean'], result['f1_macro_std'], result['accuracy_mean'])
+
+    best = results[0]
+    factory, _, scale = _candidates()[best['estimator']]
+    pipeline = build_pipeline(factory().set_params(**best['params']), kept, scale)
+    pipeline.fit(X_train, y_train)
+    holdout = holdout_metrics(pipeline, X_test, y_test)
+
+    manifest = {
+        'model': 'risk',
+        'created_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'estimator': best['estimator'],
+        'params': best['params'],
+        'metrics': holdout,
+        'features': list(risk_scoring.FEATURE_COLUMNS),
+        'kept_features': [risk_scoring.FEATURE_COLUMNS[i] for i in kept],
+        'dropped_features': dropped,
+        'training': {
+            'data': data_path,
+            'rows': int(len(X)),
+            'holdout_fraction': HOLDOUT_FRACTION,
+            'correlation_threshold': threshold,
+            'cv_folds': folds,
+            'jobs': jobs,
+            'seed': SEED,
+            'search_seconds': round(search_seconds, 3),
+            'total_seconds': round(time.perf_counter() - started, 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'sklearn_version': sklearn.__version__,
+        },
+        'cv_results': results,
+    }
+    return _publish(output, pipeline, manifest)
+
+def _publish(output, pipeline, manifest):
+    def write(path):
+        with open(path, 'wb') as f:
+            pickle.dump(pipeline, f)
+
+    return model_registry.publish_model(output, write, manifest)
+
+# ----------------------------------------------------
+# --- OUT-OF-CORE TRAINING ---
+# ----------------------------------------------------
+
+TRAIN_MEMORY_MB = int(os.environ.get('TRAIN_MEMORY_MB', 256))
+# Copies of a chunk alive at once: parser buffers, the frame, float arrays, scaled features
+CHUNK_COPIES = 8
+STREAMING_EPOCHS = 3
+
+# name -> (estimator class, parameters, single pass); single-pass learners
+# accumulate sufficient statistics, so extra epochs would only count rows twice
+def _streaming_candidates():
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.naive_bayes import GaussianNB
+    return {
+        'sgd_logistic': (SGDClassifier, {'loss': 'log_loss', 'alpha': 1e-4, 'random_state': SEED}, False),
+        'gaussian_nb': (GaussianNB, {}, True),
+    }
+
+STREAMING_CANDIDATES = ('sgd_logistic', 'gaussian_nb')
+
+def chunk_rows_for(memory_mb):
+    """Rows per chunk so that a chunk and its working copies fit in memory_mb"""
+    row_bytes = (len(risk_scoring.FEATURE_COLUMNS) + 1) * 8 * CHUNK_COPIES
+    return max(1000, memory_mb * 1024 * 1024 // row_bytes)
+
+def iter_training_chunks(path, chunk_rows):
+    """Yield (float64 features, str labels) of at most chunk_rows rows from a CSV or Parquet file"""
+    columns = risk_scoring.FEATURE_COLUMNS + [TARGET_COLUMN]
+    if risk_scoring.file_format(path) == 'parquet':
+        import pyarrow.parquet as pq
+        frames = (batch.to_pandas() for batch in
+                  pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns))
+    else:
+        frames = pd.read_csv(path, usecols=columns, chunksize=chunk_rows)
+    for frame in frames:
+        frame = frame.dropna()
+        yield frame[risk_scoring.FEATURE_COLUMNS].to_numpy(dtype=np.float64), frame[TARGET_COLUMN].to_numpy(dtype=str)
+
+def _split_chunks(path, chunk_rows):
+    # The generator is reseeded on every pass, so the same rows are held out each time
+    rng = np.random.default_rng(SEED)
+    for X, y in iter_training_chunks(path, chunk_rows):
+        yield X, y, rng.random(len(y)) < HOLDOUT_FRACTION
+
+class RunningCorrelation:
+    """Correlation matrix accumulated from sums and cross-products, one chunk at a time"""
+
+    def __init__(self, n_features):
+        self.n = 0
+        self.shift = None
+        self.sums = np.zeros(n_features)
+        self.cross = np.zeros((n_features, n_features))
+
+    def update(self, X):
+        if self.shift is None:
+            # Centering on the first chunk keeps the sums of squares well conditioned
+            self.shift = X.mean(axis=0)
+        centered = X - self.shift
+        self.n += len(X)
+        self.sums += centered.sum(axis=0)
+        self.cross += centered.T @ centered
+
+    def corrcoef(self):
+        mean = self.sums / self.n
+        cov = self.cross / self.n - np.outer(mean, mean)
+        std = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return cov / np.outer(std, std)
+
+def train_streaming(data_path=DATA_PATH, output=CANDIDATE_PATH, candidates=STREAMING_CANDIDATES,
+                    epochs=STREAMING_EPOCHS, threshold=CORRELATION_THRESHOLD, memory_mb=TRAIN_MEMORY_MB):
+    """Out-of-core variant of train(): memory is bounded by memory_mb, not by the file size.
+
+    The file is read 2 + epochs times: once for feature statistics, once per
+    epoch of partial_fit over shuffled training rows, and once to score the
+    held-out rows. Returns the published manifest.
+    """
+    import sklearn
+    from sklearn.metrics import confusion_matrix
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import FunctionTransformer, StandardScaler
+
+    started = time.perf_counter()
+    chunk_rows = chunk_rows_for(memory_mb)
+    n_features = len(risk_scoring.FEATURE_COLUMNS)
+
+    # Pass 1: correlation, scaling statistics and classes of the training rows
+    stats = RunningCorrelation(n_features)
+    scaler = StandardScaler()
+    classes = set()
+    rows = 0
+    for X, y, holdout in _split_chunks(data_path, chunk_rows):
+        rows += len(y)
+        if (~holdout).any():
+            stats.update(X[~holdout])
+            scaler.partial_fit(X[~holdout])
+        classes.update(y.tolist())
+    if stats.n == 0:
+        raise ValueError(f"No training rows in {data_path}")
+    classes = np.array(sorted(classes))
+    kept = keep_uncorrelated(stats.corrcoef(), threshold)
+    dropped = dropped_features(kept)
+    logger.info("%d rows in chunks of %d; keeping %d of %d features (dropped: %s)", rows, chunk_rows,
+                len(kept), n_features, ", ".join(dropped) or "none")
+
+    def features(X):
+        return np.take(scaler.transform(X), kept, axis=1)
+
+    # Passes 2..epochs+1: incremental fits
+    all_candidates = _streaming_candidates()
+    learners = {name: all_candidates[name][0](**all_candidates[name][1]) for name in candidates}
+    fit_seconds = dict.fromkeys(learners, 0.0)
+    rng = np.random.default_rng(SEED)
+    for epoch in range(epochs):
+        epoch_started = time.perf_counter()
+        for X, y, holdout in _split_chunks(data_path, chunk_rows):
+            order = rng.permutation(np.flatnonzero(~holdout))
+            if not len(order):
+                continue
+            X_chunk, y_chunk = features(X[order]), y[order]
+            for name, learner in learners.items():
+                if epoch and all_candidates[name][2]:
+                    continue
+                fit_started = time.perf_counter()
+                learner.partial_fit(X_chunk, y_chunk, classes=classes)
+                fit_seconds[name] += time.perf_counter() - fit_started
+        logger.info("Epoch %d/%d in %.1fs", epoch + 1, epochs, time.perf_counter() - epoch_started)
+
+    # Last pass: score the held-out rows
+    matrices = {name: np.zeros((len(classes), len(classes)), dtype=np.int64) for name in learners}
+    for X, y, holdout in _split_chunks(data_path, chunk_rows):
+        if not holdout.any():
+            continue
+        X_chunk = features(X[holdout])
+        for name, learner in learners.items():
+            matrices[name] += confusion_matrix(y[holdout], learner.predict(X_chunk), labels=classes)
+
+    results = []
+    for name in learners:
+        metrics = metrics_from_confusion(matrices[name], classes)
+        results.append({'estimator': name, 'params': all_candidates[name][1], 'accuracy': metrics['accuracy'],
+                        'f1_macro': metrics['f1_macro'], 'fit_seconds': round(fit_seconds[name], 3)})
+        logger.info("%-24s holdout f1 %.4f  acc %.4f  (%.1fs fitting)", name, metrics['f1_macro'],
+                    metrics['accuracy'], fit_seconds[name])
+    results.sort(key=lambda r: (-r['f1_macro'], -r['accuracy']))
+    best = results[0]['estimator']
+
+    # Same 17-column input as every other risk model
+    select = FunctionTransformer(np.take, kw_args={'indices': kept.tolist(), 'axis': 1})
+    select.fit(np.zeros((1, n_features)))
+    pipeline = Pipeline([('scale', scaler), ('select', select), ('model', learners[best])])
+
+    total_seconds = time.perf_counter() - started
+    manifest = {
+        'model': 'risk',
+        'created_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'estimator': best,
+        'params': all_candidates[best][1],
+        'metrics': metrics_from_confusion(matrices[best], classes),
+        'features': list(risk_scoring.FEATURE_COLUMNS),
+        'kept_features': [risk_scoring.FEATURE_COLUMNS[i] for i in kept],
+        'dropped_features': dropped,
+        'training': {
+            'mode': 'out_of_core',
+            'data': data_path,
+            'rows': rows,
+            'holdout_fraction': HOLDOUT_FRACTION,
+            'correlation_threshold': threshold,
+            'memory_mb': memory_mb,
+            'chunk_rows': chunk_rows,
+            'epochs': epochs,
+            'seed': SEED,
+            'total_seconds': round(total_seconds, 3),
+            'rows_per_second': round(rows / total_seconds, 1) if total_seconds else 0.0,
+            'peak_rss_mb': peak_rss_mb(),
+            'sklearn_version': sklearn.__version__,
+        },
+        'holdout_results': results,
+    }
+    return _publish(output, pipeline, manifest)
+
+# ----------------------------------------------------
+# --- ENTRY POINT ---
+# ----------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and publish the tabular lung cancer risk model")
+    parser.add_argument('--data', default=DATA_PATH, help="Training CSV with the feature columns and 'Level'")
+    parser.add_argument('--output', default=CANDIDATE_PATH, help="Model file to write (manifest goes next to it)")
+    parser.add_argument('--publish', action='store_true', help=f"Replace the live model ({MODEL_PATH}) with the result")
+    parser.add_argument('--force', action='store_true',
+                        help=f"With --publish: replace it even if the live model's holdout {PUBLISH_METRIC} is higher")
+    parser.add_argument('--candidates', nargs='+', choices=CANDIDATES + STREAMING_CANDIDATES,
+                        help="Default: every candidate of the chosen mode")
+    parser.add_argument('--folds', type=int, default=CV_FOLDS)
+    parser.add_argument('--threshold', type=float, default=CORRELATION_THRESHOLD,
+                        help="Drop features correlated above this with an earlier feature")
+    parser.add_argument('--jobs', type=int, default=TRAIN_JOBS, help="Parallel fits (-1 for all cores)")
+    parser.add_argument('--out-of-core', action='store_true',
+                        help="Stream the data in chunks and train incremental learners only")
+    parser.add_argument('--memory-mb', type=int, default=TRAIN_MEMORY_MB,
+                        help="Out-of-core: memory budget for the chunk being processed")
+    parser.add_argument('--epochs', type=int, default=STREAMING_EPOCHS, help="Out-of-core: passes over the data")
+    args = parser.parse_args()
+
+    mode_candidates = STREAMING_CANDIDATES if args.out_of_core else CANDIDATES
+    candidates = args.candidates or list(mode_candidates)
+    unsupported = [name for name in candidates if name not in mode_candidates]
+    if unsupported:
+        parser.error(f"{', '.join(unsupported)} not available in this mode (choose from {', '.join(mode_candidates)})")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.out_of_core:
+        manifest = train_streaming(args.data, args.output, candidates, args.epochs, args.threshold, args.memory_mb)
+    else:
+        manifest = train(args.data, args.output, candidates, args.folds, args.threshold, args.jobs)
+    logger.info("Wrote %s version %s: %s, holdout accuracy %.4f, f1 %.4f (%.1fs, peak RSS %s MB)",
+                args.output, manifest['version'], manifest['estimator'], manifest['metrics']['accuracy'],
+                manifest['metrics']['f1_macro'], manifest['training']['total_seconds'],
+                manifest['training']['peak_rss_mb'])
+
+    if args.publish and os.path.abspath(args.output) != os.path.abspath(MODEL_PATH):
+        try:
+            model_registry.promote_model(args.output, MODEL_PATH, PUBLISH_METRIC, args.force)
+        except model_registry.PromotionRefused as e:
+            logger.error("Not publishing: %s (use --force to publish anyway)", e)
+            sys.exit(1)
+        logger.info("Published %s as %s", args.output, MODEL_PATH)
+
+if __name__ == '__main__':
+    main()